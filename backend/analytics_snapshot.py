@@ -0,0 +1,372 @@
+"""
+AMARA ERP/MIS - Columnar Analytics Snapshot
+Copies the reporting tables into a local DuckDB file so fixed reports
+(REPORTS, served by /api/analytics/query) aggregate in a columnar engine
+instead of on the transactional database.
+
+Refreshes are incremental: rows whose updated_at (created_at for qc_logs)
+is past the table's watermark, less SNAPSHOT_OVERLAP_SECONDS for transactions
+that committed late, are upserted; rows deleted in Postgres (hard deletes,
+archival, detached partitions) are dropped by reconciling primary keys.
+Lookup tables and users are small and copied whole. Each refresh updates a
+copy of the file and renames it into place, so queries in any worker keep
+reading a consistent snapshot and never wait on the builder. The file is
+local to the host, so builders are serialized with a lock file next to it,
+held from reading the state until the rename; a refresh that finds it held
+is skipped.
+
+Runs from POST /api/analytics/snapshot, from the lifespan every
+SNAPSHOT_INTERVAL seconds (off by default), or standalone:
+
+    python analytics_snapshot.py [--full]
+"""
+import argparse
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple, Tuple
+
+from sqlalchemy import text
+
+import database
+from common import serialize_row
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+SNAPSHOT_PATH = Path(os.environ.get("SNAPSHOT_PATH", ROOT_DIR / "snapshot" / "amara.duckdb"))
+SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", "0"))  # seconds; 0 = only on demand
+SNAPSHOT_OVERLAP_SECONDS = int(os.environ.get("SNAPSHOT_OVERLAP_SECONDS", "300"))
+SNAPSHOT_FETCH_ROWS = int(os.environ.get("SNAPSHOT_FETCH_ROWS", "10000"))
+
+_LOOKUP_COLUMNS = "id UUID, code VARCHAR, name VARCHAR"
+
+# Table -> (DuckDB columns, incremental key; None = copied whole every refresh)
+SNAPSHOT_TABLES = {
+    "products": ("""id UUID, sku VARCHAR, name VARCHAR, face_value_id UUID, category_id UUID, material_id UUID,
+                    motif_id UUID, finding_id UUID, locking_id UUID, size_id UUID, is_active BOOLEAN,
+                    created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ""", "updated_at"),
+    "inventory": ("""id UUID, product_id UUID, stock_qty INTEGER, reserved_qty INTEGER, unit_cost DECIMAL(12,2),
+                     selling_price DECIMAL(12,2), mrp DECIMAL(12,2), weight_grams DECIMAL(10,3), location VARCHAR,
+                     last_restocked_at TIMESTAMPTZ, created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ""", "updated_at"),
+    "job_cards": ("""id UUID, product_id UUID, job_card_number VARCHAR, target_qty INTEGER, completed_qty INTEGER,
+                     assigned_artisan_id UUID, status VARCHAR, priority VARCHAR, start_date DATE, due_date DATE,
+                     created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ""", "updated_at"),
+    "qc_logs": ("""id UUID, job_card_id UUID, inspected_by UUID, qty_passed INTEGER, qty_failed INTEGER,
+                   defect_category VARCHAR, inspection_date TIMESTAMPTZ, created_at TIMESTAMPTZ""", "created_at"),
+    "production": ("""id UUID, job_card_id UUID, material_assigned VARCHAR, material_weight_grams DECIMAL(10,3),
+                      material_cost DECIMAL(12,2), wastage_grams DECIMAL(10,3), production_date DATE,
+                      completion_date DATE, status VARCHAR, created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ""", "updated_at"),
+    "users": ("id UUID, name VARCHAR, role VARCHAR, is_active BOOLEAN", None),
+    "sku_category": (_LOOKUP_COLUMNS, None),
+    "sku_material": (_LOOKUP_COLUMNS, None),
+    "sku_motif": (_LOOKUP_COLUMNS, None),
+}
+
+STATE_DDL = """
+CREATE TABLE IF NOT EXISTS _snapshot_state (
+    table_name VARCHAR PRIMARY KEY, watermark TIMESTAMPTZ, row_count BIGINT, synced_at TIMESTAMPTZ
+)
+"""
+
+
+def _columns(table):
+    # Split on commas outside parentheses: DECIMAL(12,2) is one column
+    return [c.split()[0] for c in re.split(r",(?![^()]*\))", SNAPSHOT_TABLES[table][0])]
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise RuntimeError("duckdb is required for the analytics snapshot")
+    return duckdb
+
+
+def _arrow(columns, rows):
+    import pyarrow as pa
+    return pa.table({c: [str(v) if isinstance(v, uuid.UUID) else v for v in (r[i] for r in rows)]
+                     for i, c in enumerate(columns)})
+
+
+# ------------------------------------------------------------
+# Builder
+# ------------------------------------------------------------
+def _read_state(path):
+    if not path.exists():
+        return {}
+    con = _duckdb().connect(str(path), read_only=True)
+    try:
+        # Read as epoch microseconds: TIMESTAMPTZ values would need pytz on the Python side
+        rows = con.execute("SELECT table_name, epoch_us(watermark) FROM _snapshot_state").fetchall()
+        return {name: datetime.fromtimestamp(us / 1e6, timezone.utc) if us is not None else None for name, us in rows}
+    finally:
+        con.close()
+
+
+def _try_lock(path):
+    """Exclusive builder lock (a file next to the snapshot); None when another builder holds it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = open(path.with_name(path.name + ".lock"), "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    # Holding the lock, any leftover copy is from a builder that died mid-write
+    for stale in path.parent.glob(path.name + ".*.building"):
+        stale.unlink(missing_ok=True)
+    return handle
+
+
+def _apply(path, changes, full):
+    """Write `changes` into a copy of the snapshot and rename it into place."""
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.building")
+    if path.exists() and not full:
+        shutil.copyfile(path, tmp)
+    try:
+        con = _duckdb().connect(str(tmp))
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    try:
+        con.execute(STATE_DDL)
+        for table, change in changes.items():
+            ddl, _ = SNAPSHOT_TABLES[table]
+            if change["replace"]:
+                con.execute(f"CREATE OR REPLACE TABLE {table} ({ddl})")
+            else:
+                con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({ddl})")
+            for batch in change["batches"]:
+                con.register("batch", batch)
+                if not change["replace"]:
+                    con.execute(f"DELETE FROM {table} WHERE id IN (SELECT CAST(id AS UUID) FROM batch)")
+                con.execute(f"INSERT INTO {table} SELECT * FROM batch")
+                con.unregister("batch")
+            if change["live_ids"] is not None:
+                con.register("live_ids", change["live_ids"])
+                con.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT CAST(id AS UUID) FROM live_ids)")
+                con.unregister("live_ids")
+            count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            con.execute("INSERT OR REPLACE INTO _snapshot_state VALUES (?, ?, ?, NOW())",
+                        [table, change["watermark"], count])
+        con.execute("CHECKPOINT")
+    except Exception:
+        con.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    con.close()
+    os.replace(tmp, path)
+
+
+async def build_snapshot(db, full=False, path=SNAPSHOT_PATH):
+    """Refresh the snapshot from Postgres; returns per-table copied row counts."""
+    started = time.perf_counter()
+    lock = _try_lock(path)
+    if lock is None:
+        return {"skipped": True, "tables": {}}
+    try:
+        return await _build(db, full, path, started)
+    finally:
+        lock.close()
+
+
+async def _build(db, full, path, started):
+    state = {} if full else await asyncio.to_thread(_read_state, path)
+
+    changes = {}
+    for table, (_, key) in SNAPSHOT_TABLES.items():
+        columns = _columns(table)
+        watermark = state.get(table)
+        incremental = key is not None and watermark is not None
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        params = {}
+        if incremental:
+            sql += f" WHERE {key} > :since"
+            params["since"] = watermark - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)
+        batches, copied = [], 0
+        result = await db.stream(text(sql), params)
+        key_index = columns.index(key) if key else None
+        async for chunk in result.partitions(SNAPSHOT_FETCH_ROWS):
+            batches.append(_arrow(columns, chunk))
+            copied += len(chunk)
+            if key_index is not None:
+                newest = max((row[key_index] for row in chunk if row[key_index] is not None), default=None)
+                if newest is not None and (watermark is None or newest > watermark):
+                    watermark = newest
+        live_ids = None
+        if incremental:
+            r = await db.execute(text(f"SELECT id FROM {table}"))
+            live_ids = _arrow(["id"], r.fetchall())
+        changes[table] = {"batches": batches, "replace": not incremental, "live_ids": live_ids,
+                          "watermark": watermark, "copied": copied}
+    await db.rollback()  # done reading; release the connection before the local write
+
+    await asyncio.to_thread(_apply, path, changes, full)
+    snapshot.reset()
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Analytics snapshot %s refresh in %sms", "full" if full else "incremental", duration_ms)
+    return {"skipped": False, "full": full, "duration_ms": duration_ms,
+            "tables": {t: {"copied": c["copied"], "mode": "full" if c["replace"] else "incremental"} for t, c in changes.items()}}
+
+
+# ------------------------------------------------------------
+# Reader
+# ------------------------------------------------------------
+class Snapshot:
+    """Read-only DuckDB connection, reopened when the builder replaces the file."""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._con = None
+        self._file_id = None
+
+    def reset(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+            self._con, self._file_id = None, None
+
+    def _connection(self):
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            raise RuntimeError("Analytics snapshot has not been built yet; POST /api/analytics/snapshot")
+        file_id = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if self._file_id != file_id:
+                if self._con is not None:
+                    self._con.close()
+                self._con = _duckdb().connect(str(self.path), read_only=True)
+                self._file_id = file_id
+            return self._con.cursor()
+
+    def query(self, sql, params=None):
+        cur = self._connection()
+        try:
+            cur.execute(sql, params or {})
+            columns = [d[0] for d in cur.description]
+            return columns, cur.fetchall()
+        finally:
+            cur.close()
+
+    def status(self):
+        if not self.path.exists():
+            return {"built": False, "path": str(self.path)}
+        _, rows = self.query("SELECT table_name, CAST(watermark AS VARCHAR), row_count, CAST(synced_at AS VARCHAR) "
+                             "FROM _snapshot_state ORDER BY table_name")
+        return {"built": True, "path": str(self.path), "bytes": self.path.stat().st_size,
+                "tables": [serialize_row(r, ["table", "watermark", "rows", "synced_at"]) for r in rows]}
+
+
+snapshot = Snapshot()
+
+
+# ------------------------------------------------------------
+# Fixed reports; parameters are bound, never interpolated
+# ------------------------------------------------------------
+class Report(NamedTuple):
+    description: str
+    sql: str
+    params: Tuple[str, ...] = ("start", "end")
+
+
+_DATE_RANGE = "(CAST($start AS DATE) IS NULL OR {col} >= CAST($start AS DATE)) AND (CAST($end AS DATE) IS NULL OR {col} <= CAST($end AS DATE))"
+
+REPORTS = {
+    "production-by-month": Report(
+        "Material weight, wastage and cost per month and material",
+        f"""
+        SELECT CAST(date_trunc('month', production_date) AS DATE) AS month, material_assigned AS material,
+               COUNT(*) AS entries, SUM(material_weight_grams) AS material_weight_grams,
+               SUM(wastage_grams) AS wastage_grams, SUM(material_cost) AS material_cost,
+               round(100.0 * SUM(wastage_grams) / NULLIF(SUM(material_weight_grams), 0), 2) AS wastage_pct
+        FROM production WHERE {_DATE_RANGE.format(col="production_date")}
+        GROUP BY ALL ORDER BY month, material
+        """),
+    "qc-pass-rate-by-product": Report(
+        "Inspections, passed/failed quantities and pass rate per product, worst first",
+        f"""
+        SELECT p.sku, p.name, COUNT(*) AS inspections, SUM(q.qty_passed) AS qty_passed, SUM(q.qty_failed) AS qty_failed,
+               round(100.0 * SUM(q.qty_passed) / NULLIF(SUM(q.qty_passed + q.qty_failed), 0), 2) AS pass_rate
+        FROM qc_logs q JOIN job_cards jc ON q.job_card_id = jc.id JOIN products p ON jc.product_id = p.id
+        WHERE {_DATE_RANGE.format(col="CAST(q.inspection_date AS DATE)")}
+        GROUP BY ALL ORDER BY pass_rate NULLS LAST, qty_failed DESC
+        """),
+    "artisan-output": Report(
+        "Job cards, completed quantity and QC results per assigned artisan",
+        f"""
+        WITH qc AS (
+            SELECT job_card_id, SUM(qty_passed) AS qty_passed, SUM(qty_failed) AS qty_failed FROM qc_logs GROUP BY 1
+        )
+        SELECT u.name AS artisan, COUNT(*) AS job_cards, SUM(jc.completed_qty) AS completed_qty,
+               COALESCE(SUM(qc.qty_passed), 0) AS qty_passed, COALESCE(SUM(qc.qty_failed), 0) AS qty_failed
+        FROM job_cards jc JOIN users u ON jc.assigned_artisan_id = u.id LEFT JOIN qc ON qc.job_card_id = jc.id
+        WHERE {_DATE_RANGE.format(col="CAST(jc.created_at AS DATE)")}
+        GROUP BY ALL ORDER BY completed_qty DESC
+        """),
+    "inventory-value-by-category": Report(
+        "Stock quantity and value at cost and selling price per category",
+        """
+        SELECT c.name AS category, COUNT(*) AS skus, SUM(i.stock_qty) AS stock_qty,
+               SUM(i.stock_qty * i.unit_cost) AS cost_value, SUM(i.stock_qty * i.selling_price) AS selling_value
+        FROM inventory i JOIN products p ON i.product_id = p.id LEFT JOIN sku_category c ON p.category_id = c.id
+        GROUP BY ALL ORDER BY selling_value DESC
+        """, ()),
+    "job-card-status": Report(
+        "Job card counts and quantities per status, with overdue open cards",
+        f"""
+        SELECT status, COUNT(*) AS job_cards, SUM(target_qty) AS target_qty, SUM(completed_qty) AS completed_qty,
+               COUNT(*) FILTER (WHERE due_date < current_date AND status NOT IN ('completed', 'cancelled')) AS overdue
+        FROM job_cards WHERE {_DATE_RANGE.format(col="CAST(created_at AS DATE)")}
+        GROUP BY ALL ORDER BY status
+        """),
+}
+
+
+async def run_report(name, **params):
+    report = REPORTS[name]
+    columns, rows = await asyncio.to_thread(snapshot.query, report.sql, {p: params.get(p) for p in report.params})
+    return columns, [serialize_row(r, columns) for r in rows]
+
+
+async def snapshot_loop(interval=SNAPSHOT_INTERVAL):
+    while True:
+        session = database.LazySession("analytics")
+        try:
+            await build_snapshot(session)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Analytics snapshot refresh failed: %s", e)
+        finally:
+            await session.close()
+        await asyncio.sleep(interval)
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    session = database.LazySession("analytics")
+    try:
+        result = await build_snapshot(session, full=args.full)
+    finally:
+        await session.close()
+        await database.dispose_engine()
+    for table, info in result["tables"].items():
+        print(f"  {table:14} {info['mode']:12} {info['copied']} rows")
+    print(f"Snapshot at {SNAPSHOT_PATH}" + (" (skipped: another refresh is running)" if result["skipped"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the DuckDB analytics snapshot")
+    parser.add_argument("--full", action="store_true", help="rebuild every table instead of copying changes")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,212 @@
+"""
+AMARA ERP/MIS - Job Card Archive
+Moves closed (completed/cancelled) job cards untouched for ARCHIVE_AFTER_DAYS,
+together with their qc_logs and production rows, into zstd-compressed Parquet
+batches under ARCHIVE_DIR and deletes them from the live tables (QC and
+production rows cascade; the rollups and product costs keep their totals).
+job_card_archive (migration 016) records the batch of every archived card, so
+read_archived() opens only that batch, filtered to the one card.
+
+Runs from POST /api/job-cards/archive, from the lifespan every ARCHIVE_INTERVAL
+seconds (off by default), or standalone:
+
+    python archive.py [--older-than-days N] [--batch-size N] [--max-batches N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import text
+
+import audit
+import database
+from common import serialize_row
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", ROOT_DIR / "archive"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_COMPRESSION = os.environ.get("ARCHIVE_COMPRESSION", "zstd")
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "0"))  # seconds; 0 = only on demand
+
+CLOSED_STATUSES = ["completed", "cancelled"]
+# Archived table -> column holding the job card id
+ARCHIVE_TABLES = {"job_cards": "id", "qc_logs": "job_card_id", "production": "job_card_id"}
+
+
+def _parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for job card archival")
+    return pyarrow, pyarrow.parquet
+
+
+def _plain(value):
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def _write_batch(directory, tables):
+    """One Parquet file per table; written under a .tmp name and renamed so readers never see a partial batch."""
+    pa, pq = _parquet()
+    tmp = directory.with_name(directory.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for table, (keys, rows) in tables.items():
+        columns = {k: [_plain(row[i]) for row in rows] for i, k in enumerate(keys)}
+        pq.write_table(pa.table(columns), tmp / f"{table}.parquet", compression=ARCHIVE_COMPRESSION)
+    tmp.rename(directory)
+
+
+def _read_batch(directory, job_card_id):
+    _, pq = _parquet()
+    out = {}
+    for table, column in ARCHIVE_TABLES.items():
+        path = directory / f"{table}.parquet"
+        rows = pq.read_table(path, filters=[(column, "=", job_card_id)]).to_pylist() if path.exists() else []
+        out[table] = [serialize_row(list(r.values()), list(r.keys())) for r in rows]
+    return out
+
+
+def batch_cost_totals(batch):
+    """Per job card QC and production totals of an archived batch, summed from its Parquet files."""
+    _, pq = _parquet()
+    directory = ARCHIVE_DIR / batch
+    totals = {}
+    sums = {"qc_logs": ["qty_passed", "qty_failed"],
+            "production": ["material_weight_grams", "wastage_grams", "material_cost"]}
+    for table, columns in sums.items():
+        path = directory / f"{table}.parquet"
+        if not path.exists():
+            raise RuntimeError(f"Archive batch {batch} is missing {table}.parquet")
+        for row in pq.read_table(path, columns=["job_card_id", *columns]).to_pylist():
+            card = totals.setdefault(row["job_card_id"], dict.fromkeys(sums["qc_logs"] + sums["production"], 0))
+            for c in columns:
+                card[c] += row[c] or 0
+    return totals
+
+
+async def archive_batch(db, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive up to batch_size closed job cards last updated before cutoff; None when nothing is left."""
+    r = await db.execute(text("""
+        SELECT id FROM job_cards
+        WHERE status = ANY(:statuses) AND updated_at < :cutoff
+        ORDER BY updated_at LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    """), {"statuses": CLOSED_STATUSES, "cutoff": cutoff, "limit": batch_size})
+    ids = [row[0] for row in r.fetchall()]
+    if not ids:
+        await db.rollback()
+        return None
+
+    tables = {}
+    for table, column in ARCHIVE_TABLES.items():
+        r = await db.execute(text(f"SELECT * FROM {table} WHERE {column} = ANY(:ids)"), {"ids": ids})
+        tables[table] = (list(r.keys()), r.fetchall())
+
+    batch = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    directory = ARCHIVE_DIR / batch
+    await asyncio.to_thread(_write_batch, directory, tables)
+    try:
+        await db.execute(text("""
+            INSERT INTO job_card_archive (job_card_id, job_card_number, product_id, assigned_artisan_id, status,
+                target_qty, completed_qty, created_at, closed_at, batch, qc_rows, production_rows,
+                qty_passed, qty_failed, material_weight_grams, wastage_grams, material_cost)
+            SELECT jc.id, jc.job_card_number, jc.product_id, jc.assigned_artisan_id, jc.status,
+                   jc.target_qty, jc.completed_qty, jc.created_at, jc.updated_at, :batch,
+                   COALESCE(q.n, 0), COALESCE(pr.n, 0), COALESCE(q.passed, 0), COALESCE(q.failed, 0),
+                   COALESCE(pr.weight, 0), COALESCE(pr.wastage, 0), COALESCE(pr.cost, 0)
+            FROM job_cards jc
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS n, SUM(qty_passed) AS passed, SUM(qty_failed) AS failed
+                FROM qc_logs WHERE job_card_id = jc.id
+            ) q ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS n, SUM(material_weight_grams) AS weight, SUM(wastage_grams) AS wastage,
+                       SUM(material_cost) AS cost
+                FROM production WHERE job_card_id = jc.id
+            ) pr ON TRUE
+            WHERE jc.id = ANY(:ids)
+        """), {"ids": ids, "batch": batch})
+        await db.execute(text("DELETE FROM job_cards WHERE id = ANY(:ids)"), {"ids": ids})
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    keys, rows = tables["job_cards"]
+    status = keys.index("status")
+    audit.record_many("job_card", "archive", [(row[0], {"status": row[status]}, {"batch": batch}) for row in rows])
+    return {"batch": batch, **{table: len(rows) for table, (_, rows) in tables.items()}}
+
+
+async def archive_closed_job_cards(db, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Archive in batches (one transaction each) until nothing qualifies or max_batches is reached."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    batches = []
+    while max_batches is None or len(batches) < max_batches:
+        result = await archive_batch(db, cutoff, batch_size)
+        if result is None:
+            break
+        batches.append(result)
+    totals = {table: sum(b[table] for b in batches) for table in ARCHIVE_TABLES}
+    if batches:
+        logger.info("Archived %s job cards (%s QC, %s production rows) in %s batches",
+                    totals["job_cards"], totals["qc_logs"], totals["production"], len(batches))
+    return {"cutoff": cutoff.isoformat(), "archived": totals, "batches": batches}
+
+
+async def read_archived(db, job_card_id):
+    """The archived job card with its QC and production rows, or None if it was never archived."""
+    r = await db.execute(text("SELECT batch, archived_at FROM job_card_archive WHERE job_card_id = :id"), {"id": job_card_id})
+    row = r.fetchone()
+    if not row:
+        return None
+    tables = await asyncio.to_thread(_read_batch, ARCHIVE_DIR / row[0], job_card_id)
+    if not tables["job_cards"]:
+        raise RuntimeError(f"Archive batch {row[0]} is missing job card {job_card_id}")
+    return {"job_card": tables["job_cards"][0], "qc_logs": tables["qc_logs"], "production": tables["production"],
+            "archived": True, "archived_at": row[1].isoformat(), "batch": row[0]}
+
+
+async def archive_loop(interval=ARCHIVE_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        session = database.LazySession("export")
+        try:
+            await archive_closed_job_cards(session)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Job card archival failed: %s", e)
+        finally:
+            await session.close()
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    session = database.LazySession("export")
+    try:
+        result = await archive_closed_job_cards(session, args.older_than_days, args.batch_size, args.max_batches)
+    finally:
+        await session.close()
+        await audit.writer.stop()
+        await database.dispose_engine()
+    archived = result["archived"]
+    print(f"Archived {archived['job_cards']} job cards, {archived['qc_logs']} QC logs, "
+          f"{archived['production']} production rows in {len(result['batches'])} batches to {ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive closed job cards to Parquet")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None)
+    asyncio.run(_main(parser.parse_args()))
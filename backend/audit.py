@@ -0,0 +1,239 @@
+"""
+AMARA ERP/MIS - Change Audit Log
+Write handlers call record() with the entity's values before and after the
+change; only the fields that differ are kept, as {"field": [before, after]}.
+record() never touches the database: it appends to an in-process queue that a
+flusher task writes to audit_log (migration 019) with one multi-row INSERT
+every AUDIT_FLUSH_MS or AUDIT_FLUSH_ROWS entries, so auditing adds
+microseconds, not a round trip, to each write. record() times itself and
+GET /api/audit/stats reports the overhead.
+
+Entries carry the time of the change and the actor and request that made it
+(X-Actor header, method and path, set by AuditContextMiddleware). The API has
+no authentication, so the actor is whatever the client sent: advisory, for
+attributing changes made through the frontend, not proof of who made them.
+When the
+queue is full, entries are dropped and counted rather than slowing writes;
+a failing flush is retried with backoff while the queue absorbs new entries.
+Entries the database refuses (an over-long actor, say) are split out of their
+batch and dropped as rejected, so one bad entry cannot stall the rest.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import database
+from common import data_refused
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", "20000"))
+AUDIT_FLUSH_ROWS = int(os.environ.get("AUDIT_FLUSH_ROWS", "1000"))
+AUDIT_FLUSH_MS = float(os.environ.get("AUDIT_FLUSH_MS", "50"))
+AUDIT_DRAIN_SECONDS = float(os.environ.get("AUDIT_DRAIN_SECONDS", "5"))
+MAX_RETRY_DELAY = 30
+TIMING_SAMPLES = 4096
+
+# Who and what made the current request; set per request by AuditContextMiddleware
+current_actor = ContextVar("audit_actor", default=None)
+current_source = ContextVar("audit_source", default=None)
+
+INSERT_SQL = """
+    INSERT INTO audit_log (entity_type, entity_id, action, actor, source, changes, changed_at)
+    SELECT t.entity_type, t.entity_id, t.action, t.actor, t.source, CAST(t.changes AS jsonb), t.changed_at
+    FROM unnest(CAST(:entity_types AS varchar[]), CAST(:entity_ids AS uuid[]), CAST(:actions AS varchar[]),
+                CAST(:actors AS varchar[]), CAST(:sources AS varchar[]), CAST(:changes AS text[]),
+                CAST(:changed_at AS timestamptz[]))
+        AS t(entity_type, entity_id, action, actor, source, changes, changed_at)
+"""
+
+
+def diff(before, after):
+    """{field: [before, after]} for every field whose value differs; either side may be None."""
+    before, after = before or {}, after or {}
+    return {k: [before.get(k), after.get(k)] for k in {**before, **after} if before.get(k) != after.get(k)}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # UUIDs and anything else JSON cannot hold are kept as their text
+    return str(value)
+
+
+def _params(batch):
+    return {
+        "entity_types": [e[0] for e in batch], "entity_ids": [e[1] for e in batch], "actions": [e[2] for e in batch],
+        "actors": [e[3] for e in batch], "sources": [e[4] for e in batch],
+        "changes": [json.dumps(e[5], default=_json_default) for e in batch], "changed_at": [e[6] for e in batch],
+    }
+
+
+class AuditWriter:
+    def __init__(self, queue_size=AUDIT_QUEUE_SIZE, flush_rows=AUDIT_FLUSH_ROWS, flush_ms=AUDIT_FLUSH_MS):
+        self.queue_size = queue_size
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self._queue = None
+        self._task = None
+        self._timings = deque(maxlen=TIMING_SAMPLES)  # record() durations, ns
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "rejected": 0, "batches": 0, "failed_flushes": 0,
+                      "last_batch_rows": 0, "last_batch_ms": None}
+
+    def record(self, entity_type, entity_id, action, before=None, after=None):
+        """Queue one change; returns at once. Updates that change nothing are skipped."""
+        started = time.perf_counter_ns()
+        changes = diff(before, after)
+        if changes or action != "update":
+            if self._queue is None:
+                self._start()
+            entry = (entity_type, str(entity_id), action, current_actor.get(), current_source.get(),
+                     changes, datetime.now(timezone.utc))
+            try:
+                self._queue.put_nowait(entry)
+                self.stats["recorded"] += 1
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+        self._timings.append(time.perf_counter_ns() - started)
+
+    def record_many(self, entity_type, action, rows):
+        """record() for (entity_id, before, after) tuples, e.g. from a bulk statement."""
+        for entity_id, before, after in rows:
+            self.record(entity_type, entity_id, action, before, after)
+
+    def _start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_seconds=AUDIT_DRAIN_SECONDS):
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_seconds
+        while not self._queue.empty() and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if not self._queue.empty():
+            logger.warning("Audit writer stopped with %s entries unwritten", self._queue.qsize())
+        self._task, self._queue = None, None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_ms / 1000
+            while len(batch) < self.flush_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.flush_rows and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        delay = 0.5
+        while True:
+            started = time.perf_counter()
+            try:
+                written = await self._insert(batch)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                logger.warning("Audit flush of %s entries failed, retrying in %ss: %s", len(batch), delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        self.stats["batches"] += 1
+        self.stats["written"] += written
+        self.stats["last_batch_rows"] = len(batch)
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _insert(self, batch):
+        """
+        One multi-row INSERT. If the database refuses the data, entries are
+        retried one at a time and the ones that still fail are dropped.
+        Returns how many were written; other errors propagate for a retry.
+        """
+        session = database.LazySession()
+        try:
+            try:
+                await session.execute(text(INSERT_SQL), _params(batch))
+                await session.commit()
+                return len(batch)
+            except DBAPIError as e:
+                await session.rollback()
+                if not data_refused(e):
+                    raise
+            written = 0
+            for entry in batch:
+                try:
+                    await session.execute(text(INSERT_SQL), _params([entry]))
+                    await session.commit()
+                    written += 1
+                except DBAPIError as e:
+                    await session.rollback()
+                    if not data_refused(e):
+                        raise
+                    self.stats["rejected"] += 1
+                    logger.warning("Audit entry for %s %s rejected: %s", entry[0], entry[1], e.orig.__cause__ or e.orig)
+            return written
+        finally:
+            await session.close()
+
+    def info(self):
+        timings = sorted(self._timings)
+
+        def pct(p):
+            return round(timings[min(len(timings) - 1, int(len(timings) * p))] / 1000, 2) if timings else None
+
+        return {"queued": self._queue.qsize() if self._queue else 0, "queue_size": self.queue_size,
+                "flush_rows": self.flush_rows, "flush_ms": self.flush_ms, **self.stats,
+                "record_us": {"samples": len(timings), "p50": pct(0.5), "p99": pct(0.99),
+                              "max": round(timings[-1] / 1000, 2) if timings else None}}
+
+
+writer = AuditWriter()
+record = writer.record
+record_many = writer.record_many
+
+
+class AuditContextMiddleware:
+    """
+    Sets the actor (X-Actor header) and source (method and path) of each API
+    request for record(). The header is not authenticated; see the module notes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        actor = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-actor":
+                actor = value.decode("latin-1")[:100]
+                break
+        actor_token = current_actor.set(actor)
+        source_token = current_source.set(f"{scope['method']} {scope['path']}"[:200])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_actor.reset(actor_token)
+            current_source.reset(source_token)
@@ -0,0 +1,150 @@
+"""
+AMARA ERP/MIS - Shared Cache Channel
+A MemoryBackend served over a local Unix socket by the serve.py supervisor, so
+all workers share response-cache entries and tag versions: an invalidation in
+one worker is seen by every other, and lookups/schema are read once per machine.
+
+Workers select it with RESPONSE_CACHE_BACKEND=cache_channel:create_backend.
+"""
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import threading
+
+from response_cache import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+CACHE_SOCKET_PATH = os.environ.get("CACHE_SOCKET_PATH", "/tmp/amara-cache.sock")
+_HEADER = struct.Struct("!I")
+METHODS = ("get", "set", "versions", "bump", "clear")
+CHANNEL_ERRORS = (OSError, asyncio.IncompleteReadError, EOFError)
+
+
+async def _read_message(reader):
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _write_message(writer, message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(payload)) + payload)
+
+
+# ------------------------------------------------------------
+# Server (runs in the supervisor process)
+# ------------------------------------------------------------
+class CacheServer:
+    def __init__(self, path=CACHE_SOCKET_PATH, max_entries=None):
+        self.path = path
+        self.backend = MemoryBackend(max_entries or int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048")))
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                method, args = await _read_message(reader)
+                if method == "stats":
+                    result = self.backend.stats()
+                elif method in METHODS:
+                    result = await getattr(self.backend, method)(*args)
+                else:
+                    result = None
+                _write_message(writer, result)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self, ready=None):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_thread(self):
+        """Serve from a daemon thread with its own event loop; returns once the socket is listening."""
+        ready = threading.Event()
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve_forever(ready)), name="cache-channel", daemon=True)
+        thread.start()
+        if not ready.wait(5):
+            raise RuntimeError(f"Cache channel did not start on {self.path}")
+        return thread
+
+
+# ------------------------------------------------------------
+# Client (one per worker; MemoryBackend interface)
+# ------------------------------------------------------------
+class SocketBackend:
+    """
+    Requests are serialised over a single connection per worker. If the channel
+    is down the cache degrades to misses: reads return nothing, versions never
+    match, writes are dropped, and the connection is retried on the next call.
+    """
+
+    def __init__(self, path=CACHE_SOCKET_PATH):
+        self.path = path
+        self._lock = asyncio.Lock()
+        self._reader = self._writer = None
+        self.errors = 0
+
+    async def _call(self, method, *args):
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                _write_message(self._writer, (method, args))
+                await self._writer.drain()
+                return await _read_message(self._reader)
+            except BaseException as e:
+                # Also on cancellation: a reply left unread would be taken as the answer to the next request
+                if isinstance(e, CHANNEL_ERRORS):
+                    self.errors += 1
+                    logger.warning("Cache channel %s failed: %s", method, e)
+                if self._writer is not None:
+                    self._writer.close()
+                self._reader = self._writer = None
+                raise
+
+    async def get(self, key):
+        try:
+            return await self._call("get", key)
+        except CHANNEL_ERRORS:
+            return None
+
+    async def set(self, key, entry):
+        try:
+            await self._call("set", key, entry)
+        except CHANNEL_ERRORS:
+            pass
+
+    async def versions(self, tags):
+        try:
+            return await self._call("versions", tags)
+        except CHANNEL_ERRORS:
+            return [object() for _ in tags]
+
+    async def bump(self, tags):
+        try:
+            await self._call("bump", tags)
+        except CHANNEL_ERRORS:
+            pass
+
+    async def clear(self):
+        try:
+            await self._call("clear")
+        except CHANNEL_ERRORS:
+            pass
+
+    def stats(self):
+        return {"backend": "socket", "path": self.path, "errors": self.errors}
+
+
+def create_backend():
+    return SocketBackend(os.environ.get("CACHE_SOCKET_PATH", CACHE_SOCKET_PATH))
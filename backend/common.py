@@ -0,0 +1,49 @@
+"""
+AMARA ERP/MIS - Shared route helpers
+"""
+import io
+import csv
+import uuid
+from datetime import datetime, date
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import DBAPIError
+
+BULK_MAX_ITEMS = 5000
+
+
+def serialize_row(row, keys):
+    d = {}
+    for i, k in enumerate(keys):
+        val = row[i]
+        if isinstance(val, (datetime, date)):
+            d[k] = val.isoformat()
+        elif val is None:
+            d[k] = None
+        else:
+            d[k] = str(val) if isinstance(val, uuid.UUID) else val
+    return d
+
+def query_canceled(e):
+    # 57014 = query_canceled: a statement_timeout, answered 504 by server.py rather than a handler's 400
+    return isinstance(e, DBAPIError) and getattr(e.orig, "sqlstate", None) == "57014"
+
+def data_refused(e):
+    # SQLSTATE class 22 (data exception) or 23 (integrity violation): the same data will fail again.
+    # asyncpg surfaces many of these as a plain DBAPIError, so the class is checked rather than the type
+    return isinstance(e, DBAPIError) and str(getattr(e.orig, "sqlstate", None) or "")[:2] in ("22", "23")
+
+def make_csv_response(rows, headers, filename):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(row)
+    output.seek(0)
+    return StreamingResponse(
+        iter([output.getvalue()]),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+def ratio(num, den, scale=1):
+    return round(float(num) / float(den) * scale, 4) if den else None
@@ -0,0 +1,307 @@
+"""
+AMARA ERP/MIS - Actual Product Costing
+product_costs (migration 018) holds per-product totals of production material
+cost, weight and wastage and of QC passed/failed quantities, kept current by
+triggers on production and qc_logs. Its actual_unit_cost, material cost per
+QC-passed piece across every job card of the product, is copied to
+inventory.unit_cost by sync_inventory_costs() every COST_SYNC_INTERVAL seconds
+(and after a recompute) rather than by the triggers, so QC and production
+writes never lock inventory rows that repricing may be updating.
+
+Costing owns inventory.unit_cost for every product that has an actual cost;
+metal-rate repricing only sets its prices.
+
+recompute_costs() rebuilds the totals from scratch for backfills and drift
+checks: production and QC rows, the totals of archived job cards and of
+months detached by partition retention (product_cost_retained) are loaded as
+NumPy arrays and summed per product with bincount, then written back in one
+statement per table. Cards archived before migration 018 get their totals
+from their Parquet batch first. Runs from POST /api/costs/recompute or
+standalone:
+
+    python costing.py [--full]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+import archive
+import database
+from common import serialize_row
+
+logger = logging.getLogger(__name__)
+
+COST_SYNC_INTERVAL = float(os.environ.get("COST_SYNC_INTERVAL", "60"))  # seconds; 0 = only after recomputes
+
+TOTAL_COLUMNS = ["production_entries", "material_weight_grams", "wastage_grams", "material_cost", "qty_passed", "qty_failed"]
+COST_KEYS = ["product_id", "sku", "product_name", *TOTAL_COLUMNS, "actual_unit_cost", "inventory_unit_cost", "updated_at"]
+
+
+def _arrays(rows, width):
+    cols = list(zip(*rows)) if rows else [()] * width
+    return [np.array([str(v) for v in cols[0]], dtype=object)] + [np.nan_to_num(np.array(c, dtype=float)) for c in cols[1:]]
+
+
+async def _load_sources(db):
+    """Per-source rows keyed by product: (product ids, [one array per TOTAL_COLUMNS entry])."""
+    r = await db.execute(text("""
+        SELECT jc.product_id, pr.material_weight_grams, pr.wastage_grams, pr.material_cost
+        FROM production pr JOIN job_cards jc ON pr.job_card_id = jc.id
+    """))
+    pid, weight, wastage, cost = _arrays(r.fetchall(), 4)
+    sources = [(pid, [np.ones(len(pid)), weight, wastage, cost, np.zeros(len(pid)), np.zeros(len(pid))])]
+
+    r = await db.execute(text("""
+        SELECT jc.product_id, q.qty_passed, q.qty_failed
+        FROM qc_logs q JOIN job_cards jc ON q.job_card_id = jc.id
+    """))
+    pid, passed, failed = _arrays(r.fetchall(), 3)
+    sources.append((pid, [np.zeros(len(pid))] * 4 + [passed, failed]))
+
+    r = await db.execute(text("""
+        SELECT product_id, production_rows, material_weight_grams, wastage_grams, material_cost, qty_passed, qty_failed
+        FROM job_card_archive WHERE product_id IS NOT NULL
+    """))
+    pid, *totals = _arrays(r.fetchall(), 7)
+    sources.append((pid, totals))
+
+    r = await db.execute(text(f"SELECT product_id, {', '.join(TOTAL_COLUMNS)} FROM product_cost_retained"))
+    pid, *totals = _arrays(r.fetchall(), 7)
+    sources.append((pid, totals))
+    return sources
+
+
+# Month partition of qc_logs/production -> per-product totals, folded into product_cost_retained
+_RETAIN_SQL = {
+    "production": """
+        SELECT jc.product_id, COUNT(*), COALESCE(SUM(pr.material_weight_grams), 0), COALESCE(SUM(pr.wastage_grams), 0),
+               COALESCE(SUM(pr.material_cost), 0), 0, 0
+        FROM "{partition}" pr JOIN job_cards jc ON pr.job_card_id = jc.id GROUP BY jc.product_id
+    """,
+    "qc_logs": """
+        SELECT jc.product_id, 0, 0, 0, 0, COALESCE(SUM(q.qty_passed), 0), COALESCE(SUM(q.qty_failed), 0)
+        FROM "{partition}" q JOIN job_cards jc ON q.job_card_id = jc.id GROUP BY jc.product_id
+    """,
+}
+
+_ADD_TOTALS = ", ".join(f"{c} = t.{c} + EXCLUDED.{c}" for c in TOTAL_COLUMNS)
+
+
+async def retain_partition(db, table, partition):
+    """Keep a qc_logs/production month's totals for full recomputes; call before detaching it."""
+    if table not in _RETAIN_SQL:
+        return
+    # Partition names come from pg_class (see partitions.detach_partitions)
+    await db.execute(text(f"""
+        INSERT INTO product_cost_retained AS t (product_id, {', '.join(TOTAL_COLUMNS)})
+        {_RETAIN_SQL[table].format(partition=partition)}
+        ON CONFLICT (product_id) DO UPDATE SET {_ADD_TOTALS}
+    """))
+
+
+ARCHIVE_TOTAL_COLUMNS = ["qty_passed", "qty_failed", "material_weight_grams", "wastage_grams", "material_cost"]
+
+
+async def backfill_archive_totals(db):
+    """
+    Fill in the totals of cards archived before migration 018 from their Parquet
+    batches and add them to product_costs, which never counted them; the caller
+    commits. Returns the number of cards filled in.
+    """
+    r = await db.execute(text("SELECT job_card_id, batch FROM job_card_archive WHERE totals_pending"))
+    pending = r.fetchall()
+    if not pending:
+        return 0
+    cards = {}
+    for batch in sorted({row[1] for row in pending}):
+        cards.update(await asyncio.to_thread(archive.batch_cost_totals, batch))
+    ids = [str(row[0]) for row in pending]
+    zero = dict.fromkeys(ARCHIVE_TOTAL_COLUMNS, 0)
+    params = {"ids": ids, **{c: [float(cards.get(i, zero)[c]) for i in ids] for c in ARCHIVE_TOTAL_COLUMNS}}
+    await db.execute(text(f"""
+        WITH v AS (
+            SELECT * FROM unnest(CAST(:ids AS uuid[]), CAST(:qty_passed AS float8[]), CAST(:qty_failed AS float8[]),
+                                 CAST(:material_weight_grams AS float8[]), CAST(:wastage_grams AS float8[]),
+                                 CAST(:material_cost AS float8[]))
+                AS v(job_card_id, {', '.join(ARCHIVE_TOTAL_COLUMNS)})
+        ), filled AS (
+            UPDATE job_card_archive a SET {', '.join(f'{c} = v.{c}' for c in ARCHIVE_TOTAL_COLUMNS)}, totals_pending = FALSE
+            FROM v WHERE a.job_card_id = v.job_card_id
+            RETURNING a.product_id, a.production_rows, {', '.join('a.' + c for c in ARCHIVE_TOTAL_COLUMNS)}
+        )
+        INSERT INTO product_costs AS t (product_id, {', '.join(TOTAL_COLUMNS)})
+        SELECT product_id, SUM(production_rows), SUM(material_weight_grams), SUM(wastage_grams), SUM(material_cost),
+               SUM(qty_passed), SUM(qty_failed)
+        FROM filled WHERE EXISTS (SELECT 1 FROM products p WHERE p.id = filled.product_id)
+        GROUP BY product_id
+        ON CONFLICT (product_id) DO UPDATE SET {_ADD_TOTALS}, updated_at = NOW()
+    """), params)
+    return len(ids)
+
+
+def aggregate(sources):
+    """Sum every source's columns per product; returns (product ids, {column: array})."""
+    product_ids = np.concatenate([pid for pid, _ in sources]).astype(str)
+    products, inverse = np.unique(product_ids, return_inverse=True)
+    totals = {}
+    for k, column in enumerate(TOTAL_COLUMNS):
+        values = np.concatenate([cols[k] for _, cols in sources])
+        totals[column] = np.bincount(inverse, weights=values, minlength=len(products))
+    totals["material_weight_grams"] = np.round(totals["material_weight_grams"], 3)
+    totals["wastage_grams"] = np.round(totals["wastage_grams"], 3)
+    totals["material_cost"] = np.round(totals["material_cost"], 2)
+    return products, totals
+
+
+def count_drift(products, totals, old_ids, old_cols):
+    """Products whose stored totals differ from the recomputed ones, including rows only one side has."""
+    order = np.argsort(old_ids)
+    sorted_ids = old_ids[order]
+    pos = np.minimum(np.searchsorted(sorted_ids, products), max(len(sorted_ids) - 1, 0))
+    found = (sorted_ids[pos] == products) if len(sorted_ids) else np.zeros(len(products), dtype=bool)
+    differs = ~found
+    for k, column in enumerate(TOTAL_COLUMNS):
+        stored = old_cols[k][order][pos] if len(sorted_ids) else np.zeros(len(products))
+        differs |= found & (np.abs(stored - totals[column]) > 0.005)
+    return int(differs.sum()) + len(old_ids) - int(found.sum())
+
+
+async def sync_inventory_costs(db):
+    """Copy actual unit costs that changed to inventory.unit_cost; the caller commits. Returns rows updated."""
+    r = await db.execute(text("""
+        UPDATE inventory i SET unit_cost = c.actual_unit_cost, updated_at = NOW()
+        FROM product_costs c
+        WHERE c.product_id = i.product_id AND c.actual_unit_cost IS NOT NULL
+          AND i.unit_cost IS DISTINCT FROM c.actual_unit_cost
+    """))
+    return r.rowcount
+
+
+async def sync_loop(interval=COST_SYNC_INTERVAL):
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        session = database.LazySession()
+        try:
+            updated = await sync_inventory_costs(session)
+            await session.commit()
+            if updated:
+                logger.info("Actual unit cost copied to %s inventory rows", updated)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Inventory cost sync failed: %s", e)
+        finally:
+            await session.close()
+
+
+async def recompute_costs(db):
+    """Rebuild product_costs and resync inventory.unit_cost; the caller commits."""
+    started = time.perf_counter()
+    # Self-conflicting and blocks the cost triggers, so no delta lands between the read and the rewrite
+    await db.execute(text("LOCK TABLE product_costs IN SHARE ROW EXCLUSIVE MODE"))
+    backfilled = await backfill_archive_totals(db)
+    products, totals = aggregate(await _load_sources(db))
+
+    r = await db.execute(text(f"SELECT product_id, {', '.join(TOTAL_COLUMNS)} FROM product_costs"))
+    old_ids, *old_cols = _arrays(r.fetchall(), 1 + len(TOTAL_COLUMNS))
+    drift = count_drift(products, totals, old_ids.astype(str), old_cols)
+
+    await db.execute(text("DELETE FROM product_costs"))
+    await db.execute(text(f"""
+        INSERT INTO product_costs (product_id, {', '.join(TOTAL_COLUMNS)})
+        SELECT u.* FROM unnest(CAST(:ids AS uuid[]), CAST(:production_entries AS int[]),
+                               CAST(:material_weight_grams AS float8[]), CAST(:wastage_grams AS float8[]),
+                               CAST(:material_cost AS float8[]), CAST(:qty_passed AS bigint[]), CAST(:qty_failed AS bigint[]))
+            AS u(product_id, {', '.join(TOTAL_COLUMNS)})
+        WHERE EXISTS (SELECT 1 FROM products p WHERE p.id = u.product_id)  -- archived cards of deleted products
+    """), {"ids": products.tolist(),
+           **{c: (totals[c].astype(int) if c in ("production_entries", "qty_passed", "qty_failed") else totals[c]).tolist()
+              for c in TOTAL_COLUMNS}})
+    inventory_updated = await sync_inventory_costs(db)
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Product costs recomputed for %s products (%s drifted) in %sms", len(products), drift, duration_ms)
+    return {"products": len(products), "drifted": drift, "inventory_updated": inventory_updated,
+            "archive_backfilled": backfilled, "duration_ms": duration_ms}
+
+
+async def list_costs(db):
+    r = await db.execute(text(f"""
+        SELECT c.product_id, p.sku, p.name, {', '.join('c.' + c for c in TOTAL_COLUMNS)},
+               c.actual_unit_cost, i.unit_cost, c.updated_at
+        FROM product_costs c JOIN products p ON c.product_id = p.id LEFT JOIN inventory i ON i.product_id = c.product_id
+        ORDER BY p.sku
+    """))
+    return [serialize_row(row, COST_KEYS) for row in r.fetchall()]
+
+
+BREAKDOWN_KEYS = ["job_card_id", "job_card_number", "status", "archived", *TOTAL_COLUMNS, "unit_cost"]
+
+
+async def cost_breakdown(db, product_id):
+    """The product's cost totals and each job card's share (live and archived); None if the product is unknown."""
+    r = await db.execute(text(f"""
+        SELECT p.id, p.sku, p.name, {', '.join('c.' + c for c in TOTAL_COLUMNS)},
+               c.actual_unit_cost, i.unit_cost, c.updated_at
+        FROM products p LEFT JOIN product_costs c ON c.product_id = p.id LEFT JOIN inventory i ON i.product_id = p.id
+        WHERE p.id = CAST(:id AS uuid)
+    """), {"id": product_id})
+    row = r.fetchone()
+    if not row:
+        return None
+    summary = serialize_row(row, COST_KEYS)
+
+    r = await db.execute(text("""
+        SELECT jc.id, jc.job_card_number, jc.status, FALSE,
+               COALESCE(pr.n, 0), COALESCE(pr.weight, 0), COALESCE(pr.wastage, 0), COALESCE(pr.cost, 0),
+               COALESCE(q.passed, 0), COALESCE(q.failed, 0)
+        FROM job_cards jc
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS n, SUM(material_weight_grams) AS weight, SUM(wastage_grams) AS wastage, SUM(material_cost) AS cost
+            FROM production WHERE job_card_id = jc.id
+        ) pr ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT SUM(qty_passed) AS passed, SUM(qty_failed) AS failed FROM qc_logs WHERE job_card_id = jc.id
+        ) q ON TRUE
+        WHERE jc.product_id = CAST(:id AS uuid)
+        UNION ALL
+        SELECT job_card_id, job_card_number, status, TRUE, production_rows, material_weight_grams, wastage_grams,
+               material_cost, qty_passed, qty_failed
+        FROM job_card_archive WHERE product_id = CAST(:id AS uuid)
+        ORDER BY 2
+    """), {"id": product_id})
+    job_cards = []
+    for row in r.fetchall():
+        card = serialize_row(list(row) + [None], BREAKDOWN_KEYS)
+        if card["qty_passed"]:
+            card["unit_cost"] = round(card["material_cost"] / card["qty_passed"], 2)
+        job_cards.append(card)
+    return {**summary, "job_cards": job_cards}
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    session = database.LazySession("export")
+    try:
+        if args.full:
+            result = await recompute_costs(session)
+            await session.commit()
+            print(f"Recomputed {result['products']} products: {result['drifted']} drifted, "
+                  f"{result['inventory_updated']} inventory rows updated in {result['duration_ms']}ms")
+        for c in await list_costs(session):
+            print(f"  {c['sku']:12} passed {c['qty_passed']:>6}  cost {c['material_cost']:>12}  unit {c['actual_unit_cost']}")
+    finally:
+        await session.close()
+        await database.dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or rebuild actual product costs")
+    parser.add_argument("--full", action="store_true", help="recompute every product from production and QC records")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,6 +1,11 @@
 import os
+import time
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
 
@@ -10,33 +15,206 @@ load_dotenv(ROOT_DIR / '.env')
 DATABASE_URL = os.environ.get('DATABASE_URL')
 ASYNC_DATABASE_URL = DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://')
 
-engine = create_async_engine(
-    ASYNC_DATABASE_URL,
-    pool_size=10,
-    max_overflow=5,
-    pool_timeout=30,
-    pool_recycle=1800,
-    pool_pre_ping=False,
-    echo=False,
-    connect_args={
-        "statement_cache_size": 0,
-        "command_timeout": 30,
-    }
-)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '5'))
+POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+
+# Server-side statement_timeout per route class (ms). The interactive value is
+# every connection's default; other classes apply theirs with SET LOCAL semantics
+STATEMENT_TIMEOUTS = {
+    "interactive": int(os.environ.get('DB_TIMEOUT_INTERACTIVE_MS', '15000')),
+    "analytics": int(os.environ.get('DB_TIMEOUT_ANALYTICS_MS', '60000')),
+    "export": int(os.environ.get('DB_TIMEOUT_EXPORT_MS', '120000')),
+    "jobs": int(os.environ.get('DB_TIMEOUT_JOBS_MS', '120000')),
+    "maintenance": int(os.environ.get('DB_TIMEOUT_MAINTENANCE_MS', '300000')),
+}
+
+# Connections opened at startup so the first requests after a scale-up skip the TCP/TLS/auth handshake
+POOL_PREWARM = int(os.environ.get('DB_POOL_PREWARM', '2'))
 
-AsyncSessionLocal = async_sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False
-)
+# Created by init_engine() from the app lifespan (or a standalone script), not at import time
+engine = None
+AsyncSessionLocal = None
 
 Base = declarative_base()
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
+
+def init_engine():
+    global engine, AsyncSessionLocal
+    if engine is None:
+        engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=1800,
+            pool_pre_ping=False,
+            echo=False,
+            connect_args={
+                "statement_cache_size": 0,
+                "server_settings": {"statement_timeout": str(STATEMENT_TIMEOUTS["interactive"])},
+                # Client-side backstop only; statement_timeout cancels first
+                "command_timeout": max(STATEMENT_TIMEOUTS.values()) / 1000 + 5,
+            }
+        )
+        AsyncSessionLocal = async_sessionmaker(
+            bind=engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False
+        )
+    return engine
+
+
+async def prewarm_pool(count=POOL_PREWARM):
+    """Open up to `count` pooled connections concurrently and return them to the pool."""
+    count = min(count, POOL_SIZE)
+    if count <= 0:
+        return 0
+    conns = await asyncio.gather(*(init_engine().connect() for _ in range(count)))
+    for conn in conns:
+        await conn.close()
+    return count
+
+
+async def dispose_engine():
+    global engine, AsyncSessionLocal
+    if engine is not None:
+        await engine.dispose()
+        engine, AsyncSessionLocal = None, None
+
+# Per-route-class caps on concurrently held connections, so heavy routes
+# cannot take the whole pool. Interactive routes are only bounded by the pool.
+# "jobs" is background export jobs, which hold a connection for a whole file
+# and so get their own slots rather than starving inline exports.
+# "maintenance" (partition upkeep) has no budget: it runs at most once per
+# interval across workers and must not queue behind exports.
+POOL_BUDGETS = {
+    "export": int(os.environ.get('DB_POOL_BUDGET_EXPORT', '2')),
+    "analytics": int(os.environ.get('DB_POOL_BUDGET_ANALYTICS', '3')),
+    "jobs": int(os.environ.get('DB_POOL_BUDGET_JOBS', '2')),
+}
+_budget_semaphores = {k: asyncio.Semaphore(v) for k, v in POOL_BUDGETS.items() if v > 0}
+BUDGET_WAIT_SECONDS = float(os.environ.get('DB_BUDGET_WAIT_SECONDS', '2'))
+RETRY_AFTER_SECONDS = int(os.environ.get('DB_RETRY_AFTER_SECONDS', '5'))
+
+
+class PoolSaturated(HTTPException):
+    def __init__(self, route_class):
+        super().__init__(status_code=503, detail=f"Database busy ({route_class} capacity exhausted), retry later",
+                         headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+class LazySession:
+    """
+    AsyncSession proxy that takes its route-class budget slot and opens the
+    session on first execute; handlers that never query never touch the pool.
+    """
+
+    def __init__(self, route_class="interactive"):
+        self.route_class = route_class
+        self._budget = _budget_semaphores.get(route_class)
+        self._timeout_ms = STATEMENT_TIMEOUTS.get(route_class, STATEMENT_TIMEOUTS["interactive"])
+        self._session = None
+        self._in_txn = False
+
+    async def _acquire(self):
+        if self._session is None:
+            if self._budget is not None:
+                try:
+                    await asyncio.wait_for(self._budget.acquire(), BUDGET_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    raise PoolSaturated(self.route_class)
+            if AsyncSessionLocal is None:
+                init_engine()
+            self._session = AsyncSessionLocal()
+        return self._session
+
+    async def _call(self, method, *args, **kwargs):
+        session = await self._acquire()
+        try:
+            if not self._in_txn and self._timeout_ms != STATEMENT_TIMEOUTS["interactive"]:
+                # The connection default is the interactive timeout; other classes set theirs
+                # transaction-locally, so re-apply after every commit/rollback
+                await session.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(self._timeout_ms)})
+                self._in_txn = True
+            return await getattr(session, method)(*args, **kwargs)
+        except PoolTimeoutError:
+            # The first statement checks out the connection
+            await self.close()
+            raise PoolSaturated(self.route_class)
+
+    async def execute(self, *args, **kwargs):
+        return await self._call("execute", *args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        """Server-side cursor; rows are fetched as the result is iterated."""
+        return await self._call("stream", *args, **kwargs)
+
+    async def commit(self):
+        if self._session is not None:
+            self._in_txn = False
+            await self._session.commit()
+
+    async def rollback(self):
+        if self._session is not None:
+            self._in_txn = False
+            await self._session.rollback()
+
+    async def close(self):
+        if self._session is None:
+            return
+        try:
+            await self._session.close()
+        finally:
+            self._session = None
+            self._in_txn = False
+            if self._budget is not None:
+                self._budget.release()
+
+
+def get_db_for(route_class):
+    async def dependency():
+        session = LazySession(route_class)
         try:
             yield session
         finally:
             await session.close()
+    return dependency
+
+
+get_db = get_db_for("interactive")
+
+
+def pool_status():
+    if engine is None:
+        return {"size": 0, "checked_out": 0, "checked_in": 0, "overflow": 0, "max_overflow": MAX_OVERFLOW, "budgets": {}}
+    pool = engine.pool
+    return {
+        "size": pool.size(), "checked_out": pool.checkedout(), "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0), "max_overflow": MAX_OVERFLOW,
+        "budgets": {k: {"limit": POOL_BUDGETS[k], "available": sem._value} for k, sem in _budget_semaphores.items()},
+    }
+
+
+HEALTH_CHECK_INTERVAL = float(os.environ.get('HEALTH_CHECK_INTERVAL', '15'))
+_health = {"ok": None, "error": None, "checked_at": 0.0}
+_health_lock = asyncio.Lock()
+
+
+async def check_database():
+    """Round-trip SELECT 1 at most once per HEALTH_CHECK_INTERVAL; probes in between read the cached result."""
+    if time.monotonic() - _health["checked_at"] < HEALTH_CHECK_INTERVAL:
+        return _health
+    async with _health_lock:
+        if time.monotonic() - _health["checked_at"] < HEALTH_CHECK_INTERVAL:
+            return _health
+        try:
+            async with init_engine().connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            _health.update(ok=True, error=None)
+        except Exception as e:
+            _health.update(ok=False, error=str(e))
+        _health["checked_at"] = time.monotonic()
+    return _health
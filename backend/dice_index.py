@@ -0,0 +1,110 @@
+"""
+AMARA ERP/MIS - Dice Compatibility Index
+In-memory inverted index from motif_id / locking_id to dice bitsets.
+A dice can make a product when it is mapped to both the product's motif and locking.
+"""
+import asyncio
+from sqlalchemy import text
+from response_cache import response_cache
+
+# Response-cache tags bumped by dice and mapping writes; a version this worker did
+# not bump itself means another worker wrote, so its incremental copy is rebuilt
+DICE_TAGS = ["dices", "dice-mappings:motif", "dice-mappings:locking"]
+
+
+class DiceIndex:
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        self._versions = None
+        self._reset()
+
+    def _reset(self):
+        self._bit = {}       # dice_id -> bit position
+        self._dices = []     # bit position -> dice dict
+        self._active = 0     # bitset of active dices
+        self._targets = {"motif": {}, "locking": {}}  # target_id -> bitset
+
+    async def ensure_loaded(self, db):
+        versions = await response_cache.backend.versions(DICE_TAGS)
+        if self._loaded and versions == self._versions:
+            return
+        async with self._lock:
+            if self._loaded and versions == self._versions:
+                return
+            self._reset()
+            r = await db.execute(text("SELECT id, dice_number, dice_type, description, is_active, created_at FROM dices ORDER BY dice_number"))
+            for row in r.fetchall():
+                self.add_dice(row)
+            for kind, col in (("motif", "motif_id"), ("locking", "locking_id")):
+                r = await db.execute(text(f"SELECT dice_id, {col} FROM dice_{kind}_mapping"))
+                for row in r.fetchall():
+                    self._set(kind, str(row[0]), str(row[1]))
+            self._versions = versions
+            self._loaded = True
+
+    async def record_write(self, *tags):
+        """
+        Bump the response-cache tags of a write already applied to this index. The
+        new versions are adopted only if nobody else bumped in between, so local
+        writes keep the incremental copy and other workers' writes still rebuild it.
+        """
+        before = await response_cache.backend.versions(DICE_TAGS)
+        await response_cache.invalidate(*tags)
+        after = await response_cache.backend.versions(DICE_TAGS)
+        expected = [v + (t in tags) for t, v in zip(DICE_TAGS, before)]
+        if self._loaded and before == self._versions and after == expected:
+            self._versions = after
+
+    def invalidate(self):
+        """Force a full rebuild on next use (e.g. after a cascading delete)."""
+        self._loaded = False
+
+    def add_dice(self, row):
+        """Register a dice row (id, dice_number, dice_type, description, is_active, created_at)."""
+        dice_id = str(row[0])
+        dice = {"id": dice_id, "dice_number": row[1], "dice_type": row[2],
+                "description": row[3], "is_active": bool(row[4]),
+                "created_at": row[5].isoformat() if row[5] else None}
+        pos = self._bit.get(dice_id)
+        if pos is None:
+            pos = len(self._dices)
+            self._bit[dice_id] = pos
+            self._dices.append(dice)
+        else:
+            self._dices[pos] = dice
+        if dice["is_active"]:
+            self._active |= 1 << pos
+        else:
+            self._active &= ~(1 << pos)
+
+    def _set(self, kind, dice_id, target_id):
+        pos = self._bit.get(dice_id)
+        if pos is not None:
+            targets = self._targets[kind]
+            targets[target_id] = targets.get(target_id, 0) | (1 << pos)
+
+    def add_mapping(self, kind, dice_id, target_id):
+        if self._loaded:
+            self._set(kind, str(dice_id), str(target_id))
+
+    def drop_target(self, kind, target_id):
+        if kind in self._targets:
+            self._targets[kind].pop(str(target_id), None)
+
+    def bitset_for(self, motif_id, locking_id):
+        return self._targets["motif"].get(str(motif_id), 0) & self._targets["locking"].get(str(locking_id), 0) & self._active
+
+    def dices_in(self, bits):
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(self._dices[low.bit_length() - 1])
+            bits ^= low
+        return sorted(out, key=lambda d: d["dice_number"])
+
+    def dices_for(self, motif_id, locking_id):
+        return self.dices_in(self.bitset_for(motif_id, locking_id))
+
+
+dice_index = DiceIndex()
@@ -0,0 +1,356 @@
+"""
+AMARA ERP/MIS - Background Export Jobs
+POST /api/exports records a job in export_jobs (migration 017) and queues it
+here; EXPORT_WORKERS tasks per process stream the query through a server-side
+cursor into a CSV or gzipped CSV under EXPORT_DIR. Job state lives in the
+database, so any worker answers status polls, and files are shared by every
+worker on the machine. Downloads support Range/If-Range and ETag revalidation.
+
+A job's fingerprint hashes its kind, format and the change counters of its
+source tables (table_data_versions()): exporting unchanged data returns the
+existing job and file.
+Jobs run in their own "jobs" pool budget, one worker per slot, so they never
+take the slots of inline exports. A job still queued or running after
+EXPORT_STALE_SECONDS is treated as failed; sweep_loop() marks such jobs and
+deletes files older than EXPORT_FILE_TTL every EXPORT_SWEEP_INTERVAL seconds.
+compact_loop() folds the change log every EXPORT_COMPACT_INTERVAL seconds,
+since each fingerprint counts the log rows written since the last fold.
+"""
+import asyncio
+import csv
+import gzip
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import text
+
+import database
+from common import serialize_row
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+EXPORT_DIR = Path(os.environ.get("EXPORT_DIR", ROOT_DIR / "exports"))
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+EXPORT_QUEUE_SIZE = int(os.environ.get("EXPORT_QUEUE_SIZE", "20"))
+EXPORT_FETCH_ROWS = int(os.environ.get("EXPORT_FETCH_ROWS", "2000"))
+EXPORT_FILE_TTL = float(os.environ.get("EXPORT_FILE_TTL", "86400"))
+EXPORT_STALE_SECONDS = int(os.environ.get("EXPORT_STALE_SECONDS", "1800"))
+EXPORT_SWEEP_INTERVAL = float(os.environ.get("EXPORT_SWEEP_INTERVAL", "3600"))  # seconds; 0 = off
+EXPORT_COMPACT_INTERVAL = float(os.environ.get("EXPORT_COMPACT_INTERVAL", "60"))  # seconds; 0 = off
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+RETRY_AFTER_SECONDS = int(os.environ.get("DB_RETRY_AFTER_SECONDS", "5"))
+
+EXPORT_FORMATS = {"csv": (".csv", "text/csv"), "gzip": (".csv.gz", "application/gzip")}
+JOB_KEYS = ["id","kind","format","status","row_count","byte_size","error","created_at","started_at","finished_at","fingerprint","file_name"]
+ACTIVE_STATUSES = ("queued", "running", "completed")
+# Queued/running jobs not started (or not finished) within EXPORT_STALE_SECONDS
+STALE_JOB = "status IN ('queued', 'running') AND COALESCE(started_at, created_at) < NOW() - make_interval(secs => :stale)"
+
+
+class ExportDefinition(NamedTuple):
+    sql: str
+    headers: List[str]
+    tables: List[str]  # source tables whose change counters make up the fingerprint
+    filename: str
+    row: Optional[Callable] = None  # database row -> CSV row; rows are written as-is when None
+
+
+class ExportQueueFull(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Export queue is full, retry later",
+                         headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+def job_out(job):
+    """Public view of a job row (fingerprint and file name stay internal)."""
+    return {k: v for k, v in job.items() if k not in ("fingerprint", "file_name")}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _write_rows(handle, rows):
+    csv.writer(handle).writerows(rows)
+
+
+class ExportJobManager:
+    def __init__(self, workers=EXPORT_WORKERS, queue_size=EXPORT_QUEUE_SIZE, directory=EXPORT_DIR):
+        # A worker beyond the jobs budget would only wait for a slot and fail
+        self.workers = min(workers, database.POOL_BUDGETS["jobs"]) if database.POOL_BUDGETS["jobs"] > 0 else workers
+        self.queue_size = queue_size
+        self.directory = directory
+        self._queue = None
+        self._tasks = []
+
+    async def _start(self, db):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Jobs queued or running in a process that has since exited will never finish
+        r = await db.execute(text("SELECT DISTINCT owner_pid FROM export_jobs WHERE status IN ('queued', 'running')"))
+        dead = [pid for (pid,) in r.fetchall() if pid is not None and not _pid_alive(pid)]
+        if dead:
+            await db.execute(text("""
+                UPDATE export_jobs SET status = 'failed', error = 'Interrupted by a restart', finished_at = NOW()
+                WHERE status IN ('queued', 'running') AND owner_pid = ANY(:pids)
+            """), {"pids": dead})
+            await db.commit()
+
+    async def fingerprint(self, db, kind, fmt, tables):
+        r = await db.execute(text("SELECT table_name, version FROM table_data_versions(CAST(:t AS text[]))"), {"t": tables})
+        versions = dict(r.fetchall())
+        key = "|".join([kind, fmt] + [f"{t}={versions.get(t, 0)}" for t in sorted(tables)])
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def path(self, job):
+        return self.directory / job["file_name"]
+
+    async def get(self, db, job_id):
+        r = await db.execute(text(f"SELECT {', '.join(JOB_KEYS)} FROM export_jobs WHERE id = CAST(:id AS uuid)"), {"id": job_id})
+        row = r.fetchone()
+        return serialize_row(row, JOB_KEYS) if row else None
+
+    async def list(self, db, limit=50):
+        r = await db.execute(text(f"SELECT {', '.join(JOB_KEYS)} FROM export_jobs ORDER BY created_at DESC LIMIT :limit"), {"limit": limit})
+        return [job_out(serialize_row(row, JOB_KEYS)) for row in r.fetchall()]
+
+    async def submit(self, db, kind, fmt, definition):
+        """Returns (job, queued): an existing job for the same data is returned instead of queueing another."""
+        if self._queue is None:
+            await self._start(db)
+        fingerprint = await self.fingerprint(db, kind, fmt, definition.tables)
+        r = await db.execute(text(f"""
+            SELECT {', '.join(JOB_KEYS)} FROM export_jobs
+            WHERE kind = :kind AND format = :fmt AND fingerprint = :fp AND status = ANY(:statuses)
+              AND NOT ({STALE_JOB})
+            ORDER BY created_at DESC LIMIT 1
+        """), {"kind": kind, "fmt": fmt, "fp": fingerprint, "statuses": list(ACTIVE_STATUSES),
+              "stale": EXPORT_STALE_SECONDS})
+        row = r.fetchone()
+        if row:
+            job = serialize_row(row, JOB_KEYS)
+            if job["status"] != "completed" or self.path(job).exists():
+                return job, False
+        if self._queue.full():
+            raise ExportQueueFull()
+        suffix = EXPORT_FORMATS[fmt][0]
+        r = await db.execute(text(f"""
+            INSERT INTO export_jobs (kind, format, fingerprint, file_name, owner_pid)
+            VALUES (:kind, :fmt, :fp, :file, :pid) RETURNING {', '.join(JOB_KEYS)}
+        """), {"kind": kind, "fmt": fmt, "fp": fingerprint, "file": f"{kind}-{fingerprint[:16]}{suffix}", "pid": os.getpid()})
+        job = serialize_row(r.fetchone(), JOB_KEYS)
+        await db.commit()
+        self._queue.put_nowait((job, definition))
+        return job, True
+
+    async def _worker(self):
+        while True:
+            job, definition = await self._queue.get()
+            try:
+                await self._run(job, definition)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Export job %s crashed", job["id"])
+                await self._fail(job, e)
+            finally:
+                self._queue.task_done()
+
+    async def _fail(self, job, error):
+        # Own unbudgeted session: the job's may be broken, or never got a slot
+        session = database.LazySession()
+        try:
+            await session.execute(text("""
+                UPDATE export_jobs SET status = 'failed', error = :error, finished_at = NOW()
+                WHERE id = CAST(:id AS uuid) AND status IN ('queued', 'running')
+            """), {"id": job["id"], "error": str(error)[:2000]})
+            await session.commit()
+        except Exception:
+            logger.exception("Could not mark export job %s failed", job["id"])
+        finally:
+            await session.close()
+
+    async def _run(self, job, definition):
+        session = database.LazySession("jobs")
+        path = self.path(job)
+        tmp = path.with_name(f"{path.name}.{job['id']}.tmp")
+        started = time.perf_counter()
+        try:
+            r = await session.execute(text("""
+                UPDATE export_jobs SET status = 'running', started_at = NOW() WHERE id = CAST(:id AS uuid) AND status = 'queued'
+            """), {"id": job["id"]})
+            await session.commit()
+            if not r.rowcount:
+                return  # given up on as stale while it waited in the queue
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            opener = gzip.open if job["format"] == "gzip" else open
+            handle = await asyncio.to_thread(opener, tmp, "wt", newline="")
+            rows = 0
+            try:
+                await asyncio.to_thread(_write_rows, handle, [definition.headers])
+                result = await session.stream(text(definition.sql))
+                async for chunk in result.partitions(EXPORT_FETCH_ROWS):
+                    lines = [definition.row(r) for r in chunk] if definition.row else chunk
+                    await asyncio.to_thread(_write_rows, handle, lines)
+                    rows += len(chunk)
+            finally:
+                await asyncio.to_thread(handle.close)
+            await session.rollback()  # ends the read transaction and its cursor
+            os.replace(tmp, path)
+
+            await session.execute(text("""
+                UPDATE export_jobs SET status = 'completed', row_count = :rows, byte_size = :size, finished_at = NOW()
+                WHERE id = CAST(:id AS uuid)
+            """), {"id": job["id"], "rows": rows, "size": path.stat().st_size})
+            await session.commit()
+            logger.info("Export %s (%s, %s) wrote %s rows in %.0fms", job["id"], job["kind"], job["format"],
+                        rows, (time.perf_counter() - started) * 1000)
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            await self._fail(job, e)
+            logger.warning("Export %s failed: %s", job["id"], e)
+        finally:
+            await session.close()
+
+    def sweep(self):
+        """Delete files older than EXPORT_FILE_TTL; jobs pointing at them are rebuilt on the next request."""
+        if not self.directory.exists():
+            return 0
+        cutoff = time.time() - EXPORT_FILE_TTL
+        removed = 0
+        for f in self.directory.iterdir():
+            if f.is_file() and f.stat().st_mtime < cutoff:
+                f.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    async def fail_stale(self):
+        """Mark jobs stuck in queued/running past EXPORT_STALE_SECONDS as failed; returns how many."""
+        session = database.LazySession()
+        try:
+            r = await session.execute(text(f"""
+                UPDATE export_jobs SET status = 'failed', error = 'Stalled', finished_at = NOW() WHERE {STALE_JOB}
+            """), {"stale": EXPORT_STALE_SECONDS})
+            await session.commit()
+            return r.rowcount
+        finally:
+            await session.close()
+
+    async def compact_versions(self):
+        """Fold committed data_version_log rows into data_versions; returns how many."""
+        session = database.LazySession()
+        try:
+            r = await session.execute(text("SELECT compact_data_versions()"))
+            await session.commit()
+            return r.scalar()
+        finally:
+            await session.close()
+
+    async def sweep_loop(self, interval=EXPORT_SWEEP_INTERVAL):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                stale = await self.fail_stale()
+                if removed or stale:
+                    logger.info("Export sweep: %s expired files removed, %s stalled jobs failed", removed, stale)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Export sweep failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def compact_loop(self, interval=EXPORT_COMPACT_INTERVAL):
+        while True:
+            try:
+                await self.compact_versions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change counter compaction failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def stats(self):
+        return {"workers": len(self._tasks), "queued": self._queue.qsize() if self._queue else 0, "queue_size": self.queue_size}
+
+
+manager = ExportJobManager()
+
+
+# ------------------------------------------------------------
+# Downloads with Range / If-Range / If-None-Match
+# ------------------------------------------------------------
+def _parse_range(header, size):
+    """(start, end) for a single 'bytes=' range; 'ignore' for anything we do not serve partially; None if unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return "ignore"
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep:
+            return "ignore"
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        if last and int(last) < start:
+            return "ignore"  # last-pos before first-pos is an invalid range-spec, not an unsatisfiable one
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return "ignore"
+    if start >= size:
+        return None
+    return start, end
+
+
+def _iter_file(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(path, etag, filename, media_type, range_header=None, if_range=None, if_none_match=None):
+    size = path.stat().st_size
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Disposition": f"attachment; filename={filename}"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    start, end, status = 0, size - 1, 200
+    # If-Range: serve the range only if the client's copy is still this file
+    if range_header and (if_range is None or if_range.strip() == etag):
+        parsed = _parse_range(range_header, size)
+        if parsed is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if parsed != "ignore":
+            start, end = parsed
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_file(path, start, end), status_code=status, media_type=media_type, headers=headers)
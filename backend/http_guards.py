@@ -0,0 +1,222 @@
+"""
+AMARA ERP/MIS - HTTP Guards
+ASGI middleware protecting the database from abandoned and bursty requests.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class CancelOnDisconnectMiddleware:
+    """
+    Cancel GET handlers whose client has gone away. Cancelling the task
+    cancels the in-flight asyncpg query, which sends a cancel request to
+    Postgres instead of letting an abandoned export run to completion.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+
+        messages = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def pump():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        pump_task = asyncio.ensure_future(pump())
+        app_task = asyncio.ensure_future(self.app(scope, messages.get, send))
+        watch_task = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait({app_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not app_task.done():
+                logger.info("Client disconnected, cancelling %s", scope["path"])
+                app_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await app_task
+                return
+            return app_task.result()
+        finally:
+            for task in (pump_task, watch_task, app_task):
+                if not task.done():
+                    task.cancel()
+
+
+# (path pattern, endpoint class); unmatched paths are not admission-controlled
+ADMISSION_RULES = [
+    (r"^/api/export/", "export"),
+    (r"^/api/(er-diagram|schema)$", "analytics"),
+    (r"^/api/(analytics|qc/analytics)/", "analytics"),
+]
+
+# concurrency: requests running at once; queue: requests allowed to wait for a slot;
+# rate/burst: per-client token bucket (tokens per second, bucket size)
+ADMISSION_LIMITS = {
+    "export": {
+        "concurrency": int(os.environ.get("ADMISSION_EXPORT_CONCURRENCY", "2")),
+        "queue": int(os.environ.get("ADMISSION_EXPORT_QUEUE", "4")),
+        "rate": float(os.environ.get("ADMISSION_EXPORT_RATE", "0.2")),
+        "burst": int(os.environ.get("ADMISSION_EXPORT_BURST", "3")),
+    },
+    "analytics": {
+        "concurrency": int(os.environ.get("ADMISSION_ANALYTICS_CONCURRENCY", "4")),
+        "queue": int(os.environ.get("ADMISSION_ANALYTICS_QUEUE", "8")),
+        "rate": float(os.environ.get("ADMISSION_ANALYTICS_RATE", "1")),
+        "burst": int(os.environ.get("ADMISSION_ANALYTICS_BURST", "10")),
+    },
+}
+QUEUE_WAIT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_WAIT_SECONDS", "5"))
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consume a token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else QUEUE_WAIT_SECONDS
+
+
+class EndpointClass:
+    def __init__(self, name, concurrency, queue, rate, burst):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue
+        self.rate = rate
+        self.burst = burst
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.buckets = OrderedDict()
+        self.running = 0
+        self.waiting = 0
+        self.counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self.wait_seconds = 0.0
+
+    def bucket_for(self, client):
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+            while len(self.buckets) > MAX_TRACKED_CLIENTS:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(client)
+        return bucket
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency, "queue_limit": self.queue_limit,
+            "rate_per_second": self.rate, "burst": self.burst,
+            "running": self.running, "waiting": self.waiting,
+            "tracked_clients": len(self.buckets), **self.counters,
+            "avg_queue_wait_ms": round(1000 * self.wait_seconds / self.counters["queued"], 2) if self.counters["queued"] else 0.0,
+        }
+
+
+class AdmissionController:
+    def __init__(self, rules=ADMISSION_RULES, limits=ADMISSION_LIMITS):
+        self.rules = [(re.compile(p), name) for p, name in rules]
+        self.classes = {name: EndpointClass(name, **cfg) for name, cfg in limits.items()}
+        self.enabled = os.environ.get("ADMISSION_CONTROL_ENABLED", "true").lower() != "false"
+
+    def match(self, path):
+        for pattern, name in self.rules:
+            if pattern.match(path):
+                return self.classes.get(name)
+        return None
+
+    def stats(self):
+        return {"enabled": self.enabled, "classes": {name: c.stats() for name, c in self.classes.items()}}
+
+
+admission = AdmissionController()
+
+
+def _client_key(scope):
+    # The peer address; uvicorn's proxy_headers has already replaced it with the
+    # X-Forwarded-For client when the request came through a trusted proxy
+    # (FORWARDED_ALLOW_IPS), and a client-supplied header is never trusted here
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """
+    Admit heavy endpoint classes through a per-client token bucket, then a
+    concurrency semaphore with a bounded wait queue. Over-rate clients get 429,
+    a full or stalled queue gets 503; both carry Retry-After.
+    """
+
+    def __init__(self, app, controller=admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            return await self.app(scope, receive, send)
+        ec = self.controller.match(scope["path"])
+        if ec is None:
+            return await self.app(scope, receive, send)
+
+        retry_after = ec.bucket_for(_client_key(scope)).take()
+        if retry_after:
+            ec.counters["rate_limited"] += 1
+            return await _reject(send, 429, f"Rate limit exceeded for {ec.name} endpoints", retry_after)
+
+        if ec.semaphore.locked():
+            if ec.waiting >= ec.queue_limit:
+                ec.counters["queue_full"] += 1
+                return await _reject(send, 503, f"Too many concurrent {ec.name} requests", QUEUE_WAIT_SECONDS)
+            ec.waiting += 1
+            ec.counters["queued"] += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(ec.semaphore.acquire(), QUEUE_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                ec.counters["queue_timeout"] += 1
+                return await _reject(send, 503, f"Too many concurrent {ec.name} requests", QUEUE_WAIT_SECONDS)
+            finally:
+                ec.waiting -= 1
+                ec.wait_seconds += time.monotonic() - started
+        else:
+            await ec.semaphore.acquire()
+
+        ec.counters["admitted"] += 1
+        ec.running += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ec.running -= 1
+            ec.semaphore.release()
@@ -0,0 +1,440 @@
+"""
+AMARA ERP/MIS - Write-Behind Ingestion for QC and Production Events
+With INGEST_WRITE_BEHIND=true, POST /api/qc-logs and POST /api/production
+validate the body, append the row to a local write-ahead log, queue it and
+answer 202 with the new row's id. One flusher task per process writes the queue
+with a single multi-row INSERT per table every INGEST_FLUSH_MS or
+INGEST_FLUSH_ROWS rows, so a burst of inspections holds one pooled connection
+instead of one per request.
+
+A 202 is sent only after the row's WAL line is fsynced; concurrent requests
+share one fsync. WAL segments are truncated or deleted once every row in them
+is committed, and on startup any segment not locked by a live process is
+replayed. Ids and timestamps are fixed at enqueue time and inserts use
+ON CONFLICT DO NOTHING, so replaying rows that were already written is harmless.
+
+Backpressure: at most INGEST_QUEUE_SIZE rows are accepted but not yet written;
+further requests wait up to INGEST_ENQUEUE_WAIT_SECONDS for room and then get
+503 with Retry-After. Rows the database refuses (unknown job card, failed
+checks) are split out of their batch and recorded in ingest_rejections
+(migration 020). GET /api/ingest/{id} answers from any worker: rows still in a
+WAL segment are queued, then written or rejected once in the database.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+import database
+from common import data_refused
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+INGEST_WRITE_BEHIND = os.environ.get("INGEST_WRITE_BEHIND", "false").lower() == "true"
+INGEST_WAL_DIR = Path(os.environ.get("INGEST_WAL_DIR", ROOT_DIR / "ingest_wal"))
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "5000"))
+INGEST_FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_MS = float(os.environ.get("INGEST_FLUSH_MS", "20"))
+INGEST_ENQUEUE_WAIT_SECONDS = float(os.environ.get("INGEST_ENQUEUE_WAIT_SECONDS", "1"))
+INGEST_WAL_SEGMENT_BYTES = int(os.environ.get("INGEST_WAL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+INGEST_DRAIN_SECONDS = float(os.environ.get("INGEST_DRAIN_SECONDS", "10"))
+RETRY_AFTER_SECONDS = int(os.environ.get("DB_RETRY_AFTER_SECONDS", "5"))
+MAX_RETRY_DELAY = 30
+
+
+class IngestTable(NamedTuple):
+    columns: List[Tuple[str, str]]  # (column, Postgres type)
+
+    def insert_sql(self, table):
+        names = ", ".join(c for c, _ in self.columns)
+        arrays = ", ".join(f"CAST(:{c} AS {t}[])" for c, t in self.columns)
+        return f"INSERT INTO {table} ({names}) SELECT * FROM unnest({arrays}) ON CONFLICT DO NOTHING"
+
+    def params(self, rows):
+        return {c: [_decode(row.get(c), t) for row in rows] for c, t in self.columns}
+
+
+REJECT_SQL = """
+    INSERT INTO ingest_rejections (id, table_name, error, row_data)
+    VALUES (CAST(:id AS uuid), :table, :error, CAST(:row AS jsonb))
+    ON CONFLICT (id) DO NOTHING
+"""
+
+INGEST_TABLES = {
+    "qc_logs": IngestTable([
+        ("id", "uuid"), ("job_card_id", "uuid"), ("inspected_by", "uuid"), ("qty_passed", "int"),
+        ("qty_failed", "int"), ("defect_reason", "text"), ("defect_category", "varchar"), ("notes", "text"),
+        ("inspection_date", "timestamptz"),
+    ]),
+    "production": IngestTable([
+        ("id", "uuid"), ("job_card_id", "uuid"), ("material_assigned", "varchar"),
+        ("material_weight_grams", "float8"), ("material_cost", "float8"), ("production_date", "date"), ("notes", "text"),
+    ]),
+}
+
+
+def _decode(value, pg_type):
+    """WAL (JSON) value -> bind value for the column's array type."""
+    if value is None:
+        return None
+    if pg_type == "timestamptz":
+        return datetime.fromisoformat(value)
+    if pg_type == "date":
+        return date.fromisoformat(value)
+    return value
+
+
+class IngestQueueFull(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Ingestion queue is full, retry later",
+                         headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+# ------------------------------------------------------------
+# Write-ahead log
+# ------------------------------------------------------------
+class WriteAheadLog:
+    """
+    Append-only JSON-lines segments, one writer per process. Each segment is
+    flock'ed while open, which is how replay tells orphans from live files.
+    """
+
+    def __init__(self, directory=INGEST_WAL_DIR, segment_bytes=INGEST_WAL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._handles = {}  # segment path -> open file
+        self._outstanding = defaultdict(int)  # segment path -> rows not yet committed
+        self._current = None
+        self._sync_future = None
+        self._syncing = 0
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._rotate()
+
+    def _rotate(self):
+        path = self.directory / f"{os.getpid()}-{time.time_ns()}.wal"
+        handle = open(path, "ab")
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._handles[path] = handle
+        self._current = path
+
+    async def append(self, record):
+        """Write one record and wait for the group fsync covering it; returns its segment."""
+        if self._handles[self._current].tell() >= self.segment_bytes and self._idle():
+            self._rotate()
+        segment = self._current
+        handle = self._handles[segment]
+        handle.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self._outstanding[segment] += 1
+        if self._sync_future is None:
+            self._sync_future = asyncio.get_running_loop().create_future()
+            asyncio.create_task(self._sync(handle))
+        await asyncio.shield(self._sync_future)
+        return segment
+
+    async def _sync(self, handle):
+        await asyncio.sleep(0)  # let appends from other requests in this loop iteration join
+        future, self._sync_future = self._sync_future, None
+        self._syncing += 1
+        try:
+            handle.flush()
+            await asyncio.to_thread(os.fsync, handle.fileno())
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._syncing -= 1
+
+    def _idle(self):
+        # No fsync scheduled or running, so the current handle may be swapped or truncated
+        return self._sync_future is None and not self._syncing
+
+    def ack(self, segment, count):
+        """Rows of `segment` are committed; drop drained segments and truncate the current one once empty."""
+        self._outstanding[segment] -= count
+        if not self._idle():
+            return
+        for path in [p for p, n in self._outstanding.items() if n <= 0]:
+            handle = self._handles[path]
+            if path == self._current:
+                handle.flush()
+                handle.truncate(0)
+                handle.seek(0)
+            else:
+                handle.close()
+                path.unlink(missing_ok=True)
+                del self._handles[path], self._outstanding[path]
+
+    def close(self):
+        for segment, handle in list(self._handles.items()):
+            handle.close()
+            if self._outstanding[segment] <= 0:
+                segment.unlink(missing_ok=True)
+        self._handles.clear()
+        self._outstanding.clear()
+
+    def size(self):
+        return sum(h.tell() for h in self._handles.values())
+
+    def contains(self, row_id):
+        """
+        Whether a segment of another process, live or orphaned, still holds
+        row_id. Rows of this process's own segments are tracked in memory by
+        IngestWriter, so those are not read. Blocking; run it in a thread.
+        """
+        needle = f'"id":"{row_id}"'.encode()
+        for path in self.directory.glob("*.wal"):
+            if path in self._handles:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                        if m.find(needle) >= 0:
+                            return True
+            except FileNotFoundError:
+                continue  # drained and deleted meanwhile
+        return False
+
+    def orphans(self):
+        """(path, open locked handle) for every segment no live process holds."""
+        for path in sorted(self.directory.glob("*.wal")):
+            if path in self._handles:
+                continue
+            handle = open(path, "rb")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            yield path, handle
+
+
+def read_segment(handle):
+    records = []
+    for line in handle:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break  # torn last line from a crash mid-append; never acknowledged
+    return records
+
+
+# ------------------------------------------------------------
+# Queue and flusher
+# ------------------------------------------------------------
+class IngestWriter:
+    def __init__(self, queue_size=INGEST_QUEUE_SIZE, flush_rows=INGEST_FLUSH_ROWS, flush_ms=INGEST_FLUSH_MS,
+                 wal=None):
+        self.queue_size = queue_size
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.wal = wal or WriteAheadLog()
+        self._queue = None
+        self._slots = None
+        self._task = None
+        self._pending = {}  # id -> table, accepted but not yet committed
+        self.stats = {"accepted": 0, "written": 0, "rejected": 0, "batches": 0, "replayed": 0,
+                      "queue_full": 0, "last_batch_rows": 0, "last_batch_ms": None}
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def start(self):
+        self.wal.open()
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_seconds=INGEST_DRAIN_SECONDS):
+        if self._task is None:
+            return
+        task, self._task = self._task, None  # new requests go straight to the database from here on
+        deadline = time.monotonic() + drain_seconds
+        while self._pending and time.monotonic() < deadline and not task.done():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if self._pending:
+            logger.warning("Ingestion stopped with %s rows unwritten; they stay in the WAL for replay", len(self._pending))
+        self.wal.close()
+
+    async def enqueue(self, table, row):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), INGEST_ENQUEUE_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            self.stats["queue_full"] += 1
+            raise IngestQueueFull()
+        try:
+            # Shielded: a client disconnect must not leave a logged row out of the queue
+            segment = await asyncio.shield(self.wal.append({"table": table, "row": row}))
+        except Exception:
+            self._slots.release()
+            raise
+        self._pending[row["id"]] = table
+        self._queue.put_nowait((table, row, segment))
+        self.stats["accepted"] += 1
+
+    def status(self, row_id):
+        if row_id in self._pending:
+            return {"id": row_id, "table": self._pending[row_id], "status": "queued"}
+        return None
+
+    def info(self):
+        return {"enabled": self.running, "queued": len(self._pending), "queue_size": self.queue_size,
+                "flush_rows": self.flush_rows, "flush_ms": self.flush_ms, "wal_bytes": self.wal.size() if self.running else 0,
+                **self.stats}
+
+    async def _run(self):
+        await self._replay()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_ms / 1000
+            while len(batch) < self.flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        rows = defaultdict(list)
+        for table, row, _ in batch:
+            rows[table].append(row)
+        started = time.perf_counter()
+        rejected = await self._write_with_retry(rows)
+        self.stats["batches"] += 1
+        self.stats["written"] += len(batch) - len(rejected)
+        self.stats["last_batch_rows"] = len(batch)
+        self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        by_segment = defaultdict(int)
+        for _, row, segment in batch:
+            self._pending.pop(row["id"], None)
+            by_segment[segment] += 1
+        for segment, count in by_segment.items():
+            self.wal.ack(segment, count)
+        for _ in batch:
+            self._slots.release()
+
+    async def _write_with_retry(self, rows):
+        """Write until the database answers; transient failures keep the batch queued behind a backoff."""
+        delay = 0.5
+        while True:
+            try:
+                return await write_rows(rows, on_reject=self._reject)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Ingestion flush failed, retrying in %ss: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _reject(self, table, row, error):
+        self.stats["rejected"] += 1
+        logger.warning("Ingestion rejected %s row %s: %s", table, row["id"], error)
+
+    async def _replay(self):
+        """Write segments left by processes that exited; a failing segment stays for the next start."""
+        for path, handle in self.wal.orphans():
+            try:
+                records = read_segment(handle)
+                rows = defaultdict(list)
+                for record in records:
+                    rows[record["table"]].append(record["row"])
+                for table, table_rows in rows.items():
+                    for i in range(0, len(table_rows), self.flush_rows):
+                        await write_rows({table: table_rows[i:i + self.flush_rows]}, on_reject=self._reject)
+                path.unlink(missing_ok=True)
+                self.stats["replayed"] += len(records)
+                if records:
+                    logger.info("Replayed %s ingestion rows from %s", len(records), path.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Ingestion WAL replay of %s failed: %s", path.name, e)
+            finally:
+                handle.close()
+
+
+async def write_rows(rows, on_reject):
+    """
+    One multi-row INSERT per table in one transaction. If the database refuses
+    the data, rows are retried one at a time; the ones that still fail are
+    recorded in ingest_rejections and passed to on_reject(table, row, error).
+    Returns the rejected rows.
+    """
+    session = database.LazySession()
+    try:
+        try:
+            for table, table_rows in rows.items():
+                spec = INGEST_TABLES[table]
+                await session.execute(text(spec.insert_sql(table)), spec.params(table_rows))
+            await session.commit()
+            return []
+        except DBAPIError as e:
+            await session.rollback()
+            if not data_refused(e):
+                raise
+        rejected = []
+        for table, table_rows in rows.items():
+            spec = INGEST_TABLES[table]
+            for row in table_rows:
+                try:
+                    await session.execute(text(spec.insert_sql(table)), spec.params([row]))
+                    await session.commit()
+                except DBAPIError as e:
+                    await session.rollback()
+                    if not data_refused(e):
+                        raise
+                    error = str(e.orig.__cause__ or e.orig)
+                    await session.execute(text(REJECT_SQL), {"id": row["id"], "table": table, "error": error,
+                                                             "row": json.dumps(row)})
+                    await session.commit()
+                    on_reject(table, row, error)
+                    rejected.append(row)
+        return rejected
+    finally:
+        await session.close()
+
+
+writer = IngestWriter()
+
+
+async def accept(table, row):
+    """Queue `row` (ids and timestamps already set) and answer 202; 400 for malformed ids."""
+    for column, pg_type in INGEST_TABLES[table].columns:
+        if pg_type == "uuid" and row.get(column) is not None:
+            try:
+                uuid.UUID(row[column])
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{column} is not a valid id")
+    await writer.enqueue(table, row)
+    return JSONResponse(status_code=202, content={"id": row["id"], "status": "queued"},
+                        headers={"Location": f"/api/ingest/{row['id']}"})
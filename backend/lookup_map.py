@@ -0,0 +1,87 @@
+"""
+AMARA ERP/MIS - Lookup Map
+In-memory copy of the seven SKU lookup tables, so product payloads can carry
+foreign-key ids and resolve codes/names without joining every lookup.
+"""
+import asyncio
+import os
+import time
+from sqlalchemy import text
+from response_cache import response_cache
+
+LOOKUP_TABLES = {
+    "face_value": "sku_face_value", "category": "sku_category",
+    "material": "sku_material", "motif": "sku_motif",
+    "finding": "sku_finding", "locking": "sku_locking", "size": "sku_size",
+}
+
+# Lookup key -> product foreign-key column
+PRODUCT_LOOKUP_FIELDS = {key: f"{key}_id" for key in LOOKUP_TABLES}
+
+LOOKUP_MAP_TTL = float(os.environ.get("LOOKUP_MAP_TTL", "300"))
+LOOKUPS_TAG = "lookups"
+SHARED_KEY = "lookup_map"
+
+
+class LookupMap:
+    def __init__(self, ttl=LOOKUP_MAP_TTL):
+        self._lock = asyncio.Lock()
+        self._ttl = ttl
+        self._loaded_at = None
+        self._version = None
+        self._entries = {key: {} for key in LOOKUP_TABLES}  # key -> id -> {"code", "name"}
+
+    def _fresh(self, version):
+        return (self._loaded_at is not None and version == self._version
+                and time.monotonic() - self._loaded_at < self._ttl)
+
+    async def ensure_loaded(self, db):
+        # The "lookups" tag version lives in the response cache backend, so with the
+        # shared cache channel a lookup write in any worker reloads every worker
+        (version,) = await response_cache.backend.versions([LOOKUPS_TAG])
+        if self._fresh(version):
+            return
+        async with self._lock:
+            if self._fresh(version):
+                return
+            shared = await response_cache.backend.get(SHARED_KEY)
+            if shared is not None and shared["versions"] == [version]:
+                entries = shared["entries"]
+            else:
+                r = await db.execute(text(" UNION ALL ".join(
+                    f"SELECT '{key}', id, code, name FROM {tbl}" for key, tbl in LOOKUP_TABLES.items()
+                )))
+                entries = {key: {} for key in LOOKUP_TABLES}
+                for key, id_, code, name in r.fetchall():
+                    entries[key][str(id_)] = {"code": code, "name": name}
+                await response_cache.backend.set(SHARED_KEY, {"entries": entries, "versions": [version],
+                                                              "expires": time.monotonic() + self._ttl})
+            self._entries = entries
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    async def invalidate(self):
+        """Reload on next use in every worker; called by lookup writes."""
+        self._loaded_at = None
+        await response_cache.invalidate(LOOKUPS_TAG)
+
+    def get(self, key, id_):
+        return self._entries[key].get(id_)
+
+    def ids_named(self, key, name):
+        return [id_ for id_, e in self._entries[key].items() if e["name"] == name]
+
+    def for_items(self, items):
+        """Deduplicated {key: {id: {code, name}}} covering the ids referenced by product items."""
+        out = {key: {} for key in LOOKUP_TABLES}
+        for item in items:
+            for key, field in PRODUCT_LOOKUP_FIELDS.items():
+                id_ = item.get(field)
+                if id_ and id_ not in out[key]:
+                    entry = self._entries[key].get(id_)
+                    if entry is not None:
+                        out[key][id_] = entry
+        return out
+
+
+lookup_map = LookupMap()
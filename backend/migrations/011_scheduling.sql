@@ -0,0 +1,15 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 011: Production Scheduling
+-- Artisan capacity and dice assignment for the job card scheduler
+-- ============================================================
+
+-- Units an artisan can finish per working day (NULL = scheduler default)
+ALTER TABLE users ADD COLUMN IF NOT EXISTS daily_capacity INTEGER
+    CHECK (daily_capacity IS NULL OR daily_capacity > 0);
+
+-- Dice chosen for a job card by the scheduler (or by hand)
+ALTER TABLE job_cards ADD COLUMN IF NOT EXISTS assigned_dice_id UUID
+    REFERENCES dices(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_job_cards_dice ON job_cards(assigned_dice_id);
+CREATE INDEX IF NOT EXISTS idx_job_cards_due_date ON job_cards(due_date);
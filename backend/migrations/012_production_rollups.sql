@@ -0,0 +1,205 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 012: Production Material Rollups
+-- Daily material / wastage / cost aggregates maintained by trigger
+-- Artisan and category are resolved from the job card once, when the
+-- row is written, and stored on it; corrections and deletes take the
+-- stored values, so a later reassignment of the card moves nothing.
+-- Rows that leave the table (archival, retention) stay in the rollup,
+-- including through full rebuilds
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS production_daily_rollup (
+    production_date DATE NOT NULL,
+    material VARCHAR(200),
+    artisan_id UUID,
+    category_id UUID,
+    entries INTEGER NOT NULL DEFAULT 0,
+    material_weight_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    wastage_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    material_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE NULLS NOT DISTINCT (production_date, material, artisan_id, category_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_production_rollup_date ON production_daily_rollup(production_date);
+
+-- Attribution stored on each production row; backfilled from the job
+-- card only when the columns are first added
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'production' AND column_name = 'artisan_id') THEN
+        ALTER TABLE production ADD COLUMN artisan_id UUID, ADD COLUMN category_id UUID;
+        UPDATE production pr SET artisan_id = jc.assigned_artisan_id, category_id = p.category_id
+        FROM job_cards jc JOIN products p ON jc.product_id = p.id
+        WHERE pr.job_card_id = jc.id;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION production_attribution_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT jc.assigned_artisan_id, p.category_id
+    INTO NEW.artisan_id, NEW.category_id
+    FROM job_cards jc JOIN products p ON jc.product_id = p.id
+    WHERE jc.id = NEW.job_card_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_production_attribution ON production;
+CREATE TRIGGER trg_production_attribution
+    BEFORE INSERT OR UPDATE OF job_card_id ON production
+    FOR EACH ROW
+    EXECUTE FUNCTION production_attribution_trigger();
+
+-- Totals of rows that left production while staying in the rollup: rows of
+-- deleted or archived job cards (the trigger below) and months detached by
+-- partition retention (partitions.py). rebuild_production_rollup() adds them
+-- to what it aggregates from the live rows. Created with whatever the rollup
+-- then held beyond the live rows, since it is the only record of those
+DO $$
+BEGIN
+    IF to_regclass('production_rollup_retained') IS NOT NULL THEN
+        RETURN;
+    END IF;
+    CREATE TABLE production_rollup_retained (
+        production_date DATE NOT NULL,
+        material VARCHAR(200),
+        artisan_id UUID,
+        category_id UUID,
+        entries INTEGER NOT NULL DEFAULT 0,
+        material_weight_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+        wastage_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+        material_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+        UNIQUE NULLS NOT DISTINCT (production_date, material, artisan_id, category_id)
+    );
+    INSERT INTO production_rollup_retained
+        (production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost)
+    SELECT production_date, material, artisan_id, category_id,
+           SUM(entries), SUM(material_weight_grams), SUM(wastage_grams), SUM(material_cost)
+    FROM (
+        SELECT production_date, material, artisan_id, category_id,
+               entries, material_weight_grams, wastage_grams, material_cost
+        FROM production_daily_rollup
+        UNION ALL
+        SELECT COALESCE(production_date, created_at::date), material_assigned, artisan_id, category_id,
+               -1, -COALESCE(material_weight_grams, 0), -COALESCE(wastage_grams, 0), -COALESCE(material_cost, 0)
+        FROM production
+        WHERE EXISTS (SELECT 1 FROM production_daily_rollup)
+    ) d
+    GROUP BY 1, 2, 3, 4
+    HAVING SUM(entries) <> 0 OR SUM(material_weight_grams) <> 0 OR SUM(wastage_grams) <> 0 OR SUM(material_cost) <> 0;
+END;
+$$;
+
+-- Add one month of production rows (a partition about to be detached) to the retained totals
+CREATE OR REPLACE FUNCTION retain_production_rollup(p_rows REGCLASS)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO production_rollup_retained AS r
+            (production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost)
+         SELECT COALESCE(production_date, created_at::date), material_assigned, artisan_id, category_id, COUNT(*),
+                COALESCE(SUM(material_weight_grams), 0), COALESCE(SUM(wastage_grams), 0), COALESCE(SUM(material_cost), 0)
+         FROM %s
+         GROUP BY 1, 2, 3, 4
+         ON CONFLICT (production_date, material, artisan_id, category_id) DO UPDATE SET
+            entries = r.entries + EXCLUDED.entries,
+            material_weight_grams = r.material_weight_grams + EXCLUDED.material_weight_grams,
+            wastage_grams = r.wastage_grams + EXCLUDED.wastage_grams,
+            material_cost = r.material_cost + EXCLUDED.material_cost', p_rows);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Add (p_sign = 1) or remove (p_sign = -1) one production row from its daily bucket
+CREATE OR REPLACE FUNCTION apply_production_rollup(
+    p_date DATE, p_material VARCHAR, p_artisan_id UUID, p_category_id UUID,
+    p_weight DECIMAL, p_wastage DECIMAL, p_cost DECIMAL, p_sign INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO production_daily_rollup AS r
+        (production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost)
+    VALUES (
+        p_date, p_material, p_artisan_id, p_category_id, p_sign,
+        p_sign * COALESCE(p_weight, 0), p_sign * COALESCE(p_wastage, 0), p_sign * COALESCE(p_cost, 0)
+    )
+    ON CONFLICT (production_date, material, artisan_id, category_id) DO UPDATE SET
+        entries = r.entries + EXCLUDED.entries,
+        material_weight_grams = r.material_weight_grams + EXCLUDED.material_weight_grams,
+        wastage_grams = r.wastage_grams + EXCLUDED.wastage_grams,
+        material_cost = r.material_cost + EXCLUDED.material_cost,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Dates fall back to created_at::date exactly as rebuild_production_rollup() does
+CREATE OR REPLACE FUNCTION production_rollup_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Rows moved out of the DEFAULT partition (migration 015) stay counted
+    IF current_setting('amara.partition_move', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    -- Job card already gone (cascade/archival): keep the history in the rollup,
+    -- and record it as retained so rebuilds keep it too
+    IF TG_OP = 'DELETE' AND NOT EXISTS (SELECT 1 FROM job_cards WHERE id = OLD.job_card_id) THEN
+        INSERT INTO production_rollup_retained AS r
+            (production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost)
+        VALUES (COALESCE(OLD.production_date, OLD.created_at::date), OLD.material_assigned, OLD.artisan_id,
+                OLD.category_id, 1, COALESCE(OLD.material_weight_grams, 0), COALESCE(OLD.wastage_grams, 0),
+                COALESCE(OLD.material_cost, 0))
+        ON CONFLICT (production_date, material, artisan_id, category_id) DO UPDATE SET
+            entries = r.entries + EXCLUDED.entries,
+            material_weight_grams = r.material_weight_grams + EXCLUDED.material_weight_grams,
+            wastage_grams = r.wastage_grams + EXCLUDED.wastage_grams,
+            material_cost = r.material_cost + EXCLUDED.material_cost;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_production_rollup(COALESCE(OLD.production_date, OLD.created_at::date), OLD.material_assigned,
+            OLD.artisan_id, OLD.category_id, OLD.material_weight_grams, OLD.wastage_grams, OLD.material_cost, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_production_rollup(COALESCE(NEW.production_date, NEW.created_at::date), NEW.material_assigned,
+            NEW.artisan_id, NEW.category_id, NEW.material_weight_grams, NEW.wastage_grams, NEW.material_cost, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_production_rollup ON production;
+CREATE TRIGGER trg_production_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF production_date, material_assigned, job_card_id, artisan_id, category_id,
+        material_weight_grams, wastage_grams, material_cost
+    ON production
+    FOR EACH ROW
+    EXECUTE FUNCTION production_rollup_trigger();
+
+-- Full rebuild from the production table plus the retained totals (also
+-- backfills existing rows)
+CREATE OR REPLACE FUNCTION rebuild_production_rollup()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM production_daily_rollup;
+    INSERT INTO production_daily_rollup
+        (production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost)
+    SELECT production_date, material, artisan_id, category_id,
+           SUM(entries), SUM(material_weight_grams), SUM(wastage_grams), SUM(material_cost)
+    FROM (
+        SELECT COALESCE(pr.production_date, pr.created_at::date) AS production_date, pr.material_assigned AS material,
+               pr.artisan_id, pr.category_id, COUNT(*) AS entries,
+               COALESCE(SUM(pr.material_weight_grams), 0) AS material_weight_grams,
+               COALESCE(SUM(pr.wastage_grams), 0) AS wastage_grams, COALESCE(SUM(pr.material_cost), 0) AS material_cost
+        FROM production pr
+        GROUP BY 1, 2, 3, 4
+        UNION ALL
+        SELECT production_date, material, artisan_id, category_id, entries, material_weight_grams, wastage_grams, material_cost
+        FROM production_rollup_retained
+    ) t
+    GROUP BY 1, 2, 3, 4;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_production_rollup();
@@ -0,0 +1,13 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 013: Production Date Backfill
+-- production_date becomes NOT NULL so listings can page on
+-- (production_date, id) with idx_production_date
+-- ============================================================
+
+UPDATE production SET production_date = COALESCE(created_at::date, CURRENT_DATE)
+WHERE production_date IS NULL;
+
+ALTER TABLE production ALTER COLUMN production_date SET NOT NULL;
+
+-- Rows backfilled above were rolled up under their insert date; recompute
+SELECT rebuild_production_rollup();
@@ -0,0 +1,291 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 014: QC Defect Analytics
+-- Defect categories assigned at write time, hourly/daily rollups
+-- of passed/failed quantities maintained by trigger; rows that
+-- leave qc_logs (archival, retention) stay in the rollups, including
+-- through full rebuilds
+-- ============================================================
+
+-- Defect categories with keyword rules (first match by sort_order wins)
+CREATE TABLE IF NOT EXISTS qc_defect_categories (
+    code VARCHAR(30) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    keywords TEXT[] NOT NULL DEFAULT '{}',
+    sort_order INTEGER NOT NULL DEFAULT 100
+);
+
+INSERT INTO qc_defect_categories (code, name, keywords, sort_order) VALUES
+    ('porosity', 'Porosity', ARRAY['porosity', 'porous', 'pinhole', 'pin hole', 'bubble', 'pitting'], 10),
+    ('casting', 'Casting Defect', ARRAY['casting', 'crack', 'broken', 'break', 'shrink', 'incomplete fill'], 20),
+    ('stone', 'Stone Setting', ARRAY['stone', 'setting', 'prong', 'loose', 'missing stone'], 30),
+    ('solder', 'Soldering / Joint', ARRAY['solder', 'joint', 'weld', 'seam'], 40),
+    ('dimension', 'Size / Weight', ARRAY['size', 'dimension', 'thickness', 'weight', 'length', 'uneven'], 50),
+    ('locking', 'Locking / Finding', ARRAY['lock', 'screw', 'clasp', 'hook', 'hinge', 'finding'], 60),
+    ('plating', 'Plating / Tarnish', ARRAY['plating', 'tarnish', 'discolo', 'oxid', 'stain'], 70),
+    ('finish', 'Surface Finish', ARRAY['scratch', 'polish', 'dull', 'finish', 'dent', 'burr', 'rough'], 80),
+    ('other', 'Other', '{}', 900),
+    ('unspecified', 'Unspecified', '{}', 1000)
+ON CONFLICT (code) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION classify_defect_reason(p_reason TEXT, p_qty_failed INTEGER)
+RETURNS VARCHAR AS $$
+    SELECT CASE
+        WHEN NULLIF(TRIM(p_reason), '') IS NULL THEN
+            CASE WHEN p_qty_failed > 0 THEN 'unspecified' END
+        ELSE COALESCE((
+            SELECT c.code FROM qc_defect_categories c
+            WHERE EXISTS (SELECT 1 FROM unnest(c.keywords) k WHERE LOWER(p_reason) LIKE '%' || k || '%')
+            ORDER BY c.sort_order LIMIT 1
+        ), 'other')
+    END;
+$$ LANGUAGE sql STABLE;
+
+ALTER TABLE qc_logs ADD COLUMN IF NOT EXISTS defect_category VARCHAR(30)
+    REFERENCES qc_defect_categories(code) ON DELETE SET NULL;
+
+UPDATE qc_logs SET defect_category = classify_defect_reason(defect_reason, qty_failed)
+WHERE defect_category IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_qc_logs_defect_category ON qc_logs(defect_category);
+CREATE INDEX IF NOT EXISTS idx_qc_logs_inspection_date ON qc_logs(inspection_date);
+
+-- Classify on insert unless the caller chose a category; re-classify when the reason is edited
+CREATE OR REPLACE FUNCTION qc_classify_defect_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.defect_category IS NULL THEN
+        NEW.defect_category := classify_defect_reason(NEW.defect_reason, NEW.qty_failed);
+    ELSIF TG_OP = 'UPDATE' AND NEW.defect_category IS NOT DISTINCT FROM OLD.defect_category THEN
+        NEW.defect_category := classify_defect_reason(NEW.defect_reason, NEW.qty_failed);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_qc_classify_defect ON qc_logs;
+CREATE TRIGGER trg_qc_classify_defect
+    BEFORE INSERT OR UPDATE OF defect_reason, qty_failed ON qc_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION qc_classify_defect_trigger();
+
+-- ------------------------------------------------------------
+-- Rollups: product and artisan are resolved from the job card once,
+-- when the row is written, and stored on it; corrections and deletes
+-- take the stored values. Buckets are UTC hours and days.
+-- ------------------------------------------------------------
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'qc_logs' AND column_name = 'artisan_id') THEN
+        ALTER TABLE qc_logs ADD COLUMN product_id UUID, ADD COLUMN artisan_id UUID;
+        UPDATE qc_logs q SET product_id = jc.product_id, artisan_id = jc.assigned_artisan_id
+        FROM job_cards jc WHERE q.job_card_id = jc.id;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION qc_attribution_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT product_id, assigned_artisan_id INTO NEW.product_id, NEW.artisan_id
+    FROM job_cards WHERE id = NEW.job_card_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_qc_attribution ON qc_logs;
+CREATE TRIGGER trg_qc_attribution
+    BEFORE INSERT OR UPDATE OF job_card_id ON qc_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION qc_attribution_trigger();
+
+CREATE TABLE IF NOT EXISTS qc_rollup_hourly (
+    bucket TIMESTAMPTZ NOT NULL,
+    job_card_id UUID NOT NULL,
+    product_id UUID,
+    artisan_id UUID,
+    inspected_by UUID,
+    defect_category VARCHAR(30),
+    inspections INTEGER NOT NULL DEFAULT 0,
+    qty_passed BIGINT NOT NULL DEFAULT 0,
+    qty_failed BIGINT NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category)
+);
+
+CREATE TABLE IF NOT EXISTS qc_rollup_daily (
+    bucket DATE NOT NULL,
+    job_card_id UUID NOT NULL,
+    product_id UUID,
+    artisan_id UUID,
+    inspected_by UUID,
+    defect_category VARCHAR(30),
+    inspections INTEGER NOT NULL DEFAULT 0,
+    qty_passed BIGINT NOT NULL DEFAULT 0,
+    qty_failed BIGINT NOT NULL DEFAULT 0,
+    UNIQUE NULLS NOT DISTINCT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_qc_rollup_hourly_bucket ON qc_rollup_hourly(bucket);
+CREATE INDEX IF NOT EXISTS idx_qc_rollup_daily_bucket ON qc_rollup_daily(bucket);
+
+-- Hourly totals of rows that left qc_logs while staying in the rollups: rows
+-- of deleted or archived job cards (the trigger below) and months detached by
+-- partition retention (partitions.py). rebuild_qc_rollups() adds them to what
+-- it aggregates from the live rows. Created with whatever the hourly rollup
+-- then held beyond the live rows, since it is the only record of those
+DO $$
+BEGIN
+    IF to_regclass('qc_rollup_retained') IS NOT NULL THEN
+        RETURN;
+    END IF;
+    CREATE TABLE qc_rollup_retained (
+        bucket TIMESTAMPTZ NOT NULL,
+        job_card_id UUID NOT NULL,
+        product_id UUID,
+        artisan_id UUID,
+        inspected_by UUID,
+        defect_category VARCHAR(30),
+        inspections INTEGER NOT NULL DEFAULT 0,
+        qty_passed BIGINT NOT NULL DEFAULT 0,
+        qty_failed BIGINT NOT NULL DEFAULT 0,
+        UNIQUE NULLS NOT DISTINCT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category)
+    );
+    INSERT INTO qc_rollup_retained
+        (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+    SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category,
+           SUM(inspections), SUM(qty_passed), SUM(qty_failed)
+    FROM (
+        SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category,
+               inspections, qty_passed, qty_failed
+        FROM qc_rollup_hourly
+        UNION ALL
+        SELECT date_trunc('hour', COALESCE(inspection_date, created_at) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               job_card_id, product_id, artisan_id, inspected_by, defect_category, -1, -qty_passed, -qty_failed
+        FROM qc_logs
+        WHERE EXISTS (SELECT 1 FROM qc_rollup_hourly)
+    ) d
+    GROUP BY 1, 2, 3, 4, 5, 6
+    HAVING SUM(inspections) <> 0 OR SUM(qty_passed) <> 0 OR SUM(qty_failed) <> 0;
+END;
+$$;
+
+-- Add one month of QC rows (a partition about to be detached) to the retained totals
+CREATE OR REPLACE FUNCTION retain_qc_rollup(p_rows REGCLASS)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO qc_rollup_retained AS r
+            (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+         SELECT date_trunc(''hour'', COALESCE(inspection_date, created_at) AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC'',
+                job_card_id, product_id, artisan_id, inspected_by, defect_category,
+                COUNT(*), SUM(qty_passed), SUM(qty_failed)
+         FROM %s
+         GROUP BY 1, 2, 3, 4, 5, 6
+         ON CONFLICT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category) DO UPDATE SET
+            inspections = r.inspections + EXCLUDED.inspections,
+            qty_passed = r.qty_passed + EXCLUDED.qty_passed,
+            qty_failed = r.qty_failed + EXCLUDED.qty_failed', p_rows);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_qc_rollup(
+    p_inspected_at TIMESTAMPTZ, p_job_card_id UUID, p_product_id UUID, p_artisan_id UUID,
+    p_inspected_by UUID, p_category VARCHAR, p_passed INTEGER, p_failed INTEGER, p_sign INTEGER
+) RETURNS VOID AS $$
+DECLARE
+    v_utc TIMESTAMP := p_inspected_at AT TIME ZONE 'UTC';
+BEGIN
+    INSERT INTO qc_rollup_hourly AS r
+        (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+    VALUES (date_trunc('hour', v_utc) AT TIME ZONE 'UTC', p_job_card_id, p_product_id, p_artisan_id, p_inspected_by,
+            p_category, p_sign, p_sign * p_passed, p_sign * p_failed)
+    ON CONFLICT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category) DO UPDATE SET
+        inspections = r.inspections + EXCLUDED.inspections,
+        qty_passed = r.qty_passed + EXCLUDED.qty_passed,
+        qty_failed = r.qty_failed + EXCLUDED.qty_failed;
+
+    INSERT INTO qc_rollup_daily AS r
+        (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+    VALUES (v_utc::date, p_job_card_id, p_product_id, p_artisan_id, p_inspected_by, p_category,
+            p_sign, p_sign * p_passed, p_sign * p_failed)
+    ON CONFLICT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category) DO UPDATE SET
+        inspections = r.inspections + EXCLUDED.inspections,
+        qty_passed = r.qty_passed + EXCLUDED.qty_passed,
+        qty_failed = r.qty_failed + EXCLUDED.qty_failed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Times fall back to created_at exactly as rebuild_qc_rollups() does
+CREATE OR REPLACE FUNCTION qc_rollup_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Rows moved out of the DEFAULT partition (migration 015) stay counted
+    IF current_setting('amara.partition_move', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    -- Job card already gone (cascade/archival): keep the history in the rollups,
+    -- and record it as retained so rebuilds keep it too
+    IF TG_OP = 'DELETE' AND NOT EXISTS (SELECT 1 FROM job_cards WHERE id = OLD.job_card_id) THEN
+        INSERT INTO qc_rollup_retained AS r
+            (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+        VALUES (date_trunc('hour', COALESCE(OLD.inspection_date, OLD.created_at) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+                OLD.job_card_id, OLD.product_id, OLD.artisan_id, OLD.inspected_by, OLD.defect_category,
+                1, OLD.qty_passed, OLD.qty_failed)
+        ON CONFLICT (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category) DO UPDATE SET
+            inspections = r.inspections + EXCLUDED.inspections,
+            qty_passed = r.qty_passed + EXCLUDED.qty_passed,
+            qty_failed = r.qty_failed + EXCLUDED.qty_failed;
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_qc_rollup(COALESCE(OLD.inspection_date, OLD.created_at), OLD.job_card_id, OLD.product_id,
+            OLD.artisan_id, OLD.inspected_by, OLD.defect_category, OLD.qty_passed, OLD.qty_failed, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_qc_rollup(COALESCE(NEW.inspection_date, NEW.created_at), NEW.job_card_id, NEW.product_id,
+            NEW.artisan_id, NEW.inspected_by, NEW.defect_category, NEW.qty_passed, NEW.qty_failed, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- defect_reason is listed because a category set by the BEFORE trigger does not fire UPDATE OF defect_category
+DROP TRIGGER IF EXISTS trg_qc_rollup ON qc_logs;
+CREATE TRIGGER trg_qc_rollup
+    AFTER INSERT OR DELETE OR UPDATE OF inspection_date, job_card_id, product_id, artisan_id, inspected_by,
+        defect_reason, defect_category, qty_passed, qty_failed
+    ON qc_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION qc_rollup_trigger();
+
+-- Full rebuild from qc_logs plus the retained totals (also backfills existing rows)
+CREATE OR REPLACE FUNCTION rebuild_qc_rollups()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM qc_rollup_hourly;
+    DELETE FROM qc_rollup_daily;
+    INSERT INTO qc_rollup_hourly
+        (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+    SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category,
+           SUM(inspections), SUM(qty_passed), SUM(qty_failed)
+    FROM (
+        SELECT date_trunc('hour', COALESCE(q.inspection_date, q.created_at) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+               q.job_card_id, q.product_id, q.artisan_id, q.inspected_by, q.defect_category,
+               COUNT(*) AS inspections, SUM(q.qty_passed) AS qty_passed, SUM(q.qty_failed) AS qty_failed
+        FROM qc_logs q
+        GROUP BY 1, 2, 3, 4, 5, 6
+        UNION ALL
+        SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed
+        FROM qc_rollup_retained
+    ) t
+    GROUP BY 1, 2, 3, 4, 5, 6;
+    INSERT INTO qc_rollup_daily
+        (bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, qty_passed, qty_failed)
+    SELECT (bucket AT TIME ZONE 'UTC')::date, job_card_id, product_id, artisan_id, inspected_by, defect_category,
+           SUM(inspections), SUM(qty_passed), SUM(qty_failed)
+    FROM qc_rollup_hourly
+    GROUP BY 1, 2, 3, 4, 5, 6;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_qc_rollups();
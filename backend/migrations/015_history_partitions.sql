@@ -0,0 +1,223 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 015: Monthly History Partitions
+-- qc_logs (by inspection_date) and production (by production_date)
+-- become range-partitioned by month; partitions.py keeps future
+-- months created and detaches old ones
+-- ============================================================
+
+-- Create the monthly partitions covering p_from..p_to that do not exist yet.
+-- Rows already sitting in the DEFAULT partition for a new month are copied
+-- into a standalone table that is then attached as the month's partition, so
+-- no insert trigger sees them: they keep the attribution, defect category and
+-- costs they were written with. Their delete from the DEFAULT partition runs
+-- with the transaction-local amara.partition_move setting on, which the
+-- rollup and cost triggers (migrations 012, 014, 018) skip and the
+-- append-only audit_log (migration 019) allows
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(p_parent REGCLASS, p_from DATE, p_to DATE)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    v_parent TEXT := p_parent::text;
+    v_key TEXT;
+    v_is_date BOOLEAN;
+    v_default TEXT;
+    v_month DATE := date_trunc('month', p_from)::date;
+    v_name TEXT;
+    v_lo TEXT;
+    v_hi TEXT;
+    v_has_rows BOOLEAN;
+BEGIN
+    SELECT a.attname, a.atttypid = 'date'::regtype INTO v_key, v_is_date
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = p_parent;
+    IF v_key IS NULL THEN
+        RAISE EXCEPTION '% is not a partitioned table', v_parent;
+    END IF;
+
+    SELECT c.relname INTO v_default
+    FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partdefid
+    WHERE pt.partrelid = p_parent;
+
+    WHILE v_month <= p_to LOOP
+        v_name := format('%s_%s', v_parent, to_char(v_month, 'YYYY_MM'));
+        IF to_regclass(v_name) IS NULL THEN
+            -- Month bounds in UTC for timestamptz keys, independent of the session time zone
+            v_lo := CASE WHEN v_is_date THEN v_month::text ELSE v_month::text || ' 00:00:00+00' END;
+            v_hi := CASE WHEN v_is_date THEN (v_month + INTERVAL '1 month')::date::text
+                         ELSE (v_month + INTERVAL '1 month')::date::text || ' 00:00:00+00' END;
+            v_has_rows := FALSE;
+            IF v_default IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                               v_default, v_key, v_lo, v_key, v_hi) INTO v_has_rows;
+            END IF;
+            IF v_has_rows THEN
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, v_parent);
+                EXECUTE format('INSERT INTO %I SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                               v_name, v_default, v_key, v_lo, v_key, v_hi);
+                PERFORM set_config('amara.partition_move', 'on', true);
+                EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L', v_default, v_key, v_lo, v_key, v_hi);
+                PERFORM set_config('amara.partition_move', 'off', true);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               v_parent, v_name, v_lo, v_hi);
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', v_name, v_parent, v_lo, v_hi);
+            END IF;
+            RETURN NEXT v_name;
+        END IF;
+        v_month := (v_month + INTERVAL '1 month')::date;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ------------------------------------------------------------
+-- qc_logs: the primary key must include the partition key, so
+-- inspection_date becomes NOT NULL (backfilled from created_at)
+-- ------------------------------------------------------------
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'qc_logs'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE qc_logs RENAME TO qc_logs_unpartitioned;
+    ALTER INDEX qc_logs_pkey RENAME TO qc_logs_unpartitioned_pkey;
+    DROP INDEX IF EXISTS idx_qc_logs_job_card, idx_qc_logs_inspector,
+        idx_qc_logs_defect_category, idx_qc_logs_inspection_date;
+
+    CREATE TABLE qc_logs (
+        id UUID NOT NULL DEFAULT gen_random_uuid(),
+        job_card_id UUID NOT NULL REFERENCES job_cards(id) ON DELETE CASCADE,
+        inspected_by UUID REFERENCES users(id) ON DELETE SET NULL,
+        qty_passed INTEGER NOT NULL DEFAULT 0 CHECK (qty_passed >= 0),
+        qty_failed INTEGER NOT NULL DEFAULT 0 CHECK (qty_failed >= 0),
+        defect_reason TEXT,
+        inspection_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        notes TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        defect_category VARCHAR(30) REFERENCES qc_defect_categories(code) ON DELETE SET NULL,
+        product_id UUID,
+        artisan_id UUID,
+        PRIMARY KEY (id, inspection_date)
+    ) PARTITION BY RANGE (inspection_date);
+
+    CREATE TABLE qc_logs_default PARTITION OF qc_logs DEFAULT;
+    PERFORM ensure_monthly_partitions('qc_logs',
+        COALESCE((SELECT MIN(COALESCE(inspection_date, created_at))::date FROM qc_logs_unpartitioned), CURRENT_DATE),
+        (CURRENT_DATE + INTERVAL '3 months')::date);
+
+    -- Loaded before the triggers exist: the rollups already contain these rows
+    INSERT INTO qc_logs (id, job_card_id, inspected_by, qty_passed, qty_failed, defect_reason,
+                         inspection_date, notes, created_at, defect_category, product_id, artisan_id)
+    SELECT id, job_card_id, inspected_by, qty_passed, qty_failed, defect_reason,
+           COALESCE(inspection_date, created_at, NOW()), notes, created_at, defect_category, product_id, artisan_id
+    FROM qc_logs_unpartitioned;
+
+    DROP TABLE qc_logs_unpartitioned;
+
+    CREATE INDEX idx_qc_logs_job_card ON qc_logs(job_card_id);
+    CREATE INDEX idx_qc_logs_inspector ON qc_logs(inspected_by);
+    CREATE INDEX idx_qc_logs_defect_category ON qc_logs(defect_category);
+    CREATE INDEX idx_qc_logs_inspection_date ON qc_logs(inspection_date);
+
+    CREATE TRIGGER trg_qc_classify_defect
+        BEFORE INSERT OR UPDATE OF defect_reason, qty_failed ON qc_logs
+        FOR EACH ROW
+        EXECUTE FUNCTION qc_classify_defect_trigger();
+    CREATE TRIGGER trg_qc_attribution
+        BEFORE INSERT OR UPDATE OF job_card_id ON qc_logs
+        FOR EACH ROW
+        EXECUTE FUNCTION qc_attribution_trigger();
+    CREATE TRIGGER trg_qc_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF inspection_date, job_card_id, product_id, artisan_id, inspected_by,
+            defect_reason, defect_category, qty_passed, qty_failed
+        ON qc_logs
+        FOR EACH ROW
+        EXECUTE FUNCTION qc_rollup_trigger();
+
+    ALTER TABLE qc_logs ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY allow_all_qc_logs ON qc_logs FOR ALL TO postgres USING (true) WITH CHECK (true);
+END;
+$$;
+
+-- ------------------------------------------------------------
+-- production (production_date is NOT NULL since migration 013)
+-- ------------------------------------------------------------
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'production'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE production RENAME TO production_unpartitioned;
+    ALTER INDEX production_pkey RENAME TO production_unpartitioned_pkey;
+    DROP INDEX IF EXISTS idx_production_job_card, idx_production_status, idx_production_date;
+
+    CREATE TABLE production (
+        id UUID NOT NULL DEFAULT gen_random_uuid(),
+        job_card_id UUID NOT NULL REFERENCES job_cards(id) ON DELETE CASCADE,
+        material_assigned VARCHAR(200),
+        material_weight_grams DECIMAL(10, 3),
+        material_cost DECIMAL(12, 2),
+        wastage_grams DECIMAL(10, 3) DEFAULT 0,
+        production_date DATE NOT NULL DEFAULT CURRENT_DATE,
+        completion_date DATE,
+        status VARCHAR(30) NOT NULL DEFAULT 'allocated'
+            CHECK (status IN ('allocated', 'in_process', 'finished', 'rejected')),
+        notes TEXT,
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        artisan_id UUID,
+        category_id UUID,
+        PRIMARY KEY (id, production_date)
+    ) PARTITION BY RANGE (production_date);
+
+    CREATE TABLE production_default PARTITION OF production DEFAULT;
+    PERFORM ensure_monthly_partitions('production',
+        COALESCE((SELECT MIN(production_date) FROM production_unpartitioned), CURRENT_DATE),
+        (CURRENT_DATE + INTERVAL '3 months')::date);
+
+    INSERT INTO production (id, job_card_id, material_assigned, material_weight_grams, material_cost, wastage_grams,
+                            production_date, completion_date, status, notes, created_at, updated_at,
+                            artisan_id, category_id)
+    SELECT id, job_card_id, material_assigned, material_weight_grams, material_cost, wastage_grams,
+           production_date, completion_date, status, notes, created_at, updated_at,
+           artisan_id, category_id
+    FROM production_unpartitioned;
+
+    DROP TABLE production_unpartitioned;
+
+    CREATE INDEX idx_production_job_card ON production(job_card_id);
+    CREATE INDEX idx_production_status ON production(status);
+    CREATE INDEX idx_production_date ON production(production_date);
+
+    CREATE TRIGGER trg_production_attribution
+        BEFORE INSERT OR UPDATE OF job_card_id ON production
+        FOR EACH ROW
+        EXECUTE FUNCTION production_attribution_trigger();
+    CREATE TRIGGER trg_production_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF production_date, material_assigned, job_card_id, artisan_id, category_id,
+            material_weight_grams, wastage_grams, material_cost
+        ON production
+        FOR EACH ROW
+        EXECUTE FUNCTION production_rollup_trigger();
+
+    ALTER TABLE production ENABLE ROW LEVEL SECURITY;
+    CREATE POLICY allow_all_production ON production FOR ALL TO postgres USING (true) WITH CHECK (true);
+END;
+$$;
+
+-- Realtime (migration 010) dropped with the old tables; publish partition
+-- changes under the parent table name so subscribers are unaffected
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime') THEN
+        ALTER PUBLICATION supabase_realtime SET (publish_via_partition_root = true);
+        IF NOT EXISTS (SELECT 1 FROM pg_publication_tables WHERE pubname = 'supabase_realtime' AND tablename = 'qc_logs') THEN
+            ALTER PUBLICATION supabase_realtime ADD TABLE qc_logs;
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_publication_tables WHERE pubname = 'supabase_realtime' AND tablename = 'production') THEN
+            ALTER PUBLICATION supabase_realtime ADD TABLE production;
+        END IF;
+    END IF;
+END;
+$$;
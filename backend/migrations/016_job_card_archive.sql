@@ -0,0 +1,30 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 016: Job Card Archive Index
+-- Closed job cards are moved (with their QC and production rows)
+-- to Parquet batches by archive.py; this table keeps one row per
+-- archived card so reads can find its batch without scanning files
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS job_card_archive (
+    job_card_id UUID PRIMARY KEY,
+    job_card_number VARCHAR(50) NOT NULL,
+    product_id UUID,
+    assigned_artisan_id UUID,
+    status VARCHAR(30) NOT NULL,
+    target_qty INTEGER,
+    completed_qty INTEGER,
+    created_at TIMESTAMPTZ,
+    closed_at TIMESTAMPTZ,
+    batch VARCHAR(100) NOT NULL,
+    qc_rows INTEGER NOT NULL DEFAULT 0,
+    production_rows INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_card_archive_number ON job_card_archive(job_card_number);
+CREATE INDEX IF NOT EXISTS idx_job_card_archive_batch ON job_card_archive(batch);
+CREATE INDEX IF NOT EXISTS idx_job_card_archive_closed ON job_card_archive(closed_at);
+
+ALTER TABLE job_card_archive ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_job_card_archive ON job_card_archive;
+CREATE POLICY allow_all_job_card_archive ON job_card_archive FOR ALL TO postgres USING (true) WITH CHECK (true);
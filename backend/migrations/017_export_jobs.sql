@@ -0,0 +1,115 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 017: Background Export Jobs
+-- Per-table change counters so an export can tell whether its
+-- source data changed since the last file; export_jobs tracks
+-- queued/running/finished exports
+-- ============================================================
+
+-- Compacted counts; the live part is the row count in data_version_log
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- One row per write statement. Inserts never wait on each other, so writers
+-- of one table are not serialized, and a change counts only once its
+-- transaction commits (a sequence would count it before the data is visible)
+-- The cost is one extra insert per write statement on the tracked tables,
+-- and a COUNT over the table's uncompacted rows per fingerprint, so
+-- export_jobs.compact_loop() folds the log every EXPORT_COMPACT_INTERVAL
+-- (a minute by default) to keep that count short
+CREATE TABLE IF NOT EXISTS data_version_log (
+    id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(63) NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_data_version_log_table ON data_version_log(table_name);
+
+CREATE OR REPLACE FUNCTION bump_data_version(p_table TEXT)
+RETURNS VOID AS $$
+    INSERT INTO data_version_log (table_name) VALUES (p_table);
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION table_data_versions(p_tables TEXT[])
+RETURNS TABLE (table_name TEXT, version BIGINT) AS $$
+    SELECT t, COALESCE((SELECT d.version FROM data_versions d WHERE d.table_name = t), 0)
+              + (SELECT COUNT(*) FROM data_version_log l WHERE l.table_name = t)
+    FROM unnest(p_tables) t;
+$$ LANGUAGE sql STABLE;
+
+-- Folds committed log rows into data_versions in one statement, so readers
+-- see the same totals before and after
+CREATE OR REPLACE FUNCTION compact_data_versions()
+RETURNS BIGINT AS $$
+    WITH moved AS (
+        DELETE FROM data_version_log RETURNING table_name, changed_at
+    ), counts AS (
+        SELECT table_name, COUNT(*) AS n, MAX(changed_at) AS changed_at FROM moved GROUP BY table_name
+    ), folded AS (
+        INSERT INTO data_versions AS d (table_name, version, changed_at)
+        SELECT table_name, n, changed_at FROM counts
+        ON CONFLICT (table_name) DO UPDATE SET
+            version = d.version + EXCLUDED.version, changed_at = EXCLUDED.changed_at
+    )
+    SELECT COALESCE(SUM(n), 0)::bigint FROM counts;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION data_version_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM bump_data_version(TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level, so a bulk write bumps once
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOR t IN
+        SELECT unnest(ARRAY[
+            'sku_face_value', 'sku_category', 'sku_material', 'sku_motif',
+            'sku_finding', 'sku_locking', 'sku_size', 'users', 'products',
+            'job_cards', 'qc_logs', 'inventory', 'production'
+        ])
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_data_version ON %I', t);
+        EXECUTE format(
+            'CREATE TRIGGER trg_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION data_version_trigger()', t);
+    END LOOP;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    kind VARCHAR(50) NOT NULL,
+    format VARCHAR(10) NOT NULL CHECK (format IN ('csv', 'gzip')),
+    fingerprint VARCHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    file_name VARCHAR(200),
+    row_count INTEGER,
+    byte_size BIGINT,
+    error TEXT,
+    owner_pid INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_export_jobs_lookup ON export_jobs(kind, format, fingerprint);
+CREATE INDEX IF NOT EXISTS idx_export_jobs_created ON export_jobs(created_at);
+
+ALTER TABLE export_jobs ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_export_jobs ON export_jobs;
+CREATE POLICY allow_all_export_jobs ON export_jobs FOR ALL TO postgres USING (true) WITH CHECK (true);
+ALTER TABLE data_versions ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_data_versions ON data_versions;
+CREATE POLICY allow_all_data_versions ON data_versions FOR ALL TO postgres USING (true) WITH CHECK (true);
+ALTER TABLE data_version_log ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_data_version_log ON data_version_log;
+CREATE POLICY allow_all_data_version_log ON data_version_log FOR ALL TO postgres USING (true) WITH CHECK (true);
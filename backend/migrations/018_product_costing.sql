@@ -0,0 +1,168 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 018: Actual Product Costing
+-- Per-product totals of production material cost and QC-passed
+-- quantity maintained by trigger; costing.py copies the
+-- weighted-average actual cost per good unit to inventory.unit_cost
+-- in the background, and then owns it: repricing leaves it alone
+-- for these products
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS product_costs (
+    product_id UUID PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    production_entries INTEGER NOT NULL DEFAULT 0,
+    material_weight_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    wastage_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    material_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    qty_passed BIGINT NOT NULL DEFAULT 0,
+    qty_failed BIGINT NOT NULL DEFAULT 0,
+    -- Material of failed pieces is absorbed by the good ones
+    actual_unit_cost DECIMAL(12, 2) GENERATED ALWAYS AS (
+        CASE WHEN qty_passed > 0 THEN ROUND(material_cost / qty_passed, 2) END
+    ) STORED,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Archived job cards leave the live tables but keep counting towards the
+-- product's cost; archive.py records their totals here for full recomputes
+ALTER TABLE job_card_archive
+    ADD COLUMN IF NOT EXISTS material_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS material_weight_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS wastage_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS qty_passed INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS qty_failed INTEGER NOT NULL DEFAULT 0;
+
+-- Archived before this migration: the totals above are still 0. costing.py
+-- fills them in from the batch's Parquet files (and adds them to
+-- product_costs) on the next `python costing.py --full`. Rows present when
+-- the column is added take TRUE; rows archived later default to FALSE, since
+-- archive.py records their totals
+ALTER TABLE job_card_archive ADD COLUMN IF NOT EXISTS totals_pending BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE job_card_archive ALTER COLUMN totals_pending SET DEFAULT FALSE;
+UPDATE job_card_archive SET totals_pending = FALSE
+WHERE totals_pending AND qc_rows = 0 AND production_rows = 0;
+
+-- Per-product totals of qc_logs/production months detached by retention
+-- (partitions.py): detaching fires no triggers, so product_costs keeps them,
+-- and full recomputes read them from here. Months detached before this
+-- migration are in neither
+CREATE TABLE IF NOT EXISTS product_cost_retained (
+    product_id UUID PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    production_entries INTEGER NOT NULL DEFAULT 0,
+    material_weight_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    wastage_grams DECIMAL(14, 3) NOT NULL DEFAULT 0,
+    material_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    qty_passed BIGINT NOT NULL DEFAULT 0,
+    qty_failed BIGINT NOT NULL DEFAULT 0
+);
+
+-- Add one production (entries = +/-1) or QC delta to the job card's product.
+-- inventory is not touched here, so QC and production writers never lock
+-- inventory rows; costing.sync_inventory_costs() copies the result over
+CREATE OR REPLACE FUNCTION apply_product_cost(
+    p_job_card_id UUID, p_entries INTEGER, p_weight DECIMAL, p_wastage DECIMAL, p_cost DECIMAL,
+    p_passed INTEGER, p_failed INTEGER
+) RETURNS VOID AS $$
+DECLARE
+    v_product_id UUID;
+BEGIN
+    SELECT product_id INTO v_product_id FROM job_cards WHERE id = p_job_card_id;
+
+    -- Job card already gone (cascade/archival): keep its contribution
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO product_costs AS c
+        (product_id, production_entries, material_weight_grams, wastage_grams, material_cost, qty_passed, qty_failed)
+    VALUES (v_product_id, p_entries, COALESCE(p_weight, 0), COALESCE(p_wastage, 0), COALESCE(p_cost, 0),
+            COALESCE(p_passed, 0), COALESCE(p_failed, 0))
+    ON CONFLICT (product_id) DO UPDATE SET
+        production_entries = c.production_entries + EXCLUDED.production_entries,
+        material_weight_grams = c.material_weight_grams + EXCLUDED.material_weight_grams,
+        wastage_grams = c.wastage_grams + EXCLUDED.wastage_grams,
+        material_cost = c.material_cost + EXCLUDED.material_cost,
+        qty_passed = c.qty_passed + EXCLUDED.qty_passed,
+        qty_failed = c.qty_failed + EXCLUDED.qty_failed,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION production_cost_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Rows moved out of the DEFAULT partition (migration 015) stay counted
+    IF current_setting('amara.partition_move', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_product_cost(OLD.job_card_id, -1, -OLD.material_weight_grams, -OLD.wastage_grams,
+            -OLD.material_cost, 0, 0);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_product_cost(NEW.job_card_id, 1, NEW.material_weight_grams, NEW.wastage_grams,
+            NEW.material_cost, 0, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION qc_cost_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Rows moved out of the DEFAULT partition (migration 015) stay counted
+    IF current_setting('amara.partition_move', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_product_cost(OLD.job_card_id, 0, 0, 0, 0, -OLD.qty_passed, -OLD.qty_failed);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_product_cost(NEW.job_card_id, 0, 0, 0, 0, NEW.qty_passed, NEW.qty_failed);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_production_cost ON production;
+CREATE TRIGGER trg_production_cost
+    AFTER INSERT OR DELETE OR UPDATE OF job_card_id, material_weight_grams, wastage_grams, material_cost
+    ON production
+    FOR EACH ROW
+    EXECUTE FUNCTION production_cost_trigger();
+
+DROP TRIGGER IF EXISTS trg_qc_cost ON qc_logs;
+CREATE TRIGGER trg_qc_cost
+    AFTER INSERT OR DELETE OR UPDATE OF job_card_id, qty_passed, qty_failed
+    ON qc_logs
+    FOR EACH ROW
+    EXECUTE FUNCTION qc_cost_trigger();
+
+-- Backfill from the live tables; later backfills use `python costing.py --full`
+INSERT INTO product_costs
+    (product_id, production_entries, material_weight_grams, wastage_grams, material_cost, qty_passed, qty_failed)
+SELECT jc.product_id, COALESCE(SUM(pr.entries), 0), COALESCE(SUM(pr.weight), 0), COALESCE(SUM(pr.wastage), 0),
+       COALESCE(SUM(pr.cost), 0), COALESCE(SUM(q.passed), 0), COALESCE(SUM(q.failed), 0)
+FROM job_cards jc
+LEFT JOIN (
+    SELECT job_card_id, COUNT(*) AS entries, SUM(material_weight_grams) AS weight,
+           SUM(wastage_grams) AS wastage, SUM(material_cost) AS cost
+    FROM production GROUP BY job_card_id
+) pr ON pr.job_card_id = jc.id
+LEFT JOIN (
+    SELECT job_card_id, SUM(qty_passed) AS passed, SUM(qty_failed) AS failed FROM qc_logs GROUP BY job_card_id
+) q ON q.job_card_id = jc.id
+GROUP BY jc.product_id
+ON CONFLICT (product_id) DO NOTHING;
+
+UPDATE inventory i SET unit_cost = c.actual_unit_cost, updated_at = NOW()
+FROM product_costs c
+WHERE c.product_id = i.product_id AND c.actual_unit_cost IS NOT NULL
+  AND i.unit_cost IS DISTINCT FROM c.actual_unit_cost;
+
+ALTER TABLE product_costs ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_product_costs ON product_costs;
+CREATE POLICY allow_all_product_costs ON product_costs FOR ALL TO postgres USING (true) WITH CHECK (true);
+
+ALTER TABLE product_cost_retained ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_product_cost_retained ON product_cost_retained;
+CREATE POLICY allow_all_product_cost_retained ON product_cost_retained FOR ALL TO postgres USING (true) WITH CHECK (true);
@@ -0,0 +1,58 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 019: Audit Log
+-- Append-only record of who changed which product, inventory
+-- row or job card, with per-field before/after values. Written
+-- in batches by audit.py; range-partitioned by month like the
+-- history tables, so old months can be detached
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS audit_log (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    entity_type VARCHAR(30) NOT NULL,
+    entity_id UUID NOT NULL,
+    action VARCHAR(30) NOT NULL,
+    actor VARCHAR(100),
+    source VARCHAR(200),
+    -- {"field": [before, after], ...}
+    changes JSONB NOT NULL DEFAULT '{}',
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, changed_at)
+) PARTITION BY RANGE (changed_at);
+
+CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT;
+SELECT ensure_monthly_partitions('audit_log', CURRENT_DATE, (CURRENT_DATE + INTERVAL '3 months')::date);
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log(entity_type, entity_id, changed_at DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_changed_at ON audit_log(changed_at DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_actor ON audit_log(actor, changed_at DESC);
+
+-- Rows are never edited; retention works by detaching whole months. The one
+-- exception: ensure_monthly_partitions moves rows out of the DEFAULT partition
+-- (copy into the new month's table, then delete) when it creates their month,
+-- and flags that delete with the transaction-local amara.partition_move setting
+CREATE OR REPLACE FUNCTION audit_log_append_only()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND TG_TABLE_NAME = 'audit_log_default'
+       AND current_setting('amara.partition_move', true) = 'on' THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_audit_log_append_only ON audit_log;
+CREATE TRIGGER trg_audit_log_append_only
+    BEFORE UPDATE OR DELETE ON audit_log
+    FOR EACH ROW
+    EXECUTE FUNCTION audit_log_append_only();
+
+DROP TRIGGER IF EXISTS trg_audit_log_no_truncate ON audit_log;
+CREATE TRIGGER trg_audit_log_no_truncate
+    BEFORE TRUNCATE ON audit_log
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION audit_log_append_only();
+
+ALTER TABLE audit_log ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_audit_log ON audit_log;
+CREATE POLICY allow_all_audit_log ON audit_log FOR ALL TO postgres USING (true) WITH CHECK (true);
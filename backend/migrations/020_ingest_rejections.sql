@@ -0,0 +1,20 @@
+-- ============================================================
+-- AMARA ERP/MIS - Migration 020: Ingestion Rejections
+-- QC and production rows accepted with 202 by the write-behind
+-- queue (ingest.py) that the database then refused, so any
+-- worker can report them to GET /api/ingest/{id}
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS ingest_rejections (
+    id UUID PRIMARY KEY,  -- the id handed out in the 202
+    table_name VARCHAR(63) NOT NULL,
+    error TEXT NOT NULL,
+    row_data JSONB NOT NULL,
+    rejected_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_rejections_rejected_at ON ingest_rejections(rejected_at DESC);
+
+ALTER TABLE ingest_rejections ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS allow_all_ingest_rejections ON ingest_rejections;
+CREATE POLICY allow_all_ingest_rejections ON ingest_rejections FOR ALL TO postgres USING (true) WITH CHECK (true);
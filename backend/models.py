@@ -0,0 +1,260 @@
+"""
+AMARA ERP/MIS - API Models
+Pydantic request/response models shared by the routers
+"""
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from scheduler import DEFAULT_DAILY_CAPACITY
+
+
+class LookupItem(BaseModel):
+    id: str
+    name: str
+    code: str
+    description: Optional[str] = None
+    created_at: Optional[str] = None
+
+class LookupCreate(BaseModel):
+    name: str
+    code: str
+    description: Optional[str] = None
+
+class ProductOut(BaseModel):
+    id: str
+    name: str
+    description: Optional[str] = None
+    sku: Optional[str] = None
+    sequence_num: Optional[int] = None
+    face_value_id: str
+    category_id: str
+    material_id: str
+    motif_id: str
+    finding_id: str
+    locking_id: str
+    size_id: str
+    is_active: bool = True
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    face_value_code: Optional[str] = None
+    category_code: Optional[str] = None
+    material_code: Optional[str] = None
+    motif_code: Optional[str] = None
+    finding_code: Optional[str] = None
+    locking_code: Optional[str] = None
+    size_code: Optional[str] = None
+    face_value_name: Optional[str] = None
+    category_name: Optional[str] = None
+    material_name: Optional[str] = None
+    motif_name: Optional[str] = None
+    finding_name: Optional[str] = None
+    locking_name: Optional[str] = None
+    size_name: Optional[str] = None
+
+class ProductCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    face_value_id: str
+    category_id: str
+    material_id: str
+    motif_id: str
+    finding_id: str
+    locking_id: str
+    size_id: str
+
+class ProductUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class ProductBulkUpdateItem(ProductUpdate):
+    id: str
+    updated_at: Optional[str] = None  # expected current value, as If-Match does for single updates
+
+class ProductBulkUpdateRequest(BaseModel):
+    items: List[ProductBulkUpdateItem]
+
+class ProductBulkArchiveRequest(BaseModel):
+    ids: List[str]
+
+class PaginatedResponse(BaseModel):
+    items: list
+    total: int
+    page: int
+    page_size: int
+    total_pages: int
+
+class DiceOut(BaseModel):
+    id: str
+    dice_number: str
+    dice_type: str
+    description: Optional[str] = None
+    is_active: bool = True
+    created_at: Optional[str] = None
+
+class DiceCreate(BaseModel):
+    dice_number: str
+    dice_type: str
+    description: Optional[str] = None
+
+class MappingOut(BaseModel):
+    id: str
+    dice_id: str
+    target_id: str
+    dice_number: Optional[str] = None
+    target_name: Optional[str] = None
+    target_code: Optional[str] = None
+
+class MappingCreate(BaseModel):
+    dice_id: str
+    target_id: str
+
+class DiceBulkRequest(BaseModel):
+    items: List[DiceCreate]
+
+class MappingBulkRequest(BaseModel):
+    items: List[MappingCreate]
+
+class DiceCompatibilityRequest(BaseModel):
+    product_ids: List[str]
+
+class UserOut(BaseModel):
+    id: str
+    name: str
+    email: str
+    role: str
+    phone: Optional[str] = None
+    is_active: bool = True
+
+class JobCardOut(BaseModel):
+    id: str
+    product_id: str
+    job_card_number: str
+    target_qty: int
+    completed_qty: int = 0
+    assigned_artisan_id: Optional[str] = None
+    status: str
+    priority: str = "normal"
+    start_date: Optional[str] = None
+    due_date: Optional[str] = None
+    notes: Optional[str] = None
+    created_at: Optional[str] = None
+    product_name: Optional[str] = None
+    product_sku: Optional[str] = None
+    artisan_name: Optional[str] = None
+
+class JobCardCreate(BaseModel):
+    product_id: str
+    job_card_number: str
+    target_qty: int
+    assigned_artisan_id: Optional[str] = None
+    status: str = "pending"
+    priority: str = "normal"
+    start_date: Optional[str] = None
+    due_date: Optional[str] = None
+    notes: Optional[str] = None
+
+class SchedulerRequest(BaseModel):
+    default_capacity: int = DEFAULT_DAILY_CAPACITY
+    require_dice: bool = True
+    keep_assigned: bool = True
+
+class QCLogOut(BaseModel):
+    id: str
+    job_card_id: str
+    inspected_by: Optional[str] = None
+    qty_passed: int
+    qty_failed: int
+    defect_reason: Optional[str] = None
+    defect_category: Optional[str] = None
+    inspection_date: Optional[str] = None
+    notes: Optional[str] = None
+    job_card_number: Optional[str] = None
+    inspector_name: Optional[str] = None
+
+class QCLogCreate(BaseModel):
+    job_card_id: str
+    inspected_by: Optional[str] = None
+    # Bounds mirror the table's checks so write-behind rows are refused before the 202
+    qty_passed: int = Field(ge=0, le=2**31 - 1)
+    qty_failed: int = Field(ge=0, le=2**31 - 1)
+    defect_reason: Optional[str] = None
+    defect_category: Optional[str] = Field(None, max_length=30)
+    notes: Optional[str] = None
+
+class InventoryOut(BaseModel):
+    id: str
+    product_id: str
+    stock_qty: int
+    reserved_qty: int = 0
+    unit_cost: Optional[float] = None
+    selling_price: Optional[float] = None
+    mrp: Optional[float] = None
+    weight_grams: Optional[float] = None
+    location: Optional[str] = None
+    product_name: Optional[str] = None
+    product_sku: Optional[str] = None
+
+class InventoryCreate(BaseModel):
+    product_id: str
+    stock_qty: int = 0
+    reserved_qty: int = 0
+    unit_cost: Optional[float] = None
+    selling_price: Optional[float] = None
+    mrp: Optional[float] = None
+    weight_grams: Optional[float] = None
+    location: Optional[str] = None
+
+class RepriceRule(BaseModel):
+    material_id: str
+    rate_per_gram: float
+    wastage_pct: float = 0
+    making_charge_per_gram: float = 0
+    making_charge_flat: float = 0
+    markup_pct: float = 0
+    mrp_markup_pct: float = 0
+
+class RepriceRequest(BaseModel):
+    rules: List[RepriceRule]
+    fields: List[str] = ["unit_cost", "selling_price", "mrp"]
+    round_to: float = 1
+    min_change_pct: float = 0
+    preview_limit: int = 50
+
+class ProductionOut(BaseModel):
+    id: str
+    job_card_id: str
+    material_assigned: Optional[str] = None
+    material_weight_grams: Optional[float] = None
+    material_cost: Optional[float] = None
+    wastage_grams: Optional[float] = None
+    production_date: Optional[str] = None
+    status: str
+    notes: Optional[str] = None
+    job_card_number: Optional[str] = None
+
+class ProductionCreate(BaseModel):
+    job_card_id: str
+    # Column widths: VARCHAR(200), DECIMAL(10, 3), DECIMAL(12, 2)
+    material_assigned: Optional[str] = Field(None, max_length=200)
+    material_weight_grams: Optional[float] = Field(None, ge=0, lt=10**7)
+    material_cost: Optional[float] = Field(None, ge=0, lt=10**10)
+    production_date: Optional[str] = None
+    notes: Optional[str] = None
+
+class MigrationFile(BaseModel):
+    filename: str
+    content: str
+
+class DashboardStats(BaseModel):
+    total_products: int
+    active_job_cards: int
+    total_inventory_value: float
+    qc_pass_rate: float
+    total_users: int
+    total_dices: int
+    pending_jobs: int
+    completed_jobs: int
+
+class ExportJobCreate(BaseModel):
+    kind: str
+    format: str = "csv"
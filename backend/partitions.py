@@ -0,0 +1,167 @@
+"""
+AMARA ERP/MIS - History Partition Maintenance
+qc_logs and production (migration 015) and audit_log (migration 019) are
+range-partitioned by month. This module keeps PARTITION_MONTHS_AHEAD future
+months created and, when PARTITION_RETENTION_MONTHS is set, detaches months
+older than the retention window. Detaching is a catalog change, so purging a
+month is instant; the rollup tables keep its totals (and their *_retained
+tables a copy for rollup rebuilds), and product_cost_retained its per-product
+cost totals for full cost recomputes. Detached tables are kept
+(and can be archived or re-attached) unless PARTITION_DROP_DETACHED=true.
+
+Runs from the app lifespan every PARTITION_MAINTENANCE_INTERVAL seconds, or
+standalone:
+
+    python partitions.py [--detach-before YYYY-MM] [--drop]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Partitioned table -> partition key
+PARTITIONED_TABLES = {"qc_logs": "inspection_date", "production": "production_date", "audit_log": "changed_at"}
+
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_RETENTION_MONTHS = int(os.environ.get("PARTITION_RETENTION_MONTHS", "0"))  # 0 = keep everything
+PARTITION_DROP_DETACHED = os.environ.get("PARTITION_DROP_DETACHED", "false").lower() == "true"
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+# Partitioned table -> function adding a month's rows to its rollup's retained totals (migrations 012/014)
+RETAIN_ROLLUP_FUNCTIONS = {"qc_logs": "retain_qc_rollup", "production": "retain_production_rollup"}
+
+# Arbitrary app-wide key; with several workers only one runs maintenance at a time
+MAINTENANCE_LOCK_KEY = 7_412_650_043
+_MONTH_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+
+def add_months(d, months):
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_month(name):
+    m = _MONTH_SUFFIX.search(name)
+    return date(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+async def list_partitions(db):
+    r = await db.execute(text("""
+        SELECT parent.relname, child.relname, pg_get_expr(child.relpartbound, child.oid),
+               GREATEST(child.reltuples, 0)::bigint, pg_total_relation_size(child.oid)
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = ANY(:tables) AND parent.relkind = 'p'
+        ORDER BY parent.relname, child.relname
+    """), {"tables": list(PARTITIONED_TABLES)})
+    out = {table: [] for table in PARTITIONED_TABLES}
+    for parent, name, bound, rows, size in r.fetchall():
+        month = partition_month(name)
+        out[parent].append({"name": name, "month": month.isoformat()[:7] if month else None,
+                            "bound": bound, "estimated_rows": rows, "bytes": size})
+    return out
+
+
+async def ensure_partitions(db, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Create any missing partitions from the current month through months_ahead; returns their names."""
+    start = (today or date.today()).replace(day=1)
+    created = []
+    for table in PARTITIONED_TABLES:
+        r = await db.execute(text("SELECT ensure_monthly_partitions(CAST(:t AS regclass), :start, :end)"),
+                             {"t": table, "start": start, "end": add_months(start, months_ahead)})
+        created += [row[0] for row in r.fetchall()]
+    return created
+
+
+async def detach_partitions(db, before, drop=False):
+    """Detach (and optionally drop) every monthly partition whose month starts before `before`."""
+    import costing  # NumPy; only needed once something is detached
+    detached = []
+    for table, parts in (await list_partitions(db)).items():
+        for part in parts:
+            month = partition_month(part["name"])
+            if month is None or month >= before:
+                continue
+            # Names come from pg_class and match the <table>_YYYY_MM pattern, so they are safe to interpolate
+            await costing.retain_partition(db, table, part["name"])
+            if table in RETAIN_ROLLUP_FUNCTIONS:
+                await db.execute(text(f"SELECT {RETAIN_ROLLUP_FUNCTIONS[table]}(CAST(:p AS regclass))"),
+                                 {"p": part["name"]})
+            await db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{part["name"]}"'))
+            if drop:
+                await db.execute(text(f'DROP TABLE "{part["name"]}"'))
+            detached.append(part["name"])
+        if any(name.startswith(f"{table}_") for name in detached):
+            # Detaching fires no triggers; cached export files of this table must not be reused
+            await db.execute(text("SELECT bump_data_version(:t)"), {"t": table})
+    return detached
+
+
+async def run_maintenance(months_ahead=PARTITION_MONTHS_AHEAD, retention_months=PARTITION_RETENTION_MONTHS,
+                          drop=PARTITION_DROP_DETACHED, detach_before=None):
+    """One maintenance pass in a single transaction; skipped if another worker holds the lock."""
+    session = database.LazySession("maintenance")
+    try:
+        r = await session.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": MAINTENANCE_LOCK_KEY})
+        if not r.scalar():
+            await session.rollback()
+            return {"skipped": True, "created": [], "detached": []}
+        if detach_before is None and retention_months > 0:
+            detach_before = add_months(date.today().replace(day=1), -retention_months)
+        created = await ensure_partitions(session, months_ahead)
+        detached = await detach_partitions(session, detach_before, drop) if detach_before else []
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+    if created or detached:
+        logger.info("Partition maintenance: created %s, %s %s", created or "none",
+                    "dropped" if drop else "detached", detached or "none")
+    return {"skipped": False, "created": created, "detached": detached, "dropped": drop and bool(detached)}
+
+
+async def maintenance_loop(interval=PARTITION_MAINTENANCE_INTERVAL):
+    while True:
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Partition maintenance failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def _main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    before = date.fromisoformat(args.detach_before + "-01") if args.detach_before else None
+    result = await run_maintenance(detach_before=before, drop=args.drop)
+    for table, parts in (await _list()).items():
+        print(f"{table}: " + ", ".join(p["month"] or p["name"] for p in parts))
+    print(f"created: {result['created'] or 'none'}; {'dropped' if args.drop else 'detached'}: {result['detached'] or 'none'}")
+    await database.dispose_engine()
+
+
+async def _list():
+    session = database.LazySession()
+    try:
+        return await list_partitions(session)
+    finally:
+        await session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create future and detach old qc_logs/production partitions")
+    parser.add_argument("--detach-before", metavar="YYYY-MM", help="detach partitions for months before this one")
+    parser.add_argument("--drop", action="store_true", help="drop detached partitions instead of keeping them as tables")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,183 @@
+"""
+AMARA ERP/MIS - Metal-Rate Repricing
+Recomputes inventory prices from per-material rules when metal rates move:
+
+    unit_cost     = weight * rate * (1 + wastage%) + weight * making/g + making flat
+    selling_price = unit_cost * (1 + markup%), rounded to round_to
+    mrp           = selling_price * (1 + mrp markup%), rounded to round_to
+
+The affected rows are loaded once into NumPy arrays and priced in a single
+vectorized pass; applying writes every changed row with one UPDATE ... FROM
+unnest(...) in the same transaction that locked them. Products with an actual
+cost (costing.py) keep their unit_cost; only their prices follow the rules.
+"""
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+REPRICE_FIELDS = ("unit_cost", "selling_price", "mrp")
+
+
+def _load_query(lock):
+    return f"""
+        SELECT i.id, p.sku, p.material_id, i.weight_grams, i.stock_qty, i.unit_cost, i.selling_price, i.mrp,
+               c.actual_unit_cost IS NOT NULL
+        FROM inventory i JOIN products p ON i.product_id = p.id
+        LEFT JOIN product_costs c ON c.product_id = i.product_id
+        WHERE p.material_id = ANY(CAST(:materials AS uuid[]))
+        {"FOR UPDATE OF i" if lock else ""}
+    """
+
+
+async def load_inventory(db, material_ids, lock=False):
+    r = await db.execute(text(_load_query(lock)), {"materials": material_ids})
+    rows = r.fetchall()
+    cols = list(zip(*rows)) if rows else [()] * 9
+    return {
+        "id": np.array([str(v) for v in cols[0]], dtype=object),
+        "sku": np.array(cols[1], dtype=object),
+        "material": np.array([str(v) for v in cols[2]], dtype=object),
+        # NULL numerics become NaN
+        "weight": np.array(cols[3], dtype=float),
+        "stock": np.array(cols[4], dtype=float),
+        "unit_cost": np.array(cols[5], dtype=float),
+        "selling_price": np.array(cols[6], dtype=float),
+        "mrp": np.array(cols[7], dtype=float),
+        # unit_cost owned by the actual-cost rollup
+        "costed": np.array(cols[8], dtype=bool),
+    }
+
+
+def _round_to(values, step):
+    return np.round(values / step) * step if step and step > 0 else np.round(values, 2)
+
+
+def compute_prices(inv, rules, fields=REPRICE_FIELDS, round_to=1, min_change_pct=0):
+    """
+    Price every loaded row under its material's rule. Returns the new price
+    arrays plus `changed`, a mask of rows whose selected fields move by at
+    least min_change_pct (and by at least a paisa). Rows without a weight
+    are never changed.
+    """
+    rule_ids = [r.material_id for r in rules]
+    # Row -> rule index: map each distinct material once, then broadcast
+    materials, inverse = np.unique(inv["material"].astype(str), return_inverse=True)
+    lookup = np.array([rule_ids.index(m) for m in materials], dtype=int)
+    idx = lookup[inverse] if len(materials) else np.zeros(0, dtype=int)
+
+    def per_row(attr):
+        return np.array([getattr(r, attr) for r in rules], dtype=float)[idx]
+
+    weight = inv["weight"]
+    cost = (weight * per_row("rate_per_gram") * (1 + per_row("wastage_pct") / 100)
+            + weight * per_row("making_charge_per_gram") + per_row("making_charge_flat"))
+    new = {"unit_cost": np.round(cost, 2)}
+    new["selling_price"] = _round_to(new["unit_cost"] * (1 + per_row("markup_pct") / 100), round_to)
+    new["mrp"] = _round_to(new["selling_price"] * (1 + per_row("mrp_markup_pct") / 100), round_to)
+
+    # Fields not being repriced keep their current value, as does an actual cost
+    for f in REPRICE_FIELDS:
+        if f not in fields:
+            new[f] = inv[f].copy()
+    if "costed" in inv:
+        new["unit_cost"] = np.where(inv["costed"], inv["unit_cost"], new["unit_cost"])
+
+    priced = ~np.isnan(weight)
+    changed = np.zeros(len(weight), dtype=bool)
+    for f in fields:
+        old = np.abs(np.nan_to_num(inv[f]))
+        delta = np.abs(new[f] - np.nan_to_num(inv[f]))
+        # Any move from a zero price counts as infinitely large
+        pct = np.divide(delta * 100, old, out=np.full(len(old), np.inf), where=old != 0)
+        changed |= (delta >= 0.005) & (pct >= min_change_pct)
+    changed &= priced
+    return new, changed, priced
+
+
+def summarize(inv, new, changed, priced, material_names, limit=50):
+    """Per-material totals and the largest selling-price moves among changed rows."""
+    materials, inverse = np.unique(inv["material"].astype(str), return_inverse=True)
+    stock = np.nan_to_num(inv["stock"])
+    old_cost, old_sell = np.nan_to_num(inv["unit_cost"]), np.nan_to_num(inv["selling_price"])
+
+    def total(values, mask):
+        return np.bincount(inverse, weights=np.where(mask, values, 0), minlength=len(materials))
+
+    counts = np.bincount(inverse, minlength=len(materials))
+    changed_counts = np.bincount(inverse, weights=changed, minlength=len(materials))
+    old_stock_cost, new_stock_cost = total(stock * old_cost, changed), total(stock * new["unit_cost"], changed)
+    old_sell_sum, new_sell_sum = total(old_sell, changed), total(new["selling_price"], changed)
+    by_material = [{
+        "material_id": m, "material_name": material_names.get(m), "items": int(counts[k]),
+        "changed": int(changed_counts[k]),
+        "stock_cost_before": round(float(old_stock_cost[k]), 2), "stock_cost_after": round(float(new_stock_cost[k]), 2),
+        "avg_selling_change_pct": round(float((new_sell_sum[k] - old_sell_sum[k]) / old_sell_sum[k] * 100), 2)
+        if old_sell_sum[k] else None,
+    } for k, m in enumerate(materials)]
+
+    rows = np.flatnonzero(changed)
+    order = rows[np.argsort(-np.abs(new["selling_price"][rows] - old_sell[rows]), kind="stable")][:limit]
+
+    def num(v):
+        return None if np.isnan(v) else round(float(v), 2)
+
+    changes = [{
+        "id": inv["id"][i], "sku": inv["sku"][i], "weight_grams": num(inv["weight"][i]),
+        **{f"{f}_before": num(inv[f][i]) for f in REPRICE_FIELDS},
+        **{f"{f}_after": num(new[f][i]) for f in REPRICE_FIELDS},
+    } for i in order]
+    return {
+        "items": int(len(changed)), "changed": int(changed.sum()), "skipped_no_weight": int((~priced).sum()),
+        "actual_cost_kept": int(inv["costed"].sum()) if "costed" in inv else 0,
+        "stock_cost_delta": round(float(np.sum(stock[changed] * (new["unit_cost"][changed] - old_cost[changed]))), 2),
+        "by_material": by_material, "changes": changes,
+    }
+
+
+def audit_rows(inv, new, changed, fields):
+    """(inventory id, before, after) of the repriced fields of every changed row, for audit.record_many."""
+    def num(v):
+        return None if np.isnan(v) else round(float(v), 2)
+
+    return [(inv["id"][i], {f: num(inv[f][i]) for f in fields}, {f: num(new[f][i]) for f in fields})
+            for i in np.flatnonzero(changed)]
+
+
+async def reprice(db, req, apply=False):
+    """Preview (apply=False) or apply a repricing request; the caller commits and audits result["audit"]."""
+    started = time.perf_counter()
+    material_ids = [r.material_id for r in req.rules]
+    if not material_ids:
+        raise ValueError("At least one rule is required")
+    if len(set(material_ids)) != len(material_ids):
+        raise ValueError("One rule per material")
+    bad = [f for f in req.fields if f not in REPRICE_FIELDS]
+    if bad or not req.fields:
+        raise ValueError(f"fields must be a non-empty subset of {list(REPRICE_FIELDS)}")
+    r = await db.execute(text("SELECT id, name FROM sku_material WHERE id = ANY(CAST(:ids AS uuid[]))"),
+                         {"ids": material_ids})
+    material_names = {str(row[0]): row[1] for row in r.fetchall()}
+    unknown = [m for m in material_ids if m not in material_names]
+    if unknown:
+        raise ValueError(f"Unknown material_id: {', '.join(unknown)}")
+
+    inv = await load_inventory(db, material_ids, lock=apply)
+    new, changed, priced = compute_prices(inv, req.rules, req.fields, req.round_to, req.min_change_pct)
+    out = summarize(inv, new, changed, priced, material_names, req.preview_limit)
+
+    if apply and changed.any():
+        # Only the requested fields are assigned; the others keep their stored value
+        assignments = ", ".join(f"{f} = v.{f}" for f in REPRICE_FIELDS if f in req.fields)
+        await db.execute(text(f"""
+            UPDATE inventory i SET {assignments}, updated_at = NOW()
+            FROM unnest(CAST(:ids AS uuid[]), CAST(:unit_cost AS float8[]), CAST(:selling_price AS float8[]),
+                        CAST(:mrp AS float8[])) AS v(id, unit_cost, selling_price, mrp)
+            WHERE i.id = v.id
+        """), {"ids": inv["id"][changed].tolist(),
+               **{f: [None if np.isnan(x) else x for x in new[f][changed].tolist()] for f in REPRICE_FIELDS}})
+    out["applied"] = bool(apply and changed.any())
+    if out["applied"]:
+        out["audit"] = audit_rows(inv, new, changed, req.fields)
+    out["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return out
@@ -0,0 +1,158 @@
+"""
+AMARA ERP/MIS - HTTP Response Cache
+ASGI middleware caching GET responses of read-mostly routes with strong ETags.
+Entries are invalidated by tag: write handlers bump a tag's version, and any
+entry stored under an older version is treated as a miss.
+"""
+import hashlib
+import importlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+# (path pattern, ttl seconds, tag templates filled from the pattern's groups)
+CACHE_RULES = [
+    (r"^/api/lookups/(?P<key>[a-z_]+)$", 600, ["lookups:{key}"]),
+    (r"^/api/users$", 300, ["users"]),
+    (r"^/api/products/facets$", 300, ["products", "lookups"]),
+    (r"^/api/dices$", 300, ["dices"]),
+    (r"^/api/dice-mappings/(?P<kind>motif|locking)$", 300, ["dice-mappings:{kind}"]),
+    (r"^/api/schema$", 3600, ["schema"]),
+    (r"^/api/er-diagram$", 3600, ["schema"]),
+    (r"^/api/migrations$", 3600, ["migrations"]),
+]
+
+
+class MemoryBackend:
+    """In-process LRU; each worker keeps its own entries and tag versions."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def versions(self, tags):
+        return [self._versions.get(t, 0) for t in tags]
+
+    async def bump(self, tags):
+        for t in tags:
+            self._versions[t] = self._versions.get(t, 0) + 1
+
+    async def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+def load_backend(spec=None):
+    """'memory' (default) or 'package.module:factory' returning an object with the MemoryBackend interface."""
+    spec = spec or os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+    if spec == "memory":
+        return MemoryBackend(int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "512")))
+    module, _, factory = spec.partition(":")
+    return getattr(importlib.import_module(module), factory or "create_backend")()
+
+
+class ResponseCache:
+    def __init__(self, backend=None, rules=CACHE_RULES):
+        self.backend = backend or load_backend()
+        self.rules = [(re.compile(p), ttl, tags) for p, ttl, tags in rules]
+        self.enabled = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, path):
+        for pattern, ttl, tags in self.rules:
+            m = pattern.match(path)
+            if m:
+                return ttl, [t.format(**m.groupdict()) for t in tags]
+        return None
+
+    async def invalidate(self, *tags):
+        if tags:
+            await self.backend.bump(tags)
+
+    def stats(self):
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses, **self.backend.stats()}
+
+
+response_cache = ResponseCache()
+
+
+def _etag_matches(if_none_match, etag):
+    return any(t.strip() in (etag, "*") for t in if_none_match.split(","))
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app, cache=response_cache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or not self.cache.enabled:
+            return await self.app(scope, receive, send)
+        rule = self.cache.match(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+        ttl, tags = rule
+        key = f"{scope['path']}?{'&'.join(sorted(scope['query_string'].decode('latin-1').split('&')))}"
+        request_headers = dict(scope["headers"])
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+
+        versions = await self.cache.backend.versions(tags)
+        entry = await self.cache.backend.get(key)
+        if entry is not None and entry["versions"] == versions:
+            self.cache.hits += 1
+            return await self._replay(entry, if_none_match, scope, send, b"HIT")
+        self.cache.misses += 1
+
+        # Versions were read before the handler runs, so a write racing with it invalidates this entry
+        start, body = {}, []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        payload = b"".join(body)
+        headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+        entry = {"status": start.get("status", 500), "headers": headers, "body": payload,
+                 "etag": '"' + hashlib.sha1(payload).hexdigest() + '"',
+                 "versions": versions, "expires": time.monotonic() + ttl}
+        if entry["status"] == 200:
+            await self.cache.backend.set(key, entry)
+        await self._replay(entry, if_none_match, scope, send, b"MISS")
+
+    async def _replay(self, entry, if_none_match, scope, send, cache_status):
+        ok = entry["status"] == 200
+        not_modified = ok and if_none_match and _etag_matches(if_none_match, entry["etag"])
+        headers = list(entry["headers"])
+        if ok:
+            headers += [(b"etag", entry["etag"].encode()), (b"cache-control", b"no-cache"), (b"x-cache", cache_status)]
+        body = b"" if not_modified or scope["method"] == "HEAD" else entry["body"]
+        if not not_modified:
+            headers.append((b"content-length", str(len(entry["body"])).encode()))
+        else:
+            headers = [(k, v) for k, v in headers if k.lower() not in (b"content-type",)]
+        await send({"type": "http.response.start", "status": 304 if not_modified else entry["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": body})
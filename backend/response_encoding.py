@@ -0,0 +1,218 @@
+"""
+AMARA ERP/MIS - Response Encoding
+Negotiated gzip/brotli compression, field projection and compact
+(columnar / MessagePack) encodings for list payloads.
+"""
+import os
+import zlib
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/msgpack", b"application/xml")
+
+
+# ------------------------------------------------------------
+# List projection and encodings
+# ------------------------------------------------------------
+class ListFormat:
+    """Query parameters shared by list endpoints: ?fields=id,sku&format=json|columnar|msgpack"""
+
+    def __init__(
+        self,
+        fields: Optional[str] = Query(None, description="Comma-separated item fields to return"),
+        format: str = Query("json", pattern="^(json|columnar|msgpack)$"),
+    ):
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        self.format = format
+
+
+def project_items(items, fields, allowed):
+    if not fields:
+        return items
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [{f: item.get(f) for f in fields} for item in items]
+
+
+def to_columnar(items, keys):
+    # {"columns": [...], "data": {col: [values...]}} - field names are sent once, not per row
+    return {"columns": keys, "data": {k: [item.get(k) for item in items] for k in keys}}
+
+
+def _msgpack_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def render_list(payload, fmt: ListFormat, allowed, items_key="items"):
+    """
+    Apply ?fields= and ?format= to a list endpoint's result. `payload` is either
+    a bare list of item dicts or a dict holding them under `items_key`.
+    """
+    items = payload if items_key is None else payload[items_key]
+    items = project_items(items, fmt.fields, allowed)
+    if fmt.format != "json":
+        items = to_columnar(items, fmt.fields or list(allowed))
+    if items_key is None:
+        payload = items
+    else:
+        payload = {**payload, items_key: items}
+    if fmt.format == "msgpack":
+        if msgpack is None:
+            raise HTTPException(status_code=406, detail="MessagePack encoding is not available on this server")
+        return Response(content=msgpack.packb(payload, default=_msgpack_default), media_type="application/msgpack")
+    return payload if fmt.format == "json" else jsonable_encoder(payload)
+
+
+# ------------------------------------------------------------
+# Compression
+# ------------------------------------------------------------
+def _parse_accept_encoding(value):
+    codings = {}
+    for part in value.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            codings[name.lower()] = q
+    return codings
+
+
+def choose_encoding(accept_encoding):
+    codings = _parse_accept_encoding(accept_encoding)
+    if brotli is not None and codings.get("br", 0) > 0:
+        return "br"
+    if codings.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.flush = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.compress, self.flush = self._c.compress, self._c.flush
+
+
+def _strip_etag_suffixes(value):
+    # Clients echo back the per-encoding ETag; inner layers only know the identity ETag
+    for suffix in ("-br\"", "-gzip\""):
+        value = value.replace(suffix, "\"")
+    return value
+
+
+class CompressionMiddleware:
+    """
+    Compress responses above COMPRESSION_MIN_BYTES with brotli (if installed) or
+    gzip, whichever the client accepts. Buffered bodies are compressed whole;
+    streamed bodies (CSV exports) are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        if b"if-none-match" in headers:
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, _strip_etag_suffixes(v.decode("latin-1")).encode("latin-1") if k == b"if-none-match" else v)
+                for k, v in scope["headers"]
+            ]
+
+        start = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                response_start, start = start, None
+                if not self._should_compress(response_start, body, more_body):
+                    compressor = False
+                    await send(response_start)
+                    return await send(message)
+                compressor = _Compressor(encoding)
+                await send({**response_start, "headers": self._headers(response_start["headers"], encoding)})
+            if not compressor:
+                return await send(message)
+
+            chunk = compressor.compress(body)
+            if more_body:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": chunk + compressor.flush()})
+
+        await self.app(scope, receive, compressing_send)
+
+    def _should_compress(self, start, body, more_body):
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        content_type = b""
+        for k, v in start.get("headers", []):
+            k = k.lower()
+            # Ranged downloads must stay byte-addressable
+            if k in (b"content-encoding", b"accept-ranges"):
+                return False
+            if k == b"content-type":
+                content_type = v
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
+
+    def _headers(self, headers, encoding):
+        out = []
+        for k, v in headers:
+            lk = k.lower()
+            if lk == b"content-length":
+                continue
+            if lk == b"etag" and v.endswith(b'"'):
+                v = v[:-1] + b"-" + encoding.encode() + b'"'
+            if lk == b"vary":
+                continue
+            out.append((k, v))
+        vary = [v for k, v in headers if k.lower() == b"vary"]
+        out.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        out.append((b"content-encoding", encoding.encode()))
+        return out
@@ -0,0 +1,72 @@
+"""
+AMARA ERP/MIS - API Routers
+Each module declares `router`; modules are imported on the first request to
+one of their path segments (LAZY_ROUTERS=true) or all at startup.
+"""
+import importlib
+
+from startup_profile import profile
+
+# Router module -> first path segments after /api/ that it serves
+ROUTER_SEGMENTS = {
+    "routers.system": ("", "health", "dashboard", "migrations", "schema", "er-diagram", "cache", "admission", "startup", "partitions"),
+    "routers.lookups": ("lookups", "sku"),
+    "routers.products": ("products",),
+    "routers.dices": ("dices", "dice-mappings", "products"),
+    "routers.exports": ("export", "exports"),
+    "routers.users": ("users",),
+    "routers.job_cards": ("job-cards", "scheduler"),
+    "routers.qc": ("qc-logs", "qc"),
+    "routers.inventory": ("inventory",),
+    "routers.production": ("production", "analytics"),
+    "routers.analytics": ("analytics",),
+    "routers.costing": ("costs", "products"),
+    "routers.ingest": ("ingest",),
+    "routers.audit": ("audit",),
+}
+
+SEGMENT_MODULES = {}
+for _module, _segments in ROUTER_SEGMENTS.items():
+    for _segment in _segments:
+        SEGMENT_MODULES.setdefault(_segment, []).append(_module)
+
+# Paths that need every route registered (OpenAPI schema and docs UIs)
+FULL_SCHEMA_PATHS = ("/openapi.json", "/docs", "/redoc")
+
+_loaded = set()
+
+
+def load_router(app, module_name):
+    if module_name in _loaded:
+        return
+    with profile.phase(f"import {module_name}"):
+        module = importlib.import_module(module_name)
+    app.include_router(module.router)
+    _loaded.add(module_name)
+
+
+def load_all_routers(app):
+    for module_name in ROUTER_SEGMENTS:
+        load_router(app, module_name)
+
+
+def loaded_routers():
+    return sorted(_loaded)
+
+
+class LazyRouterMiddleware:
+    """Import and include the routers serving a path before the request is routed."""
+
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and len(_loaded) < len(ROUTER_SEGMENTS):
+            path = scope["path"]
+            if path.startswith("/api/"):
+                for module_name in SEGMENT_MODULES.get(path[5:].split("/", 1)[0], ()):
+                    load_router(self.fastapi_app, module_name)
+            elif path.startswith(FULL_SCHEMA_PATHS):
+                load_all_routers(self.fastapi_app)
+        await self.app(scope, receive, send)
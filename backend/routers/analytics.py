@@ -0,0 +1,47 @@
+"""
+AMARA ERP/MIS - Reports over the columnar analytics snapshot (analytics_snapshot.py)
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from datetime import date
+from database import get_db_for
+from response_encoding import ListFormat, render_list
+import analytics_snapshot
+from analytics_snapshot import REPORTS, run_report, snapshot
+
+router = APIRouter(prefix="/api")
+
+@router.get("/analytics/reports")
+async def list_reports():
+    return [{"name": name, "description": r.description, "params": list(r.params)} for name, r in REPORTS.items()]
+
+@router.get("/analytics/query")
+async def query_report(report: str, start: Optional[date] = None, end: Optional[date] = None, fmt: ListFormat = Depends()):
+    if report not in REPORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown report '{report}'; expected one of {sorted(REPORTS)}")
+    try:
+        columns, items = await run_report(report, start=start, end=end)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return render_list({"report": report, "items": items, "snapshot_synced_at": _synced_at()}, fmt, columns)
+
+def _synced_at():
+    try:
+        _, rows = snapshot.query("SELECT CAST(MIN(synced_at) AS VARCHAR) FROM _snapshot_state")
+    except RuntimeError:
+        return None
+    return rows[0][0] if rows else None
+
+@router.get("/analytics/snapshot")
+async def get_snapshot_status():
+    try:
+        return snapshot.status()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.post("/analytics/snapshot")
+async def refresh_snapshot(full: bool = Query(False), db=Depends(get_db_for("analytics"))):
+    try:
+        return await analytics_snapshot.build_snapshot(db, full=full)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
@@ -0,0 +1,86 @@
+"""
+AMARA ERP/MIS - Change audit log (audit.py, migration 019)
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from database import get_db
+from common import serialize_row
+import audit
+
+router = APIRouter(prefix="/api")
+
+AUDIT_KEYS = ["id", "entity_type", "entity_id", "action", "actor", "source", "changes", "changed_at"]
+
+def _parse_audit_cursor(cursor: str):
+    # Cursor is "<changed_at>_<id>" of the last entry on the previous page
+    try:
+        ts, _, aid = cursor.rpartition("_")
+        return datetime.fromisoformat(ts), int(aid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _audit_page(db, where_clauses, params, cursor, page_size):
+    if cursor:
+        where_clauses.append("(changed_at, id) < (:cts, :cid)")
+        params["cts"], params["cid"] = _parse_audit_cursor(cursor)
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    params["limit"] = page_size + 1
+    r = await db.execute(text(f"""
+        SELECT {", ".join(AUDIT_KEYS)} FROM audit_log{where}
+        ORDER BY changed_at DESC, id DESC LIMIT :limit
+    """), params)
+    rows = r.fetchall()
+    items = [serialize_row(row, AUDIT_KEYS) for row in rows[:page_size]]
+    next_cursor = f"{items[-1]['changed_at']}_{items[-1]['id']}" if len(rows) > page_size else None
+    return {"items": items, "next_cursor": next_cursor, "page_size": page_size}
+
+@router.get("/audit")
+async def get_audit_log(
+    entity_type: str = "", entity_id: Optional[str] = None, actor: str = "", action: str = "",
+    since: Optional[datetime] = None, until: Optional[datetime] = None,
+    cursor: Optional[str] = None, page_size: int = Query(50, ge=1, le=500), db=Depends(get_db)
+):
+    where_clauses = []
+    params = {}
+    if entity_type:
+        where_clauses.append("entity_type = :et")
+        params["et"] = entity_type
+    if entity_id:
+        try:
+            params["eid"] = uuid.UUID(entity_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="entity_id must be a UUID")
+        where_clauses.append("entity_id = :eid")
+    if actor:
+        where_clauses.append("actor = :actor")
+        params["actor"] = actor
+    if action:
+        where_clauses.append("action = ANY(:actions)")
+        params["actions"] = [a.strip() for a in action.split(",") if a.strip()]
+    # Bounds on changed_at also prune the monthly partitions scanned
+    if since:
+        where_clauses.append("changed_at >= :since")
+        params["since"] = since
+    if until:
+        where_clauses.append("changed_at < :until")
+        params["until"] = until
+    return await _audit_page(db, where_clauses, params, cursor, page_size)
+
+@router.get("/audit/stats")
+async def get_audit_stats():
+    """Writer queue and batch counters, and the time record() adds to each write (microseconds)."""
+    return audit.writer.info()
+
+@router.get("/audit/{entity_type}/{entity_id}")
+async def get_entity_audit(entity_type: str, entity_id: str, cursor: Optional[str] = None,
+                           page_size: int = Query(50, ge=1, le=500), db=Depends(get_db)):
+    """History of one product, inventory row or job card, newest first."""
+    try:
+        eid = uuid.UUID(entity_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Unknown entity")
+    return await _audit_page(db, ["entity_type = :et", "entity_id = :eid"], {"et": entity_type, "eid": eid},
+                             cursor, page_size)
@@ -0,0 +1,40 @@
+"""
+AMARA ERP/MIS - Actual product costs (costing.py)
+"""
+import uuid
+from fastapi import APIRouter, Depends, HTTPException
+from common import query_canceled
+from database import get_db, get_db_for
+from response_encoding import ListFormat, render_list
+import costing
+
+router = APIRouter(prefix="/api")
+
+@router.get("/costs")
+async def get_costs(fmt: ListFormat = Depends(), db=Depends(get_db)):
+    return render_list(await costing.list_costs(db), fmt, costing.COST_KEYS, items_key=None)
+
+@router.post("/costs/recompute")
+async def recompute_costs(db=Depends(get_db_for("export"))):
+    try:
+        result = await costing.recompute_costs(db)
+        await db.commit()
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/products/{product_id}/cost-breakdown")
+async def get_cost_breakdown(product_id: str, db=Depends(get_db)):
+    try:
+        uuid.UUID(product_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Product not found")
+    breakdown = await costing.cost_breakdown(db, product_id)
+    if breakdown is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return breakdown
@@ -0,0 +1,236 @@
+"""
+AMARA ERP/MIS - Dices, dice compatibility and dice mappings
+"""
+from fastapi import APIRouter, Depends, HTTPException
+import uuid
+from typing import List
+from sqlalchemy import text
+from database import get_db
+from models import DiceOut, DiceCreate, MappingOut, MappingCreate, DiceBulkRequest, MappingBulkRequest, DiceCompatibilityRequest
+from common import BULK_MAX_ITEMS, query_canceled, serialize_row
+from dice_index import dice_index
+from lookup_map import LOOKUP_TABLES
+
+router = APIRouter(prefix="/api")
+
+# --- Dices ---
+@router.get("/dices", response_model=List[DiceOut])
+async def get_dices(q: str = "", db=Depends(get_db)):
+    if q:
+        r = await db.execute(text("SELECT id, dice_number, dice_type, description, is_active, created_at FROM dices WHERE LOWER(dice_number) LIKE :q OR LOWER(dice_type) LIKE :q ORDER BY dice_number"), {"q": f"%{q.lower()}%"})
+    else:
+        r = await db.execute(text("SELECT id, dice_number, dice_type, description, is_active, created_at FROM dices ORDER BY dice_number"))
+    return [DiceOut(**serialize_row(row, ["id","dice_number","dice_type","description","is_active","created_at"])) for row in r.fetchall()]
+
+@router.post("/dices", response_model=DiceOut)
+async def create_dice(item: DiceCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(
+            text("INSERT INTO dices (dice_number, dice_type, description) VALUES (:dn, :dt, :desc) RETURNING id, dice_number, dice_type, description, is_active, created_at"),
+            {"dn": item.dice_number, "dt": item.dice_type, "desc": item.description}
+        )
+        await db.commit()
+        row = r.fetchone()
+        dice_index.add_dice(row)
+        await dice_index.record_write("dices")
+        return DiceOut(**serialize_row(row, ["id","dice_number","dice_type","description","is_active","created_at"]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/dices/bulk")
+async def bulk_upsert_dices(req: DiceBulkRequest, db=Depends(get_db)):
+    if len(req.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    # ON CONFLICT DO UPDATE cannot touch a row twice, so the last occurrence of a dice_number wins
+    last = {item.dice_number: i for i, item in enumerate(req.items)}
+    rows = [req.items[i] for i in sorted(last.values())]
+    try:
+        r = await db.execute(text("""
+            INSERT INTO dices (dice_number, dice_type, description)
+            SELECT * FROM unnest(CAST(:dns AS varchar[]), CAST(:dts AS varchar[]), CAST(:descs AS text[]))
+            ON CONFLICT (dice_number) DO UPDATE
+                SET dice_type = EXCLUDED.dice_type, description = EXCLUDED.description, updated_at = NOW()
+            RETURNING id, dice_number, dice_type, description, is_active, created_at, (xmax = 0)
+        """), {"dns": [x.dice_number for x in rows], "dts": [x.dice_type for x in rows], "descs": [x.description for x in rows]})
+        returned = r.fetchall()
+        await db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    by_number = {}
+    for row in returned:
+        dice_index.add_dice(row)
+        by_number[row[1]] = (str(row[0]), "created" if row[6] else "updated")
+    await dice_index.record_write("dices", "dice-mappings:motif", "dice-mappings:locking")
+    results = []
+    for i, item in enumerate(req.items):
+        dice_id, outcome = by_number[item.dice_number]
+        results.append({"index": i, "dice_number": item.dice_number, "id": dice_id,
+                         "status": outcome if last[item.dice_number] == i else "duplicate"})
+    return {"results": results, "created": sum(1 for v in by_number.values() if v[1] == "created"),
+            "updated": sum(1 for v in by_number.values() if v[1] == "updated")}
+
+# --- Dice Compatibility ---
+@router.get("/products/{product_id}/dices", response_model=List[DiceOut])
+async def get_product_dices(product_id: str, db=Depends(get_db)):
+    r = await db.execute(text("SELECT motif_id, locking_id FROM products WHERE id = :id"), {"id": product_id})
+    row = r.fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    await dice_index.ensure_loaded(db)
+    return [DiceOut(**d) for d in dice_index.dices_for(row[0], row[1])]
+
+@router.post("/dices/compatibility")
+async def get_dice_compatibility(item: DiceCompatibilityRequest, db=Depends(get_db)):
+    if len(item.product_ids) > 5000:
+        raise HTTPException(status_code=400, detail="At most 5000 product_ids per request")
+    try:
+        r = await db.execute(text("SELECT id, motif_id, locking_id FROM products WHERE id = ANY(CAST(:ids AS uuid[]))"), {"ids": item.product_ids})
+    except HTTPException:
+        raise
+    except Exception as e:
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    await dice_index.ensure_loaded(db)
+    products, coverage = {}, {}
+    for pid, motif_id, locking_id in r.fetchall():
+        bits = dice_index.bitset_for(motif_id, locking_id)
+        products[str(pid)] = bits
+        coverage[bits] = coverage.get(bits, 0) + 1
+    dices, covered = {}, 0
+    for bits, count in coverage.items():
+        for d in dice_index.dices_in(bits):
+            dices.setdefault(d["id"], {**d, "product_count": 0})["product_count"] += count
+        covered |= bits
+    return {
+        "products": {pid: [d["id"] for d in dice_index.dices_in(bits)] for pid, bits in products.items()},
+        "dices": sorted(dices.values(), key=lambda d: (-d["product_count"], d["dice_number"])),
+        "uncovered": [pid for pid, bits in products.items() if not bits],
+        "not_found": [pid for pid in item.product_ids if pid not in products],
+    }
+
+# --- Dice Mappings ---
+@router.get("/dice-mappings/motif", response_model=List[MappingOut])
+async def get_dice_motif_mappings(db=Depends(get_db)):
+    r = await db.execute(text("""
+        SELECT dm.id, dm.dice_id, dm.motif_id, d.dice_number, m.name, m.code
+        FROM dice_motif_mapping dm JOIN dices d ON dm.dice_id=d.id JOIN sku_motif m ON dm.motif_id=m.id ORDER BY d.dice_number
+    """))
+    return [MappingOut(**serialize_row(row, ["id","dice_id","target_id","dice_number","target_name","target_code"])) for row in r.fetchall()]
+
+@router.post("/dice-mappings/motif", response_model=MappingOut)
+async def create_dice_motif_mapping(item: MappingCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(text("INSERT INTO dice_motif_mapping (dice_id, motif_id) VALUES (:did, :tid) RETURNING id, dice_id, motif_id"), {"did": item.dice_id, "tid": item.target_id})
+        await db.commit()
+        row = r.fetchone()
+        dice_index.add_mapping("motif", row[1], row[2])
+        await dice_index.record_write("dice-mappings:motif")
+        return MappingOut(id=str(row[0]), dice_id=str(row[1]), target_id=str(row[2]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/dice-mappings/locking", response_model=List[MappingOut])
+async def get_dice_locking_mappings(db=Depends(get_db)):
+    r = await db.execute(text("""
+        SELECT dm.id, dm.dice_id, dm.locking_id, d.dice_number, l.name, l.code
+        FROM dice_locking_mapping dm JOIN dices d ON dm.dice_id=d.id JOIN sku_locking l ON dm.locking_id=l.id ORDER BY d.dice_number
+    """))
+    return [MappingOut(**serialize_row(row, ["id","dice_id","target_id","dice_number","target_name","target_code"])) for row in r.fetchall()]
+
+@router.post("/dice-mappings/locking", response_model=MappingOut)
+async def create_dice_locking_mapping(item: MappingCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(text("INSERT INTO dice_locking_mapping (dice_id, locking_id) VALUES (:did, :tid) RETURNING id, dice_id, locking_id"), {"did": item.dice_id, "tid": item.target_id})
+        await db.commit()
+        row = r.fetchone()
+        dice_index.add_mapping("locking", row[1], row[2])
+        await dice_index.record_write("dice-mappings:locking")
+        return MappingOut(id=str(row[0]), dice_id=str(row[1]), target_id=str(row[2]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _bulk_insert_mappings(kind: str, items: List[MappingCreate], db):
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    results, pairs = [], []
+    for i, item in enumerate(items):
+        try:
+            pair = (str(uuid.UUID(item.dice_id)), str(uuid.UUID(item.target_id)))
+        except ValueError:
+            results.append({"index": i, "dice_id": item.dice_id, "target_id": item.target_id, "id": None, "status": "invalid_id"})
+            continue
+        pairs.append(pair)
+        results.append({"index": i, "dice_id": item.dice_id, "target_id": item.target_id, "key": pair})
+    # Unknown dices/targets are filtered out rather than aborting the batch on an FK violation
+    try:
+        r = await db.execute(text(f"""
+            WITH v AS (
+                SELECT DISTINCT * FROM unnest(CAST(:dids AS uuid[]), CAST(:tids AS uuid[])) AS v(dice_id, target_id)
+            ), valid AS (
+                SELECT v.dice_id, v.target_id FROM v
+                JOIN dices d ON d.id = v.dice_id JOIN {LOOKUP_TABLES[kind]} t ON t.id = v.target_id
+            ), ins AS (
+                INSERT INTO dice_{kind}_mapping (dice_id, {kind}_id) SELECT dice_id, target_id FROM valid
+                ON CONFLICT (dice_id, {kind}_id) DO NOTHING
+                RETURNING id, dice_id, {kind}_id
+            )
+            SELECT v.dice_id, v.target_id, COALESCE(ins.id, m.id),
+                   CASE WHEN ins.id IS NOT NULL THEN 'created' WHEN m.id IS NOT NULL THEN 'exists' ELSE 'invalid_reference' END
+            FROM v
+            LEFT JOIN ins ON ins.dice_id = v.dice_id AND ins.{kind}_id = v.target_id
+            LEFT JOIN dice_{kind}_mapping m ON m.dice_id = v.dice_id AND m.{kind}_id = v.target_id
+        """), {"dids": [p[0] for p in pairs], "tids": [p[1] for p in pairs]})
+        outcomes = {(str(row[0]), str(row[1])): (str(row[2]) if row[2] else None, row[3]) for row in r.fetchall()}
+        await db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    seen = set()
+    for res in results:
+        key = res.pop("key", None)
+        if key is None:
+            continue
+        res["id"], res["status"] = outcomes[key]
+        if key in seen:
+            res["status"] = "duplicate"
+        elif res["status"] == "created":
+            dice_index.add_mapping(kind, *key)
+        seen.add(key)
+    await dice_index.record_write(f"dice-mappings:{kind}")
+    counts = {}
+    for res in results:
+        counts[res["status"]] = counts.get(res["status"], 0) + 1
+    return {"results": results, "counts": counts}
+
+@router.post("/dice-mappings/motif/bulk")
+async def bulk_create_dice_motif_mappings(req: MappingBulkRequest, db=Depends(get_db)):
+    return await _bulk_insert_mappings("motif", req.items, db)
+
+@router.post("/dice-mappings/locking/bulk")
+async def bulk_create_dice_locking_mappings(req: MappingBulkRequest, db=Depends(get_db)):
+    return await _bulk_insert_mappings("locking", req.items, db)
@@ -0,0 +1,129 @@
+"""
+AMARA ERP/MIS - CSV exports, inline and as background jobs
+"""
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from database import get_db, get_db_for
+from models import ExportJobCreate
+from common import make_csv_response, serialize_row
+from lookup_map import LOOKUP_TABLES, lookup_map
+from export_jobs import EXPORT_FORMATS, ExportDefinition, file_response, job_out, manager as export_manager
+from routers.products import PRODUCTS_BASE_QUERY, PRODUCTS_NORMALIZED_QUERY, PRODUCT_KEYS, normalized_products
+
+router = APIRouter(prefix="/api")
+
+# --- Export definitions (shared by the inline CSV routes and background jobs) ---
+PRODUCT_EXPORT_HEADERS = ["SKU","Name","Description","Category","Material","Motif","Finding","Locking","Size","Active","Created"]
+
+def product_export_row(row):
+    d = serialize_row(row, PRODUCT_KEYS)
+    return [d["sku"],d["name"],d["description"],d["category_name"],d["material_name"],
+            d["motif_name"],d["finding_name"],d["locking_name"],d["size_name"],d["is_active"],d["created_at"]]
+
+EXPORTS = {
+    "products": ExportDefinition(
+        sql=f"{PRODUCTS_BASE_QUERY} ORDER BY p.sku",
+        headers=PRODUCT_EXPORT_HEADERS,
+        tables=["products", *LOOKUP_TABLES.values()],
+        filename="amara_products.csv", row=product_export_row),
+    "inventory": ExportDefinition(
+        sql="""
+            SELECT p.sku, p.name, i.stock_qty, i.reserved_qty, i.unit_cost, i.selling_price, i.mrp, i.weight_grams, i.location
+            FROM inventory i JOIN products p ON i.product_id = p.id ORDER BY p.sku
+        """,
+        headers=["SKU","Product","Stock Qty","Reserved","Unit Cost","Selling Price","MRP","Weight (g)","Location"],
+        tables=["inventory", "products"], filename="amara_inventory.csv"),
+    "job-cards": ExportDefinition(
+        sql="""
+            SELECT jc.job_card_number, p.sku, p.name, jc.target_qty, jc.completed_qty, u.name, jc.status, jc.priority, jc.start_date, jc.due_date
+            FROM job_cards jc JOIN products p ON jc.product_id=p.id LEFT JOIN users u ON jc.assigned_artisan_id=u.id ORDER BY jc.created_at DESC
+        """,
+        headers=["Job Card #","SKU","Product","Target Qty","Completed","Artisan","Status","Priority","Start Date","Due Date"],
+        tables=["job_cards", "products", "users"], filename="amara_job_cards.csv"),
+    "qc-logs": ExportDefinition(
+        sql="""
+            SELECT jc.job_card_number, u.name, q.qty_passed, q.qty_failed, q.defect_reason, q.inspection_date
+            FROM qc_logs q JOIN job_cards jc ON q.job_card_id=jc.id LEFT JOIN users u ON q.inspected_by=u.id ORDER BY q.inspection_date DESC
+        """,
+        headers=["Job Card #","Inspector","Passed","Failed","Defect Reason","Inspection Date"],
+        tables=["qc_logs", "job_cards", "users"], filename="amara_qc_logs.csv"),
+}
+
+async def _inline_csv(kind, db):
+    export = EXPORTS[kind]
+    r = await db.execute(text(export.sql))
+    rows = [export.row(row) for row in r.fetchall()] if export.row else r.fetchall()
+    return make_csv_response(rows, export.headers, export.filename)
+
+# --- CSV Export ---
+@router.get("/export/products")
+async def export_products_csv(shape: str = Query("full", pattern="^(full|normalized)$"), db=Depends(get_db_for("export"))):
+    if shape == "normalized":
+        # CSV has nowhere to put the lookup dictionary, so the normalized export is a JSON document
+        await lookup_map.ensure_loaded(db)
+        r = await db.execute(text(f"{PRODUCTS_NORMALIZED_QUERY} ORDER BY p.sku"))
+        items = normalized_products(r.fetchall())
+        return JSONResponse({"items": items, "lookups": lookup_map.for_items(items)},
+                            headers={"Content-Disposition": "attachment; filename=amara_products.json"})
+    return await _inline_csv("products", db)
+
+@router.get("/export/inventory")
+async def export_inventory_csv(db=Depends(get_db_for("export"))):
+    return await _inline_csv("inventory", db)
+
+@router.get("/export/job-cards")
+async def export_job_cards_csv(db=Depends(get_db_for("export"))):
+    return await _inline_csv("job-cards", db)
+
+@router.get("/export/qc-logs")
+async def export_qc_logs_csv(db=Depends(get_db_for("export"))):
+    return await _inline_csv("qc-logs", db)
+
+# --- Background export jobs (export_jobs.py) ---
+@router.post("/exports", status_code=202)
+async def create_export(req: ExportJobCreate, response: Response, db=Depends(get_db)):
+    if req.kind not in EXPORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown export '{req.kind}'; expected one of {sorted(EXPORTS)}")
+    if req.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{req.format}'; expected one of {sorted(EXPORT_FORMATS)}")
+    job, queued = await export_manager.submit(db, req.kind, req.format, EXPORTS[req.kind])
+    if not queued:
+        response.status_code = 200
+    response.headers["Location"] = f"/api/exports/{job['id']}"
+    return {**job_out(job), "reused": not queued}
+
+@router.get("/exports")
+async def list_exports(limit: int = Query(50, ge=1, le=200), db=Depends(get_db)):
+    return {"jobs": await export_manager.list(db, limit), **export_manager.stats()}
+
+async def _get_job(job_id, db):
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Export not found")
+    job = await export_manager.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@router.get("/exports/{job_id}")
+async def get_export(job_id: str, db=Depends(get_db)):
+    return job_out(await _get_job(job_id, db))
+
+@router.get("/exports/{job_id}/download")
+async def download_export(job_id: str, range: Optional[str] = Header(None), if_range: Optional[str] = Header(None),
+                          if_none_match: Optional[str] = Header(None), db=Depends(get_db)):
+    job = await _get_job(job_id, db)
+    await db.close()  # the file is served without holding a connection
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    path = export_manager.path(job)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Export file has expired; request the export again")
+    suffix, media_type = EXPORT_FORMATS[job["format"]]
+    filename = EXPORTS[job["kind"]].filename.rsplit(".", 1)[0] + suffix
+    return file_response(path, f'"{job["fingerprint"]}"', filename, media_type,
+                         range_header=range, if_range=if_range, if_none_match=if_none_match)
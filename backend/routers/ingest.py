@@ -0,0 +1,46 @@
+"""
+AMARA ERP/MIS - Write-behind ingestion status (ingest.py)
+"""
+import asyncio
+import uuid
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from database import get_db
+from ingest import INGEST_TABLES, writer
+
+router = APIRouter(prefix="/api")
+
+@router.get("/ingest")
+async def get_ingest_status():
+    return writer.info()
+
+async def _lookup(db, row_id):
+    for table in INGEST_TABLES:
+        r = await db.execute(text(f"SELECT 1 FROM {table} WHERE id = CAST(:id AS uuid)"), {"id": row_id})
+        if r.fetchone():
+            return {"id": row_id, "table": table, "status": "written"}
+    r = await db.execute(text("SELECT table_name, error, rejected_at FROM ingest_rejections WHERE id = CAST(:id AS uuid)"),
+                         {"id": row_id})
+    row = r.fetchone()
+    if row:
+        return {"id": row_id, "table": row[0], "status": "rejected", "error": row[1], "rejected_at": row[2].isoformat()}
+    return None
+
+@router.get("/ingest/{row_id}")
+async def get_ingested_row(row_id: str, db=Depends(get_db)):
+    """queued while the row is in any worker's WAL, then written or rejected once it is in the database."""
+    try:
+        row_id = str(uuid.UUID(row_id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Unknown id")
+    status = writer.status(row_id) or await _lookup(db, row_id)
+    if status:
+        return status
+    # Unknown here and in the database: another worker may still hold it
+    if await asyncio.to_thread(writer.wal.contains, row_id):
+        return {"id": row_id, "status": "queued"}
+    # Or it committed between the lookup and the scan
+    status = await _lookup(db, row_id)
+    if status:
+        return status
+    raise HTTPException(status_code=404, detail="Unknown id")
@@ -0,0 +1,82 @@
+"""
+AMARA ERP/MIS - Inventory
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from database import get_db, get_db_for
+from models import InventoryOut, InventoryCreate, RepriceRequest
+from common import query_canceled, serialize_row
+from response_encoding import ListFormat, render_list
+import audit
+import repricing
+
+router = APIRouter(prefix="/api")
+
+# --- Inventory with search ---
+@router.get("/inventory")
+async def get_inventory(q: str = "", fmt: ListFormat = Depends(), db=Depends(get_db)):
+    where = ""
+    params = {}
+    if q:
+        where = " WHERE LOWER(p.name) LIKE :q OR LOWER(p.sku) LIKE :q OR LOWER(i.location) LIKE :q"
+        params["q"] = f"%{q.lower()}%"
+    r = await db.execute(text(f"""
+        SELECT i.id, i.product_id, i.stock_qty, i.reserved_qty, i.unit_cost, i.selling_price,
+               i.mrp, i.weight_grams, i.location, p.name, p.sku
+        FROM inventory i JOIN products p ON i.product_id=p.id{where} ORDER BY p.sku
+    """), params)
+    keys = ["id","product_id","stock_qty","reserved_qty","unit_cost","selling_price","mrp","weight_grams","location","product_name","product_sku"]
+    return render_list([InventoryOut(**serialize_row(row, keys)).model_dump() for row in r.fetchall()], fmt, keys, items_key=None)
+
+@router.post("/inventory", response_model=InventoryOut)
+async def create_inventory(item: InventoryCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(
+            text("""INSERT INTO inventory (product_id, stock_qty, reserved_qty, unit_cost, selling_price, mrp, weight_grams, location)
+                    VALUES (:pid, :sq, :rq, :uc, :sp, :mrp, :wg, :loc) RETURNING id"""),
+            {"pid": item.product_id, "sq": item.stock_qty, "rq": item.reserved_qty,
+             "uc": item.unit_cost, "sp": item.selling_price, "mrp": item.mrp,
+             "wg": item.weight_grams, "loc": item.location}
+        )
+        await db.commit()
+        row = r.fetchone()
+        audit.record("inventory", row[0], "create", after=item.model_dump())
+        return InventoryOut(id=str(row[0]), product_id=item.product_id,
+                           stock_qty=item.stock_qty, reserved_qty=item.reserved_qty,
+                           unit_cost=item.unit_cost, selling_price=item.selling_price,
+                           mrp=item.mrp, weight_grams=item.weight_grams, location=item.location)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Metal-rate repricing ---
+@router.post("/inventory/reprice/preview")
+async def preview_reprice(req: RepriceRequest, db=Depends(get_db_for("analytics"))):
+    try:
+        return await repricing.reprice(db, req)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/inventory/reprice")
+async def apply_reprice(req: RepriceRequest, db=Depends(get_db_for("analytics"))):
+    try:
+        result = await repricing.reprice(db, req, apply=True)
+        await db.commit()
+        audit.record_many("inventory", "reprice", result.pop("audit", []))
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
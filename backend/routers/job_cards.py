@@ -0,0 +1,191 @@
+"""
+AMARA ERP/MIS - Job cards and the production scheduler
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+import uuid
+from typing import Optional
+from datetime import date
+from sqlalchemy import text
+from database import get_db, get_db_for
+from models import JobCardOut, JobCardCreate, SchedulerRequest
+from common import query_canceled, serialize_row
+import archive
+import audit
+import scheduler
+from response_encoding import ListFormat, render_list
+
+router = APIRouter(prefix="/api")
+
+# --- Job Cards with search & pagination ---
+@router.get("/job-cards")
+async def get_job_cards(q: str = "", status: str = "", page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200), fmt: ListFormat = Depends(), db=Depends(get_db)):
+    where_clauses = []
+    params = {}
+    if q:
+        where_clauses.append("(LOWER(jc.job_card_number) LIKE :q OR LOWER(p.name) LIKE :q OR LOWER(p.sku) LIKE :q)")
+        params["q"] = f"%{q.lower()}%"
+    if status:
+        where_clauses.append("jc.status = :st")
+        params["st"] = status
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    base = f"""FROM job_cards jc JOIN products p ON jc.product_id=p.id LEFT JOIN users u ON jc.assigned_artisan_id=u.id{where}"""
+
+    count_r = await db.execute(text(f"SELECT COUNT(*) {base}"), params)
+    total = count_r.scalar()
+    offset = (page - 1) * page_size
+    params["limit"] = page_size
+    params["offset"] = offset
+    r = await db.execute(text(f"""
+        SELECT jc.id, jc.product_id, jc.job_card_number, jc.target_qty, jc.completed_qty,
+               jc.assigned_artisan_id, jc.status, jc.priority, jc.start_date, jc.due_date,
+               jc.notes, jc.created_at, p.name, p.sku, u.name
+        {base} ORDER BY jc.created_at DESC LIMIT :limit OFFSET :offset
+    """), params)
+    keys = ["id","product_id","job_card_number","target_qty","completed_qty","assigned_artisan_id","status","priority","start_date","due_date","notes","created_at","product_name","product_sku","artisan_name"]
+    items = [JobCardOut(**serialize_row(row, keys)).model_dump() for row in r.fetchall()]
+    total_pages = max(1, (total + page_size - 1) // page_size)
+    return render_list({"items": items, "total": total, "page": page, "page_size": page_size, "total_pages": total_pages}, fmt, keys)
+
+@router.post("/job-cards", response_model=JobCardOut)
+async def create_job_card(item: JobCardCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(
+            text("""INSERT INTO job_cards (product_id, job_card_number, target_qty, assigned_artisan_id, status, priority, start_date, due_date, notes)
+                    VALUES (:pid, :jcn, :tq, :aaid, :st, :pr, :sd, :dd, :notes)
+                    RETURNING id, created_at, completed_qty"""),
+            {"pid": item.product_id, "jcn": item.job_card_number, "tq": item.target_qty,
+             "aaid": item.assigned_artisan_id, "st": item.status, "pr": item.priority,
+             "sd": date.fromisoformat(item.start_date) if item.start_date else None,
+             "dd": date.fromisoformat(item.due_date) if item.due_date else None, "notes": item.notes}
+        )
+        await db.commit()
+        row = r.fetchone()
+        audit.record("job_card", row[0], "create", after={"job_card_number": item.job_card_number,
+                     "product_id": item.product_id, "target_qty": item.target_qty, "status": item.status})
+        return JobCardOut(
+            id=str(row[0]), product_id=item.product_id, job_card_number=item.job_card_number,
+            target_qty=item.target_qty, completed_qty=row[2] or 0,
+            assigned_artisan_id=item.assigned_artisan_id, status=item.status, priority=item.priority,
+            start_date=item.start_date, due_date=item.due_date, notes=item.notes,
+            created_at=row[1].isoformat() if row[1] else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.patch("/job-cards/{jc_id}/status")
+async def update_job_card_status(jc_id: str, status: str = Query(...), db=Depends(get_db)):
+    try:
+        r = await db.execute(text("""
+            UPDATE job_cards jc SET status=:st, updated_at=NOW()
+            FROM (SELECT id, status FROM job_cards WHERE id=:id FOR UPDATE) old
+            WHERE jc.id=old.id RETURNING old.status
+        """), {"st": status, "id": jc_id})
+        row = r.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Job card not found")
+        await db.commit()
+        audit.record("job_card", jc_id, "update", {"status": row[0]}, {"status": status})
+        return {"status": "updated"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Archive of closed job cards (archive.py) ---
+ARCHIVE_KEYS = ["id","job_card_number","status","product_id","product_name","product_sku","assigned_artisan_id",
+                "target_qty","completed_qty","created_at","closed_at","archived_at","qc_rows","production_rows"]
+
+@router.post("/job-cards/archive")
+async def archive_job_cards(older_than_days: int = Query(archive.ARCHIVE_AFTER_DAYS, ge=0),
+                            batch_size: int = Query(archive.ARCHIVE_BATCH_SIZE, ge=1, le=5000),
+                            max_batches: Optional[int] = Query(None, ge=1), db=Depends(get_db_for("export"))):
+    try:
+        return await archive.archive_closed_job_cards(db, older_than_days, batch_size, max_batches)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/job-cards/archived")
+async def get_archived_job_cards(q: str = "", status: str = "", page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200), db=Depends(get_db)):
+    where_clauses = []
+    params = {}
+    if q:
+        where_clauses.append("(LOWER(a.job_card_number) LIKE :q OR LOWER(p.name) LIKE :q OR LOWER(p.sku) LIKE :q)")
+        params["q"] = f"%{q.lower()}%"
+    if status:
+        where_clauses.append("a.status = :st")
+        params["st"] = status
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    base = f"FROM job_card_archive a LEFT JOIN products p ON a.product_id=p.id{where}"
+
+    total = (await db.execute(text(f"SELECT COUNT(*) {base}"), params)).scalar()
+    params["limit"] = page_size
+    params["offset"] = (page - 1) * page_size
+    r = await db.execute(text(f"""
+        SELECT a.job_card_id, a.job_card_number, a.status, a.product_id, p.name, p.sku, a.assigned_artisan_id,
+               a.target_qty, a.completed_qty, a.created_at, a.closed_at, a.archived_at, a.qc_rows, a.production_rows
+        {base} ORDER BY a.closed_at DESC LIMIT :limit OFFSET :offset
+    """), params)
+    items = [serialize_row(row, ARCHIVE_KEYS) for row in r.fetchall()]
+    total_pages = max(1, (total + page_size - 1) // page_size)
+    return {"items": items, "total": total, "page": page, "page_size": page_size, "total_pages": total_pages}
+
+@router.get("/job-cards/{jc_id}")
+async def get_job_card(jc_id: str, db=Depends(get_db)):
+    """A job card with its QC and production rows; falls through to the archive once it has been archived."""
+    try:
+        uuid.UUID(jc_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job card not found")
+    r = await db.execute(text("SELECT * FROM job_cards WHERE id = CAST(:id AS uuid)"), {"id": jc_id})
+    row = r.fetchone()
+    if row:
+        result = {"job_card": serialize_row(row, list(r.keys())), "archived": False}
+        for table in ("qc_logs", "production"):
+            r = await db.execute(text(f"SELECT * FROM {table} WHERE job_card_id = CAST(:id AS uuid)"), {"id": jc_id})
+            keys = list(r.keys())
+            result[table] = [serialize_row(x, keys) for x in r.fetchall()]
+        return result
+    try:
+        archived = await archive.read_archived(db, jc_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if archived is None:
+        raise HTTPException(status_code=404, detail="Job card not found")
+    return archived
+
+# --- Production Scheduler ---
+async def _build_schedule(req: SchedulerRequest, db):
+    if req.default_capacity < 1:
+        raise HTTPException(status_code=400, detail="default_capacity must be positive")
+    cards, artisans, compatible, dice_numbers = await scheduler.load_scheduler_inputs(db)
+    return scheduler.build_plan(cards, artisans, compatible, dice_numbers,
+                                default_capacity=req.default_capacity,
+                                require_dice=req.require_dice, keep_assigned=req.keep_assigned)
+
+@router.post("/scheduler/preview")
+async def preview_schedule(req: SchedulerRequest, db=Depends(get_db)):
+    return await _build_schedule(req, db)
+
+@router.post("/scheduler/apply")
+async def apply_schedule(req: SchedulerRequest, db=Depends(get_db)):
+    plan = await _build_schedule(req, db)
+    try:
+        changed = await scheduler.apply_plan(db, plan)
+        await db.commit()
+        audit.record_many("job_card", "update", changed)
+        return {**plan, "applied": len(changed)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
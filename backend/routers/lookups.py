@@ -0,0 +1,93 @@
+"""
+AMARA ERP/MIS - SKU lookup tables and SKU preview
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List
+from sqlalchemy import text
+from database import get_db
+from models import LookupItem, LookupCreate, ProductCreate
+from common import query_canceled, serialize_row
+from dice_index import dice_index
+from lookup_map import LOOKUP_TABLES, lookup_map
+from response_cache import response_cache
+
+router = APIRouter(prefix="/api")
+
+# --- Lookup CRUD ---
+@router.get("/lookups/{table_key}", response_model=List[LookupItem])
+async def get_lookup_items(table_key: str, search: str = Query("", alias="q"), db=Depends(get_db)):
+    if table_key not in LOOKUP_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown lookup: {table_key}")
+    tbl = LOOKUP_TABLES[table_key]
+    if search:
+        r = await db.execute(text(f"SELECT id, name, code, description, created_at FROM {tbl} WHERE LOWER(name) LIKE :s OR LOWER(code) LIKE :s ORDER BY code"), {"s": f"%{search.lower()}%"})
+    else:
+        r = await db.execute(text(f"SELECT id, name, code, description, created_at FROM {tbl} ORDER BY code"))
+    return [LookupItem(**serialize_row(row, ["id","name","code","description","created_at"])) for row in r.fetchall()]
+
+@router.post("/lookups/{table_key}", response_model=LookupItem)
+async def create_lookup_item(table_key: str, item: LookupCreate, db=Depends(get_db)):
+    if table_key not in LOOKUP_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown lookup: {table_key}")
+    tbl = LOOKUP_TABLES[table_key]
+    try:
+        r = await db.execute(
+            text(f"INSERT INTO {tbl} (name, code, description) VALUES (:name, :code, :desc) RETURNING id, name, code, description, created_at"),
+            {"name": item.name, "code": item.code.upper(), "desc": item.description}
+        )
+        await db.commit()
+        await response_cache.invalidate(f"lookups:{table_key}")
+        await lookup_map.invalidate()
+        row = r.fetchone()
+        return LookupItem(**serialize_row(row, ["id","name","code","description","created_at"]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/lookups/{table_key}/{item_id}")
+async def delete_lookup_item(table_key: str, item_id: str, db=Depends(get_db)):
+    if table_key not in LOOKUP_TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown lookup: {table_key}")
+    tbl = LOOKUP_TABLES[table_key]
+    try:
+        await db.execute(text(f"DELETE FROM {tbl} WHERE id = :id"), {"id": item_id})
+        await db.commit()
+        dice_index.drop_target(table_key, item_id)
+        # Motif/locking deletes cascade to dice mappings
+        await dice_index.record_write(f"lookups:{table_key}", f"dice-mappings:{table_key}")
+        await lookup_map.invalidate()
+        return {"status": "deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- SKU Preview ---
+@router.post("/sku/preview")
+async def preview_sku(item: ProductCreate, db=Depends(get_db)):
+    codes = []
+    for tbl, col_id in [("sku_face_value", item.face_value_id), ("sku_category", item.category_id),
+                         ("sku_material", item.material_id), ("sku_motif", item.motif_id),
+                         ("sku_finding", item.finding_id), ("sku_locking", item.locking_id),
+                         ("sku_size", item.size_id)]:
+        r = await db.execute(text(f"SELECT code FROM {tbl} WHERE id = :id"), {"id": col_id})
+        row = r.fetchone()
+        codes.append(row[0] if row else "?")
+    prefix = "".join(codes)
+    r = await db.execute(text("SELECT COALESCE(MAX(sequence_num), -1) FROM products WHERE sku LIKE :p"), {"p": prefix + "___"})
+    max_seq = r.scalar()
+    next_seq = (max_seq or -1) + 1
+    base36_chars = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    quotient = next_seq
+    suffix = ""
+    for _ in range(3):
+        suffix = base36_chars[quotient % 36] + suffix
+        quotient //= 36
+    return {"prefix": prefix, "suffix": suffix, "full_sku": prefix + suffix, "next_sequence": next_seq, "codes": codes}
@@ -0,0 +1,194 @@
+"""
+AMARA ERP/MIS - Production entries and material consumption analytics
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+import uuid
+from typing import Optional
+from datetime import date
+from sqlalchemy import text
+from database import get_db, get_db_for
+from models import ProductionOut, ProductionCreate
+from common import query_canceled, ratio, serialize_row
+from response_encoding import ListFormat, render_list
+import ingest
+
+router = APIRouter(prefix="/api")
+
+# --- Production ---
+PRODUCTION_KEYS = ["id","job_card_id","material_assigned","material_weight_grams","material_cost","wastage_grams","production_date","status","notes","job_card_number"]
+PRODUCTION_COLUMNS = {
+    "id": "pr.id", "job_card_id": "pr.job_card_id", "material_assigned": "pr.material_assigned",
+    "material_weight_grams": "pr.material_weight_grams", "material_cost": "pr.material_cost",
+    "wastage_grams": "pr.wastage_grams", "production_date": "pr.production_date", "status": "pr.status",
+    "notes": "pr.notes", "job_card_number": "jc.job_card_number",
+}
+PRODUCTION_COMPACT_KEYS = ["id","job_card_number","production_date","status","material_assigned","material_weight_grams"]
+
+def _parse_production_cursor(cursor: str):
+    # Cursor is "<production_date>_<id>" of the last row on the previous page
+    try:
+        d, _, pid = cursor.partition("_")
+        return date.fromisoformat(d), uuid.UUID(pid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/production")
+async def get_production(
+    q: str = "", status: str = "", job_card_id: Optional[str] = None,
+    start: Optional[date] = None, end: Optional[date] = None,
+    cursor: Optional[str] = None, page_size: int = Query(50, ge=1, le=500),
+    compact: bool = False, include_total: bool = False, fmt: ListFormat = Depends(), db=Depends(get_db)
+):
+    where_clauses = []
+    params = {}
+    if q:
+        where_clauses.append("(LOWER(jc.job_card_number) LIKE :q OR LOWER(pr.material_assigned) LIKE :q)")
+        params["q"] = f"%{q.lower()}%"
+    if status:
+        where_clauses.append("pr.status = ANY(:st)")
+        params["st"] = [s.strip() for s in status.split(",") if s.strip()]
+    if job_card_id:
+        where_clauses.append("pr.job_card_id = CAST(:jcid AS uuid)")
+        params["jcid"] = job_card_id
+    if start:
+        where_clauses.append("pr.production_date >= :start")
+        params["start"] = start
+    if end:
+        where_clauses.append("pr.production_date <= :end")
+        params["end"] = end
+    filters = list(where_clauses)
+    if cursor:
+        where_clauses.append("(pr.production_date, pr.id) < (:cdate, :cid)")
+        params["cdate"], params["cid"] = _parse_production_cursor(cursor)
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    base = "FROM production pr JOIN job_cards jc ON pr.job_card_id=jc.id"
+
+    keys = PRODUCTION_COMPACT_KEYS if compact else PRODUCTION_KEYS
+    params["limit"] = page_size + 1
+    try:
+        r = await db.execute(text(f"""
+            SELECT {", ".join(PRODUCTION_COLUMNS[k] for k in keys)}
+            {base}{where} ORDER BY pr.production_date DESC, pr.id DESC LIMIT :limit
+        """), params)
+        rows = r.fetchall()
+        total = None
+        if include_total:
+            count_where = (" WHERE " + " AND ".join(filters)) if filters else ""
+            count_r = await db.execute(text(f"SELECT COUNT(*) {base}{count_where}"), params)
+            total = count_r.scalar()
+    except HTTPException:
+        raise
+    except Exception as e:
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = [serialize_row(row, keys) for row in rows[:page_size]]
+    if not compact:
+        items = [ProductionOut(**d).model_dump() for d in items]
+    next_cursor = f"{items[-1]['production_date']}_{items[-1]['id']}" if len(rows) > page_size else None
+    return render_list({"items": items, "next_cursor": next_cursor, "page_size": page_size, "total": total}, fmt, keys)
+
+@router.post("/production", response_model=ProductionOut)
+async def create_production(item: ProductionCreate, db=Depends(get_db)):
+    if ingest.writer.running:
+        try:
+            production_date = date.fromisoformat(item.production_date) if item.production_date else date.today()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await ingest.accept("production", {
+            "id": str(uuid.uuid4()), "job_card_id": item.job_card_id, "material_assigned": item.material_assigned,
+            "material_weight_grams": item.material_weight_grams, "material_cost": item.material_cost,
+            "production_date": production_date.isoformat(), "notes": item.notes,
+        })
+    try:
+        r = await db.execute(
+            text("""INSERT INTO production (job_card_id, material_assigned, material_weight_grams, material_cost, production_date, notes)
+                    VALUES (:jcid, :ma, :mwg, :mc, COALESCE(:pd, CURRENT_DATE), :notes) RETURNING id, status, production_date"""),
+            {"jcid": item.job_card_id, "ma": item.material_assigned, "mwg": item.material_weight_grams,
+             "mc": item.material_cost, "notes": item.notes,
+             "pd": date.fromisoformat(item.production_date) if item.production_date else None}
+        )
+        await db.commit()
+        row = r.fetchone()
+        return ProductionOut(
+            id=str(row[0]), job_card_id=item.job_card_id,
+            material_assigned=item.material_assigned, material_weight_grams=item.material_weight_grams,
+            material_cost=item.material_cost, production_date=row[2].isoformat(),
+            status=row[1], notes=item.notes
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Material Consumption Analytics (served from production_daily_rollup) ---
+MATERIAL_DIMENSIONS = {
+    "material": (["r.material"], ["material"]),
+    "artisan": (["r.artisan_id", "u.name"], ["artisan_id", "artisan_name"]),
+    "category": (["r.category_id", "cat.name"], ["category_id", "category_name"]),
+}
+
+@router.get("/analytics/material-consumption")
+async def get_material_consumption(
+    bucket: str = Query("month", pattern="^(day|week|month)$"), group_by: str = "material",
+    start: Optional[date] = None, end: Optional[date] = None, db=Depends(get_db_for("analytics"))
+):
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dims if d not in MATERIAL_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(unknown)}")
+    cols, keys = [], ["bucket"]
+    for d in dims:
+        cols += MATERIAL_DIMENSIONS[d][0]
+        keys += MATERIAL_DIMENSIONS[d][1]
+    where_clauses = []
+    params = {}
+    if start:
+        where_clauses.append("r.production_date >= :start")
+        params["start"] = start
+    if end:
+        where_clauses.append("r.production_date <= :end")
+        params["end"] = end
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    select_cols = "".join(f", {c}" for c in cols)
+    group_cols = ", ".join(["1"] + cols)
+    r = await db.execute(text(f"""
+        SELECT date_trunc('{bucket}', r.production_date)::date{select_cols},
+               SUM(r.entries), SUM(r.material_weight_grams), SUM(r.wastage_grams), SUM(r.material_cost)
+        FROM production_daily_rollup r
+        LEFT JOIN users u ON r.artisan_id = u.id
+        LEFT JOIN sku_category cat ON r.category_id = cat.id{where}
+        GROUP BY {group_cols} HAVING SUM(r.entries) <> 0 ORDER BY {group_cols}
+    """), params)
+    items = []
+    totals = {"entries": 0, "material_weight_grams": 0.0, "wastage_grams": 0.0, "material_cost": 0.0}
+    for row in r.fetchall():
+        d = serialize_row(row, keys)
+        entries, weight, wastage, cost = row[len(keys):]
+        d.update({"entries": int(entries), "material_weight_grams": float(weight),
+                  "wastage_grams": float(wastage), "material_cost": float(cost),
+                  "wastage_pct": ratio(wastage, weight, 100), "cost_per_gram": ratio(cost, weight)})
+        for k in totals:
+            totals[k] += d[k]
+        items.append(d)
+    totals["wastage_pct"] = ratio(totals["wastage_grams"], totals["material_weight_grams"], 100)
+    totals["cost_per_gram"] = ratio(totals["material_cost"], totals["material_weight_grams"])
+    return {"bucket": bucket, "group_by": dims, "items": items, "totals": totals}
+
+@router.post("/analytics/material-consumption/rebuild")
+async def rebuild_material_consumption(db=Depends(get_db_for("analytics"))):
+    try:
+        await db.execute(text("SELECT rebuild_production_rollup()"))
+        await db.commit()
+        return {"status": "rebuilt"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,383 @@
+"""
+AMARA ERP/MIS - Products with search, pagination, update, delete
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
+from typing import Optional
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from database import get_db
+from models import ProductOut, ProductCreate, ProductUpdate, ProductBulkUpdateRequest, ProductBulkArchiveRequest
+from common import BULK_MAX_ITEMS, query_canceled, serialize_row
+from lookup_map import lookup_map, PRODUCT_LOOKUP_FIELDS
+from response_cache import response_cache
+from response_encoding import ListFormat, render_list
+import audit
+
+router = APIRouter(prefix="/api")
+
+# --- Products with search, pagination, update, delete ---
+PRODUCTS_BASE_QUERY = """
+    SELECT p.id, p.name, p.description, p.sku, p.sequence_num,
+           p.face_value_id, p.category_id, p.material_id, p.motif_id,
+           p.finding_id, p.locking_id, p.size_id, p.is_active, p.created_at, p.updated_at,
+           fv.code, cat.code, mat.code, mot.code, fin.code, loc.code, sz.code,
+           fv.name, cat.name, mat.name, mot.name, fin.name, loc.name, sz.name
+    FROM products p
+    JOIN sku_face_value fv ON p.face_value_id = fv.id
+    JOIN sku_category cat ON p.category_id = cat.id
+    JOIN sku_material mat ON p.material_id = mat.id
+    JOIN sku_motif mot ON p.motif_id = mot.id
+    JOIN sku_finding fin ON p.finding_id = fin.id
+    JOIN sku_locking loc ON p.locking_id = loc.id
+    JOIN sku_size sz ON p.size_id = sz.id
+"""
+
+PRODUCT_KEYS = ["id","name","description","sku","sequence_num",
+    "face_value_id","category_id","material_id","motif_id",
+    "finding_id","locking_id","size_id","is_active","created_at","updated_at",
+    "face_value_code","category_code","material_code","motif_code",
+    "finding_code","locking_code","size_code",
+    "face_value_name","category_name","material_name","motif_name",
+    "finding_name","locking_name","size_name"]
+
+# shape=normalized: products carry only lookup ids; codes/names come once per response from lookup_map
+PRODUCT_NORMALIZED_KEYS = ["id","name","description","sku","sequence_num",
+    "face_value_id","category_id","material_id","motif_id",
+    "finding_id","locking_id","size_id","is_active","created_at","updated_at"]
+PRODUCTS_NORMALIZED_QUERY = f"SELECT {', '.join('p.' + k for k in PRODUCT_NORMALIZED_KEYS)} FROM products p"
+
+# Fields PUT /products/{id} can change, diffed into the audit log
+AUDITED_FIELDS = ["id", "name", "description", "is_active"]
+
+def normalized_products(rows):
+    return [ProductOut(**serialize_row(row, PRODUCT_NORMALIZED_KEYS)).model_dump(include=set(PRODUCT_NORMALIZED_KEYS)) for row in rows]
+
+def _normalized_filters(q, category, material):
+    """Filters on the products table alone; lookup names are resolved to ids through lookup_map."""
+    where_clauses = []
+    params = {}
+    if q:
+        where_clauses.append("(LOWER(p.name) LIKE :q OR LOWER(p.sku) LIKE :q OR LOWER(p.description) LIKE :q)")
+        params["q"] = f"%{q.lower()}%"
+    if category:
+        where_clauses.append("p.category_id = ANY(CAST(:cat AS uuid[]))")
+        params["cat"] = lookup_map.ids_named("category", category)
+    if material:
+        where_clauses.append("p.material_id = ANY(CAST(:mat AS uuid[]))")
+        params["mat"] = lookup_map.ids_named("material", material)
+    return where_clauses, params
+
+@router.get("/products")
+async def get_products(
+    q: str = "", page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200),
+    category: str = "", material: str = "", shape: str = Query("full", pattern="^(full|normalized)$"),
+    fmt: ListFormat = Depends(), db=Depends(get_db)
+):
+    normalized = shape == "normalized"
+    if normalized:
+        await lookup_map.ensure_loaded(db)
+        where_clauses, params = _normalized_filters(q, category, material)
+    else:
+        where_clauses = []
+        params = {}
+        if q:
+            where_clauses.append("(LOWER(p.name) LIKE :q OR LOWER(p.sku) LIKE :q OR LOWER(p.description) LIKE :q)")
+            params["q"] = f"%{q.lower()}%"
+        if category:
+            where_clauses.append("cat.name = :cat")
+            params["cat"] = category
+        if material:
+            where_clauses.append("mat.name = :mat")
+            params["mat"] = material
+
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+
+    if normalized:
+        count_r = await db.execute(text(f"SELECT COUNT(*) FROM products p{where}"), params)
+    else:
+        count_r = await db.execute(text(f"SELECT COUNT(*) FROM products p JOIN sku_category cat ON p.category_id=cat.id JOIN sku_material mat ON p.material_id=mat.id{where}"), params)
+    total = count_r.scalar()
+
+    offset = (page - 1) * page_size
+    params["limit"] = page_size
+    params["offset"] = offset
+    query = PRODUCTS_NORMALIZED_QUERY if normalized else PRODUCTS_BASE_QUERY
+    r = await db.execute(text(f"{query}{where} ORDER BY p.created_at DESC LIMIT :limit OFFSET :offset"), params)
+    rows = r.fetchall()
+    total_pages = max(1, (total + page_size - 1) // page_size)
+    if normalized:
+        items = normalized_products(rows)
+        payload = {"items": items, "lookups": lookup_map.for_items(items), "total": total, "page": page,
+                   "page_size": page_size, "total_pages": total_pages}
+        return render_list(payload, fmt, PRODUCT_NORMALIZED_KEYS)
+    items = [ProductOut(**serialize_row(row, PRODUCT_KEYS)).model_dump() for row in rows]
+    return render_list({"items": items, "total": total, "page": page, "page_size": page_size, "total_pages": total_pages}, fmt, PRODUCT_KEYS)
+
+# --- Catalog facets (cached per query string by ResponseCacheMiddleware, tag "products") ---
+FACET_COLUMNS = [f"p.{field}" for field in PRODUCT_LOOKUP_FIELDS.values()] + ["p.is_active"]
+
+@router.get("/products/facets")
+async def get_product_facets(q: str = "", category: str = "", material: str = "", db=Depends(get_db)):
+    await lookup_map.ensure_loaded(db)
+    where_clauses, params = _normalized_filters(q, category, material)
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    cols = ", ".join(FACET_COLUMNS)
+    sets = ", ".join(f"({c})" for c in FACET_COLUMNS)
+    r = await db.execute(text(f"""
+        SELECT GROUPING({cols}), {cols}, COUNT(*)
+        FROM products p{where}
+        GROUP BY GROUPING SETS ({sets}, ())
+    """), params)
+
+    # GROUPING() sets bit (n-1-i) when column i is not part of the row's grouping set
+    n = len(FACET_COLUMNS)
+    keys = list(PRODUCT_LOOKUP_FIELDS)
+    facets = {key: [] for key in keys}
+    facets["is_active"] = []
+    total = 0
+    for row in r.fetchall():
+        mask, values, count = row[0], row[1:n + 1], row[n + 1]
+        if mask == (1 << n) - 1:
+            total = count
+            continue
+        i = next(i for i in range(n) if not mask & (1 << (n - 1 - i)))
+        if i == n - 1:
+            facets["is_active"].append({"value": values[i], "count": count})
+            continue
+        id_ = str(values[i])
+        entry = lookup_map.get(keys[i], id_) or {}
+        facets[keys[i]].append({"id": id_, "code": entry.get("code"), "name": entry.get("name"), "count": count})
+    for values in facets.values():
+        values.sort(key=lambda v: -v["count"])
+    return {"total": total, "facets": facets}
+
+@router.post("/products", response_model=ProductOut)
+async def create_product(item: ProductCreate, db=Depends(get_db)):
+    try:
+        r = await db.execute(
+            text("""INSERT INTO products (name, description, face_value_id, category_id, material_id, motif_id, finding_id, locking_id, size_id)
+                    VALUES (:name, :description, :fv, :cat, :mat, :mot, :fin, :loc, :sz)
+                    RETURNING id, sku, sequence_num, created_at"""),
+            {"name": item.name, "description": item.description,
+             "fv": item.face_value_id, "cat": item.category_id, "mat": item.material_id,
+             "mot": item.motif_id, "fin": item.finding_id, "loc": item.locking_id, "sz": item.size_id}
+        )
+        await db.commit()
+        await response_cache.invalidate("products")
+        row = r.fetchone()
+        audit.record("product", row[0], "create", after={"sku": row[1], "name": item.name, "description": item.description})
+        return ProductOut(
+            id=str(row[0]), name=item.name, description=item.description,
+            sku=row[1], sequence_num=row[2],
+            face_value_id=item.face_value_id, category_id=item.category_id,
+            material_id=item.material_id, motif_id=item.motif_id,
+            finding_id=item.finding_id, locking_id=item.locking_id,
+            size_id=item.size_id, created_at=row[3].isoformat() if row[3] else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Optimistic concurrency: a product's ETag is its updated_at ---
+def _parse_if_match(if_match):
+    """Expected updated_at from an If-Match header; None when absent or '*'."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return datetime.fromisoformat(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a product ETag (its updated_at)")
+
+async def _missing_or_conflict(db, product_id, expected):
+    # Only reached when the single-statement write matched no row
+    await db.rollback()
+    if expected is not None:
+        r = await db.execute(text("SELECT 1 FROM products WHERE id = :id"), {"id": product_id})
+        if r.first():
+            raise HTTPException(status_code=412, detail="Product was modified by another request; reload and retry")
+    raise HTTPException(status_code=404, detail="Product not found")
+
+def with_lookups(product):
+    """Fill *_code/*_name from the cached lookup map instead of joining the lookup tables."""
+    for key, field in PRODUCT_LOOKUP_FIELDS.items():
+        entry = lookup_map.get(key, product[field]) or {}
+        product[f"{key}_code"] = entry.get("code")
+        product[f"{key}_name"] = entry.get("name")
+    return product
+
+@router.put("/products/{product_id}", response_model=ProductOut)
+async def update_product(product_id: str, item: ProductUpdate, response: Response,
+                         if_match: Optional[str] = Header(None), db=Depends(get_db)):
+    expected = _parse_if_match(if_match)
+    try:
+        sets = []
+        params = {"id": product_id}
+        if item.name is not None:
+            sets.append("name = :name")
+            params["name"] = item.name
+        if item.description is not None:
+            sets.append("description = :desc")
+            params["desc"] = item.description
+        if item.is_active is not None:
+            sets.append("is_active = :active")
+            params["active"] = item.is_active
+        if not sets:
+            raise HTTPException(status_code=400, detail="No fields to update")
+        sets.append("updated_at = NOW()")
+        where = "id = :id"
+        if expected is not None:
+            where += " AND updated_at = :expected"
+            params["expected"] = expected
+        await lookup_map.ensure_loaded(db)
+        # The locked pre-image rides along in the same statement for the audit diff
+        r = await db.execute(text(f"""
+            UPDATE products p SET {', '.join(sets)}
+            FROM (SELECT {', '.join(AUDITED_FIELDS)} FROM products WHERE {where} FOR UPDATE) old
+            WHERE p.id = old.id
+            RETURNING {', '.join('p.' + k for k in PRODUCT_NORMALIZED_KEYS)}, {', '.join('old.' + k for k in AUDITED_FIELDS)}
+        """), params)
+        row = r.fetchone()
+        if not row:
+            await _missing_or_conflict(db, product_id, expected)
+        await db.commit()
+        await response_cache.invalidate("products")
+        product = with_lookups(serialize_row(row[:len(PRODUCT_NORMALIZED_KEYS)], PRODUCT_NORMALIZED_KEYS))
+        audit.record("product", product_id, "update", serialize_row(row[len(PRODUCT_NORMALIZED_KEYS):], AUDITED_FIELDS),
+                     {k: product[k] for k in AUDITED_FIELDS})
+        response.headers["ETag"] = f'"{product["updated_at"]}"'
+        return ProductOut(**product)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: str, hard: bool = Query(False),
+                         if_match: Optional[str] = Header(None), db=Depends(get_db)):
+    expected = _parse_if_match(if_match)
+    params = {"id": product_id}
+    where = "id = :id"
+    if expected is not None:
+        where += " AND updated_at = :expected"
+        params["expected"] = expected
+    try:
+        if hard:
+            # job_cards and inventory reference products ON DELETE RESTRICT, so the FK is the reference check
+            r = await db.execute(text(f"DELETE FROM products WHERE {where} RETURNING {', '.join(PRODUCT_NORMALIZED_KEYS)}"), params)
+        else:
+            r = await db.execute(text(f"""
+                UPDATE products p SET is_active = FALSE, updated_at = NOW()
+                FROM (SELECT id, is_active FROM products WHERE {where} FOR UPDATE) old
+                WHERE p.id = old.id RETURNING old.is_active
+            """), params)
+        row = r.first()
+        if not row:
+            await _missing_or_conflict(db, product_id, expected)
+        await db.commit()
+        await response_cache.invalidate("products")
+        if hard:
+            audit.record("product", product_id, "delete", before=serialize_row(row, PRODUCT_NORMALIZED_KEYS))
+        else:
+            audit.record("product", product_id, "archive", {"is_active": row[0]}, {"is_active": False})
+        return {"status": "deleted", "mode": "hard" if hard else "soft"}
+    except HTTPException:
+        raise
+    except IntegrityError as e:
+        await db.rollback()
+        table = getattr(e.orig.__cause__, "table_name", None) or "other records"
+        raise HTTPException(status_code=409, detail=f"Cannot delete - product has {table} referencing it. Use soft delete instead.")
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Bulk update / archive ---
+@router.post("/products/bulk-update")
+async def bulk_update_products(req: ProductBulkUpdateRequest, db=Depends(get_db)):
+    """
+    Apply per-row name/description/is_active changes in one UPDATE ... FROM unnest.
+    Fields left null are unchanged; a row carrying updated_at is only written if it
+    still matches. Per-row status: updated, conflict or not_found.
+    """
+    if len(req.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    if not req.items:
+        return {"updated": 0, "results": []}
+    items = {i.id: i for i in req.items}.values()  # last duplicate wins
+    try:
+        params = {
+            "ids": [i.id for i in items], "names": [i.name for i in items],
+            "descs": [i.description for i in items], "actives": [i.is_active for i in items],
+            "expected": [datetime.fromisoformat(i.updated_at) if i.updated_at else None for i in items],
+        }
+        r = await db.execute(text("""
+            WITH v AS (
+                SELECT * FROM unnest(CAST(:ids AS uuid[]), CAST(:names AS varchar[]), CAST(:descs AS text[]),
+                                     CAST(:actives AS boolean[]), CAST(:expected AS timestamptz[]))
+                    WITH ORDINALITY AS t(id, name, description, is_active, expected, ord)
+            ), old AS (
+                SELECT id, name, description, is_active FROM products
+                WHERE id IN (SELECT id FROM v) FOR UPDATE
+            ), u AS (
+                UPDATE products p SET name = COALESCE(v.name, p.name),
+                    description = COALESCE(v.description, p.description),
+                    is_active = COALESCE(v.is_active, p.is_active), updated_at = NOW()
+                FROM v JOIN old ON old.id = v.id  -- joined so the pre-images are locked before the update
+                WHERE p.id = v.id AND (v.expected IS NULL OR p.updated_at = v.expected)
+                RETURNING p.id, p.updated_at, p.name, p.description, p.is_active
+            )
+            SELECT v.id, u.updated_at, old.id IS NOT NULL,
+                   old.name, old.description, old.is_active, u.name, u.description, u.is_active
+            FROM v LEFT JOIN u ON u.id = v.id LEFT JOIN old ON old.id = v.id
+            ORDER BY v.ord
+        """), params)
+        rows = r.fetchall()
+        await db.commit()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    await response_cache.invalidate("products")
+    audit.record_many("product", "update", [(row[0], dict(zip(AUDITED_FIELDS[1:], row[3:6])), dict(zip(AUDITED_FIELDS[1:], row[6:9])))
+                                            for row in rows if row[1]])
+    results = [{"id": str(row[0]), "status": "updated" if row[1] else ("conflict" if row[2] else "not_found"),
+                "updated_at": row[1].isoformat() if row[1] else None} for row in rows]
+    return {"updated": sum(x["status"] == "updated" for x in results), "results": results}
+
+@router.post("/products/bulk-archive")
+async def bulk_archive_products(req: ProductBulkArchiveRequest, db=Depends(get_db)):
+    """Soft-delete many products in one statement; returns which ids were archived by this call."""
+    if len(req.ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    try:
+        r = await db.execute(text("""
+            UPDATE products SET is_active = FALSE, updated_at = NOW()
+            WHERE id = ANY(CAST(:ids AS uuid[])) AND is_active
+            RETURNING id
+        """), {"ids": req.ids})
+        archived = [str(row[0]) for row in r.fetchall()]
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    await response_cache.invalidate("products")
+    audit.record_many("product", "archive", [(i, {"is_active": True}, {"is_active": False}) for i in archived])
+    archived_set = set(archived)
+    return {"archived": archived, "unchanged": [i for i in dict.fromkeys(req.ids) if i not in archived_set]}
@@ -0,0 +1,214 @@
+"""
+AMARA ERP/MIS - QC logs and QC defect analytics
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+import uuid
+from typing import Optional
+from datetime import datetime, timezone, date, timedelta
+from sqlalchemy import text
+from database import get_db, get_db_for
+from models import QCLogOut, QCLogCreate
+from common import query_canceled, ratio, serialize_row
+from response_encoding import ListFormat, render_list
+import ingest
+
+router = APIRouter(prefix="/api")
+
+# --- QC Logs ---
+@router.get("/qc-logs")
+async def get_qc_logs(q: str = "", defect_category: str = "", page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=200), fmt: ListFormat = Depends(), db=Depends(get_db)):
+    where_clauses = []
+    params = {}
+    if q:
+        where_clauses.append("(LOWER(jc.job_card_number) LIKE :q OR LOWER(u.name) LIKE :q OR LOWER(q.defect_reason) LIKE :q)")
+        params["q"] = f"%{q.lower()}%"
+    if defect_category:
+        where_clauses.append("q.defect_category = :dc")
+        params["dc"] = defect_category
+    where = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+    base = f"FROM qc_logs q JOIN job_cards jc ON q.job_card_id=jc.id LEFT JOIN users u ON q.inspected_by=u.id{where}"
+    count_r = await db.execute(text(f"SELECT COUNT(*) {base}"), params)
+    total = count_r.scalar()
+    offset = (page - 1) * page_size
+    params["limit"] = page_size
+    params["offset"] = offset
+    r = await db.execute(text(f"""
+        SELECT q.id, q.job_card_id, q.inspected_by, q.qty_passed, q.qty_failed,
+               q.defect_reason, q.defect_category, q.inspection_date, q.notes, jc.job_card_number, u.name
+        {base} ORDER BY q.inspection_date DESC LIMIT :limit OFFSET :offset
+    """), params)
+    keys = ["id","job_card_id","inspected_by","qty_passed","qty_failed","defect_reason","defect_category","inspection_date","notes","job_card_number","inspector_name"]
+    items = [QCLogOut(**serialize_row(row, keys)).model_dump() for row in r.fetchall()]
+    total_pages = max(1, (total + page_size - 1) // page_size)
+    return render_list({"items": items, "total": total, "page": page, "page_size": page_size, "total_pages": total_pages}, fmt, keys)
+
+@router.post("/qc-logs", response_model=QCLogOut)
+async def create_qc_log(item: QCLogCreate, db=Depends(get_db)):
+    if ingest.writer.running:
+        return await ingest.accept("qc_logs", {
+            "id": str(uuid.uuid4()), "job_card_id": item.job_card_id, "inspected_by": item.inspected_by,
+            "qty_passed": item.qty_passed, "qty_failed": item.qty_failed, "defect_reason": item.defect_reason,
+            "defect_category": item.defect_category, "notes": item.notes,
+            "inspection_date": datetime.now(timezone.utc).isoformat(),
+        })
+    try:
+        r = await db.execute(
+            text("""INSERT INTO qc_logs (job_card_id, inspected_by, qty_passed, qty_failed, defect_reason, defect_category, notes)
+                    VALUES (:jcid, :iby, :qp, :qf, :dr, :dc, :notes) RETURNING id, inspection_date, defect_category"""),
+            {"jcid": item.job_card_id, "iby": item.inspected_by, "qp": item.qty_passed,
+             "qf": item.qty_failed, "dr": item.defect_reason, "dc": item.defect_category, "notes": item.notes}
+        )
+        await db.commit()
+        row = r.fetchone()
+        return QCLogOut(
+            id=str(row[0]), job_card_id=item.job_card_id, inspected_by=item.inspected_by,
+            qty_passed=item.qty_passed, qty_failed=item.qty_failed,
+            defect_reason=item.defect_reason, defect_category=row[2], notes=item.notes,
+            inspection_date=row[1].isoformat() if row[1] else None
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- QC Analytics (served from qc_rollup_hourly / qc_rollup_daily) ---
+QC_DIMENSIONS = {
+    "category": (["r.defect_category", "c.name"], ["defect_category", "defect_category_name"]),
+    "job_card": (["r.job_card_id", "jc.job_card_number"], ["job_card_id", "job_card_number"]),
+    "product": (["r.product_id", "p.sku", "p.name"], ["product_id", "product_sku", "product_name"]),
+    "artisan": (["r.artisan_id", "a.name"], ["artisan_id", "artisan_name"]),
+    "inspector": (["r.inspected_by", "i.name"], ["inspector_id", "inspector_name"]),
+}
+
+QC_ROLLUP_JOINS = """
+    LEFT JOIN qc_defect_categories c ON r.defect_category = c.code
+    LEFT JOIN job_cards jc ON r.job_card_id = jc.id
+    LEFT JOIN products p ON r.product_id = p.id
+    LEFT JOIN users a ON r.artisan_id = a.id
+    LEFT JOIN users i ON r.inspected_by = i.id
+"""
+
+def qc_analytics_filters(
+    start: Optional[date] = None, end: Optional[date] = None, job_card_id: Optional[str] = None,
+    product_id: Optional[str] = None, artisan_id: Optional[str] = None,
+    inspected_by: Optional[str] = None, defect_category: Optional[str] = None,
+):
+    return {"start": start, "end": end, "job_card_id": job_card_id, "product_id": product_id,
+            "artisan_id": artisan_id, "inspected_by": inspected_by, "defect_category": defect_category}
+
+def _qc_rollup_where(filters: dict, hourly: bool):
+    where_clauses = []
+    params = {}
+    # Hourly buckets are timestamptz; day bounds are taken in UTC like the daily rollup
+    if filters["start"]:
+        where_clauses.append("r.bucket >= :start")
+        params["start"] = datetime.combine(filters["start"], datetime.min.time(), timezone.utc) if hourly else filters["start"]
+    if filters["end"]:
+        where_clauses.append("r.bucket < :end" if hourly else "r.bucket <= :end")
+        params["end"] = datetime.combine(filters["end"], datetime.min.time(), timezone.utc) + timedelta(days=1) if hourly else filters["end"]
+    for key, col in (("job_card_id", "r.job_card_id"), ("product_id", "r.product_id"),
+                     ("artisan_id", "r.artisan_id"), ("inspected_by", "r.inspected_by")):
+        if filters[key]:
+            where_clauses.append(f"{col} = CAST(:{key} AS uuid)")
+            params[key] = filters[key]
+    if filters["defect_category"]:
+        where_clauses.append("r.defect_category = :defect_category")
+        params["defect_category"] = filters["defect_category"]
+    return (" WHERE " + " AND ".join(where_clauses)) if where_clauses else "", params
+
+def _qc_dimensions(group_by: str):
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dims if d not in QC_DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(unknown)}")
+    cols, keys = [], []
+    for d in dims:
+        cols += QC_DIMENSIONS[d][0]
+        keys += QC_DIMENSIONS[d][1]
+    return dims, cols, keys
+
+@router.get("/qc/defect-categories")
+async def get_defect_categories(db=Depends(get_db)):
+    r = await db.execute(text("SELECT code, name, keywords FROM qc_defect_categories ORDER BY sort_order"))
+    return [{"code": row[0], "name": row[1], "keywords": list(row[2])} for row in r.fetchall()]
+
+@router.get("/qc/analytics/pareto")
+async def get_qc_pareto(group_by: str = "category", filters: dict = Depends(qc_analytics_filters), db=Depends(get_db_for("analytics"))):
+    dims, cols, keys = _qc_dimensions(group_by)
+    if not dims:
+        raise HTTPException(status_code=400, detail="group_by is required")
+    where, params = _qc_rollup_where(filters, hourly=False)
+    try:
+        r = await db.execute(text(f"""
+            SELECT {", ".join(cols)}, SUM(r.inspections), SUM(r.qty_passed), SUM(r.qty_failed)
+            FROM qc_rollup_daily r {QC_ROLLUP_JOINS}{where}
+            GROUP BY {", ".join(cols)} HAVING SUM(r.qty_failed) > 0
+            ORDER BY SUM(r.qty_failed) DESC
+        """), params)
+        rows = r.fetchall()
+    except HTTPException:
+        raise
+    except Exception as e:
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    total_failed = sum(int(row[-1]) for row in rows)
+    items, cumulative = [], 0
+    for row in rows:
+        d = serialize_row(row, keys)
+        failed = int(row[-1])
+        cumulative += failed
+        d.update({"inspections": int(row[-3]), "qty_passed": int(row[-2]), "qty_failed": failed,
+                  "share_pct": ratio(failed, total_failed, 100), "cumulative_pct": ratio(cumulative, total_failed, 100)})
+        items.append(d)
+    return {"group_by": dims, "total_failed": total_failed, "items": items}
+
+@router.get("/qc/analytics/trend")
+async def get_qc_trend(
+    granularity: str = Query("day", pattern="^(hour|day|week|month)$"), group_by: str = "",
+    filters: dict = Depends(qc_analytics_filters), db=Depends(get_db_for("analytics"))
+):
+    dims, cols, keys = _qc_dimensions(group_by)
+    hourly = granularity == "hour"
+    where, params = _qc_rollup_where(filters, hourly=hourly)
+    bucket = "r.bucket" if granularity in ("hour", "day") else f"date_trunc('{granularity}', r.bucket)::date"
+    group_cols = ", ".join(["1"] + cols)
+    try:
+        r = await db.execute(text(f"""
+            SELECT {bucket}{"".join(f", {c}" for c in cols)},
+                   SUM(r.inspections), SUM(r.qty_passed), SUM(r.qty_failed)
+            FROM {"qc_rollup_hourly" if hourly else "qc_rollup_daily"} r {QC_ROLLUP_JOINS}{where}
+            GROUP BY {group_cols} HAVING SUM(r.inspections) <> 0 ORDER BY {group_cols}
+        """), params)
+        rows = r.fetchall()
+    except HTTPException:
+        raise
+    except Exception as e:
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    items = []
+    for row in rows:
+        d = serialize_row(row, ["bucket"] + keys)
+        passed, failed = int(row[-2]), int(row[-1])
+        d.update({"inspections": int(row[-3]), "qty_passed": passed, "qty_failed": failed,
+                  "pass_rate": ratio(passed, passed + failed, 100)})
+        items.append(d)
+    return {"granularity": granularity, "group_by": dims, "items": items}
+
+@router.post("/qc/analytics/rebuild")
+async def rebuild_qc_analytics(db=Depends(get_db_for("analytics"))):
+    try:
+        await db.execute(text("SELECT rebuild_qc_rollups()"))
+        await db.commit()
+        return {"status": "rebuilt"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        if query_canceled(e):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,140 @@
+"""
+AMARA ERP/MIS - Health, dashboard, migrations, partitions, schema/ER diagram and runtime stats
+"""
+from fastapi import APIRouter, Depends
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from database import check_database, get_db, get_db_for, pool_status
+from models import MigrationFile, DashboardStats
+from common import serialize_row
+from response_cache import response_cache
+from http_guards import admission
+from run_migrations import MIGRATIONS_DIR
+from startup_profile import profile
+from partitions import list_partitions
+from routers import loaded_routers
+
+router = APIRouter(prefix="/api")
+
+# --- Health Check ---
+@router.get("/")
+async def root():
+    return {"message": "AMARA ERP/MIS API", "status": "operational"}
+
+@router.get("/health")
+async def health():
+    db_health = await check_database()
+    return {
+        "status": "healthy" if db_health["ok"] else "unhealthy",
+        "database": "connected" if db_health["ok"] else db_health["error"],
+        "pool": pool_status(),
+    }
+
+# --- Dashboard Stats ---
+@router.get("/dashboard/stats", response_model=DashboardStats)
+async def get_dashboard_stats(db=Depends(get_db)):
+    r = await db.execute(text("SELECT COUNT(*) FROM products"))
+    total_products = r.scalar()
+    r = await db.execute(text("SELECT COUNT(*) FROM job_cards WHERE status IN ('pending','in_progress')"))
+    active_job_cards = r.scalar()
+    r = await db.execute(text("SELECT COALESCE(SUM(stock_qty * selling_price), 0) FROM inventory"))
+    total_inv_value = float(r.scalar())
+    r = await db.execute(text("SELECT COALESCE(SUM(qty_passed),0), COALESCE(SUM(qty_passed + qty_failed),0) FROM qc_logs"))
+    row = r.fetchone()
+    qc_pass_rate = (float(row[0]) / float(row[1]) * 100) if row[1] > 0 else 100.0
+    r = await db.execute(text("SELECT COUNT(*) FROM users"))
+    total_users = r.scalar()
+    r = await db.execute(text("SELECT COUNT(*) FROM dices"))
+    total_dices = r.scalar()
+    r = await db.execute(text("SELECT COUNT(*) FROM job_cards WHERE status='pending'"))
+    pending = r.scalar()
+    r = await db.execute(text("SELECT COUNT(*) FROM job_cards WHERE status='completed'"))
+    completed = r.scalar()
+    return DashboardStats(
+        total_products=total_products, active_job_cards=active_job_cards,
+        total_inventory_value=total_inv_value, qc_pass_rate=round(qc_pass_rate, 1),
+        total_users=total_users, total_dices=total_dices,
+        pending_jobs=pending, completed_jobs=completed,
+    )
+
+# --- Migrations ---
+@router.get("/migrations", response_model=List[MigrationFile])
+async def get_migrations():
+    files = sorted(MIGRATIONS_DIR.glob('*.sql'))
+    return [MigrationFile(filename=f.name, content=f.read_text()) for f in files]
+
+@router.get("/migrations/status")
+async def get_migration_status(db=Depends(get_db)):
+    try:
+        r = await db.execute(text("SELECT filename, checksum, duration_ms, applied_at FROM schema_migrations ORDER BY filename"))
+    except ProgrammingError:
+        # schema_migrations is created by the first run of run_migrations.py
+        return []
+    return [serialize_row(row, ["filename", "checksum", "duration_ms", "applied_at"]) for row in r.fetchall()]
+
+@router.get("/partitions")
+async def get_partitions(db=Depends(get_db)):
+    return await list_partitions(db)
+
+# --- Schema & ER Diagram ---
+@router.get("/schema")
+async def get_schema(db=Depends(get_db_for("analytics"))):
+    r = await db.execute(text("""
+        SELECT table_name, column_name, data_type, is_nullable, column_default
+        FROM information_schema.columns WHERE table_schema = 'public'
+          AND table_name NOT IN (SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid)
+        ORDER BY table_name, ordinal_position
+    """))
+    schema = {}
+    for row in r.fetchall():
+        tbl = row[0]
+        if tbl not in schema:
+            schema[tbl] = []
+        schema[tbl].append({"column": row[1], "type": row[2], "nullable": row[3], "default": row[4]})
+    return schema
+
+@router.get("/er-diagram")
+async def get_er_diagram(db=Depends(get_db_for("analytics"))):
+    r = await db.execute(text("""
+        SELECT DISTINCT tc.table_name, kcu.column_name, ccu.table_name AS foreign_table, ccu.column_name AS foreign_column
+        FROM information_schema.table_constraints tc
+        JOIN information_schema.key_column_usage kcu ON tc.constraint_name=kcu.constraint_name AND tc.table_schema=kcu.table_schema
+            AND tc.table_name=kcu.table_name
+        JOIN information_schema.constraint_column_usage ccu ON ccu.constraint_name=tc.constraint_name AND ccu.table_schema=tc.table_schema
+        WHERE tc.constraint_type='FOREIGN KEY' AND tc.table_schema='public'
+          AND tc.table_name NOT IN (SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid)
+    """))
+    relationships = [{"from_table": row[0], "from_column": row[1], "to_table": row[2], "to_column": row[3]} for row in r.fetchall()]
+
+    r2 = await db.execute(text("""
+        SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_type='BASE TABLE'
+          AND table_name NOT IN (SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid)
+        ORDER BY table_name
+    """))
+    tables = [row[0] for row in r2.fetchall()]
+
+    schema = {}
+    for tbl in tables:
+        r3 = await db.execute(text("""
+            SELECT column_name, data_type, is_nullable, column_default,
+                   (SELECT COUNT(*) FROM information_schema.table_constraints tc
+                    JOIN information_schema.key_column_usage kcu ON tc.constraint_name=kcu.constraint_name
+                    WHERE tc.table_name=c.table_name AND kcu.column_name=c.column_name AND tc.constraint_type='PRIMARY KEY') as is_pk
+            FROM information_schema.columns c WHERE table_schema='public' AND table_name=:tbl ORDER BY ordinal_position
+        """), {"tbl": tbl})
+        schema[tbl] = [{"column": row[0], "type": row[1], "nullable": row[2], "default": row[3], "is_pk": row[4] > 0} for row in r3.fetchall()]
+
+    return {"tables": tables, "relationships": relationships, "schema": schema}
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    return admission.stats()
+
+@router.get("/startup/profile")
+async def get_startup_profile():
+    return {**profile.report(), "loaded_routers": loaded_routers()}
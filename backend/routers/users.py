@@ -0,0 +1,17 @@
+"""
+AMARA ERP/MIS - Users
+"""
+from fastapi import APIRouter, Depends
+from typing import List
+from sqlalchemy import text
+from database import get_db
+from models import UserOut
+from common import serialize_row
+
+router = APIRouter(prefix="/api")
+
+# --- Users ---
+@router.get("/users", response_model=List[UserOut])
+async def get_users(db=Depends(get_db)):
+    r = await db.execute(text("SELECT id, name, email, role, phone, is_active FROM users ORDER BY name"))
+    return [UserOut(**serialize_row(row, ["id","name","email","role","phone","is_active"])) for row in r.fetchall()]
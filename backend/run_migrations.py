@@ -1,40 +1,113 @@
 """
 AMARA ERP/MIS - Migration Runner
-Executes SQL migration files against Supabase PostgreSQL
+Executes SQL migration files against Supabase PostgreSQL over the asyncpg engine.
+Runs standalone (python run_migrations.py) or at server startup when
+RUN_MIGRATIONS_ON_STARTUP=true; concurrent runners serialise on an advisory lock.
 """
-import psycopg2
+import asyncio
+import hashlib
+import logging
 import os
 import sys
+import time
 from pathlib import Path
-from dotenv import load_dotenv
+
+import database
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
-
-def run_migrations():
-    migrations_dir = ROOT_DIR / 'migrations'
-    migration_files = sorted(migrations_dir.glob('*.sql'))
-    
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.autocommit = True
-    cur = conn.cursor()
-    
-    print(f"Connected to database. Running {len(migration_files)} migrations...\n")
-    
-    for mf in migration_files:
-        print(f"  Running: {mf.name}")
+MIGRATIONS_DIR = ROOT_DIR / 'migrations'
+
+# Arbitrary app-wide key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 7_412_650_038
+MIGRATION_TIMEOUT = float(os.environ.get('MIGRATION_TIMEOUT_SECONDS', '600'))
+RUN_ON_STARTUP = os.environ.get('RUN_MIGRATIONS_ON_STARTUP', 'false').lower() == 'true'
+
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    filename VARCHAR(255) PRIMARY KEY,
+    checksum CHAR(64) NOT NULL,
+    duration_ms INTEGER,
+    applied_at TIMESTAMPTZ DEFAULT NOW()
+)
+"""
+
+
+def _checksum(sql):
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+async def run_migrations(force=False):
+    """
+    Apply migration files in filename order, skipping files whose checksum is
+    already recorded in schema_migrations (unless force). Each file is sent as
+    one multi-statement simple query, so it costs a single round trip and runs
+    in one implicit transaction. Returns a per-file report with timings.
+    """
+    migration_files = sorted(MIGRATIONS_DIR.glob('*.sql'))
+    report = []
+    async with database.init_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        raw = (await conn.get_raw_connection()).driver_connection
+
+        # Pooled connections start with the interactive statement_timeout; the lock
+        # wait and the migrations are bounded by MIGRATION_TIMEOUT instead
+        await raw.execute("SET statement_timeout = 0")
+        started = time.perf_counter()
+        await raw.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+        lock_wait_ms = round((time.perf_counter() - started) * 1000, 1)
         try:
-            sql = mf.read_text()
-            cur.execute(sql)
-            print(f"  OK: {mf.name}")
-        except Exception as e:
-            print(f"  ERROR in {mf.name}: {e}")
-    
-    cur.close()
-    conn.close()
-    print("\nAll migrations complete!")
+            await raw.execute(BOOTSTRAP_SQL)
+            applied = {r["filename"]: r["checksum"] for r in await raw.fetch("SELECT filename, checksum FROM schema_migrations")}
+
+            for mf in migration_files:
+                sql = mf.read_text()
+                checksum = _checksum(sql)
+                if not force and applied.get(mf.name) == checksum:
+                    report.append({"filename": mf.name, "status": "skipped", "duration_ms": 0})
+                    continue
+                started = time.perf_counter()
+                try:
+                    await raw.execute(sql, timeout=MIGRATION_TIMEOUT)
+                except Exception as e:
+                    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                    logger.error("Migration %s failed after %sms: %s", mf.name, duration_ms, e)
+                    report.append({"filename": mf.name, "status": "failed", "duration_ms": duration_ms, "error": str(e)})
+                    continue
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                await raw.execute("""
+                    INSERT INTO schema_migrations (filename, checksum, duration_ms) VALUES ($1, $2, $3)
+                    ON CONFLICT (filename) DO UPDATE SET checksum = EXCLUDED.checksum,
+                        duration_ms = EXCLUDED.duration_ms, applied_at = NOW()
+                """, mf.name, checksum, int(duration_ms))
+                logger.info("Migration %s applied in %sms", mf.name, duration_ms)
+                report.append({"filename": mf.name, "status": "applied", "duration_ms": duration_ms})
+        finally:
+            await raw.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+            await raw.execute("RESET statement_timeout")
+
+    return {
+        "lock_wait_ms": lock_wait_ms,
+        "applied": sum(r["status"] == "applied" for r in report),
+        "skipped": sum(r["status"] == "skipped" for r in report),
+        "failed": sum(r["status"] == "failed" for r in report),
+        "total_ms": round(sum(r["duration_ms"] for r in report), 1),
+        "files": report,
+    }
+
+
+async def _main(force):
+    print(f"Running {len(list(MIGRATIONS_DIR.glob('*.sql')))} migrations...\n")
+    result = await run_migrations(force=force)
+    for r in result["files"]:
+        line = f"  {r['status'].upper():8} {r['filename']} ({r['duration_ms']}ms)"
+        print(line + (f": {r['error']}" if "error" in r else ""))
+    print(f"\n{result['applied']} applied, {result['skipped']} unchanged, {result['failed']} failed in {result['total_ms']}ms")
+    await database.dispose_engine()
+    return result["failed"] == 0
+
 
 if __name__ == '__main__':
-    run_migrations()
+    ok = asyncio.run(_main(force='--force' in sys.argv))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,160 @@
+"""
+AMARA ERP/MIS - Production Scheduler
+Assigns pending job cards to artisans and compatible dices, minimising lateness
+"""
+import heapq
+import math
+from datetime import date, timedelta
+from sqlalchemy import text
+from dice_index import dice_index
+
+PRIORITY_RANK = {"urgent": 0, "high": 1, "normal": 2, "low": 3}
+DEFAULT_DAILY_CAPACITY = 20
+
+
+async def load_scheduler_inputs(db):
+    """Fetch open job cards, active artisans and dice compatibility for their products."""
+    r = await db.execute(text("""
+        SELECT jc.id, jc.job_card_number, jc.status, jc.priority, jc.due_date,
+               GREATEST(jc.target_qty - COALESCE(jc.completed_qty, 0), 0),
+               jc.assigned_artisan_id, jc.assigned_dice_id, p.motif_id, p.locking_id
+        FROM job_cards jc JOIN products p ON jc.product_id = p.id
+        WHERE jc.status IN ('pending', 'in_progress')
+        ORDER BY jc.created_at
+    """))
+    cards = [{
+        "id": str(row[0]), "job_card_number": row[1], "status": row[2],
+        "priority": row[3] or "normal", "due_date": row[4], "remaining_qty": row[5],
+        "artisan_id": str(row[6]) if row[6] else None,
+        "dice_id": str(row[7]) if row[7] else None,
+        "motif_id": str(row[8]), "locking_id": str(row[9]),
+    } for row in r.fetchall()]
+
+    r = await db.execute(text("SELECT id, name, daily_capacity FROM users WHERE role = 'artisan' AND is_active = TRUE ORDER BY name"))
+    artisans = [{"id": str(row[0]), "name": row[1], "daily_capacity": row[2]} for row in r.fetchall()]
+
+    await dice_index.ensure_loaded(db)
+    compatible, dice_numbers = {}, {}
+    for c in cards:
+        pair = (c["motif_id"], c["locking_id"])
+        if pair not in compatible:
+            dices = dice_index.dices_for(*pair)
+            compatible[pair] = [d["id"] for d in dices]
+            dice_numbers.update((d["id"], d["dice_number"]) for d in dices)
+    return cards, artisans, compatible, dice_numbers
+
+
+def _sort_key(card):
+    # Earliest due date first; priority orders ties and cards without a due date
+    due = card["due_date"] or date.max
+    return (due, PRIORITY_RANK.get(card["priority"], 2))
+
+
+def _day(today, offset):
+    return today + timedelta(days=offset)
+
+
+def build_plan(cards, artisans, compatible, dice_numbers, today=None,
+               default_capacity=DEFAULT_DAILY_CAPACITY, require_dice=True, keep_assigned=True):
+    """
+    Greedy list scheduling: pending cards in due-date order go to the artisan
+    who frees up first, on the compatible dice that frees up first.
+    Times are in calendar days from `today`; in-progress cards are existing load.
+    """
+    today = today or date.today()
+    capacity = {a["id"]: a["daily_capacity"] or default_capacity for a in artisans}
+    names = {a["id"]: a["name"] for a in artisans}
+    free_at = {aid: 0.0 for aid in capacity}
+    dice_free_at = {}
+
+    for c in cards:
+        if c["status"] != "in_progress" or c["artisan_id"] not in capacity:
+            continue
+        free_at[c["artisan_id"]] += c["remaining_qty"] / capacity[c["artisan_id"]]
+        if c["dice_id"]:
+            dice_free_at[c["dice_id"]] = max(dice_free_at.get(c["dice_id"], 0.0), free_at[c["artisan_id"]])
+
+    # Lazy-deletion heap: an entry is stale once free_at has moved past it
+    heap = [(t, aid) for aid, t in free_at.items()]
+    heapq.heapify(heap)
+
+    assignments, unscheduled = [], []
+    for c in sorted((c for c in cards if c["status"] == "pending"), key=_sort_key):
+        dices = compatible.get((c["motif_id"], c["locking_id"]), [])
+        if require_dice and not dices:
+            unscheduled.append({"job_card_id": c["id"], "job_card_number": c["job_card_number"], "reason": "no_compatible_dice"})
+            continue
+
+        if keep_assigned and c["artisan_id"] in capacity:
+            aid = c["artisan_id"]
+        else:
+            while heap and heap[0][0] != free_at[heap[0][1]]:
+                heapq.heappop(heap)
+            if not heap:
+                unscheduled.append({"job_card_id": c["id"], "job_card_number": c["job_card_number"], "reason": "no_artisan_available"})
+                continue
+            aid = heap[0][1]
+
+        dice_id = min(dices, key=lambda d: dice_free_at.get(d, 0.0)) if dices else None
+        start = max(free_at[aid], dice_free_at.get(dice_id, 0.0) if dice_id else 0.0)
+        finish = start + c["remaining_qty"] / capacity[aid]
+        free_at[aid] = finish
+        heapq.heappush(heap, (finish, aid))
+        if dice_id:
+            dice_free_at[dice_id] = finish
+
+        finish_date = _day(today, max(math.ceil(finish) - 1, int(start)))
+        lateness = max(0, (finish_date - c["due_date"]).days) if c["due_date"] else 0
+        assignments.append({
+            "job_card_id": c["id"], "job_card_number": c["job_card_number"],
+            "priority": c["priority"], "remaining_qty": c["remaining_qty"],
+            "artisan_id": aid, "artisan_name": names[aid],
+            "dice_id": dice_id, "dice_number": dice_numbers.get(dice_id),
+            "start_date": _day(today, int(start)).isoformat(),
+            "finish_date": finish_date.isoformat(),
+            "due_date": c["due_date"].isoformat() if c["due_date"] else None,
+            "lateness_days": lateness,
+        })
+
+    late = [a["lateness_days"] for a in assignments if a["lateness_days"] > 0]
+    return {
+        "generated_for": today.isoformat(),
+        "assignments": assignments,
+        "unscheduled": unscheduled,
+        "summary": {
+            "scheduled": len(assignments), "unscheduled": len(unscheduled),
+            "late_cards": len(late), "total_lateness_days": sum(late),
+            "max_lateness_days": max(late, default=0),
+            "makespan_days": round(max(free_at.values(), default=0.0), 2),
+        },
+    }
+
+
+SCHEDULED_FIELDS = ["assigned_artisan_id", "assigned_dice_id", "start_date"]
+
+
+async def apply_plan(db, plan):
+    """
+    Write artisan, dice and start date for every planned card that is still
+    pending. Returns (job card id, before, after) for each card updated, for
+    audit.record_many once the caller has committed.
+    """
+    rows = [{"id": a["job_card_id"], "aid": a["artisan_id"], "did": a["dice_id"],
+             "sd": date.fromisoformat(a["start_date"])} for a in plan["assignments"]]
+    if not rows:
+        return []
+    # prev is read from the statement's snapshot, so it holds the values before the update
+    r = await db.execute(text("""
+        UPDATE job_cards jc
+        SET assigned_artisan_id = v.aid, assigned_dice_id = v.did, start_date = v.sd, updated_at = NOW()
+        FROM (SELECT unnest(CAST(:ids AS uuid[])) AS id, unnest(CAST(:aids AS uuid[])) AS aid,
+                     unnest(CAST(:dids AS uuid[])) AS did, unnest(CAST(:sds AS date[])) AS sd) v,
+             job_cards prev
+        WHERE jc.id = v.id AND prev.id = jc.id AND jc.status = 'pending'
+        RETURNING jc.id, prev.assigned_artisan_id, prev.assigned_dice_id, prev.start_date,
+                  jc.assigned_artisan_id, jc.assigned_dice_id, jc.start_date
+    """), {"ids": [x["id"] for x in rows], "aids": [x["aid"] for x in rows],
+           "dids": [x["did"] for x in rows], "sds": [x["sd"] for x in rows]})
+    n = len(SCHEDULED_FIELDS)
+    return [(row[0], dict(zip(SCHEDULED_FIELDS, row[1:1 + n])), dict(zip(SCHEDULED_FIELDS, row[1 + n:])))
+            for row in r.fetchall()]
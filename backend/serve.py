@@ -0,0 +1,91 @@
+"""
+AMARA ERP/MIS - Production Server
+Runs N uvicorn workers behind one supervisor:
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8001]
+
+- Workers default to WEB_CONCURRENCY, else the CPUs available to this process.
+- DB_MAX_CONNECTIONS is the connection budget for the whole machine; each worker
+  gets an equal share as pool_size + max_overflow, and its pre-warm and route-class
+  budgets are clamped to that share.
+- The supervisor serves the response cache over a Unix socket (cache_channel.py)
+  so workers share entries and invalidations.
+- Client addresses come from X-Forwarded-For only for proxies listed in
+  FORWARDED_ALLOW_IPS (uvicorn's setting, default 127.0.0.1).
+- On SIGTERM/SIGINT workers stop accepting connections and get
+  GRACEFUL_SHUTDOWN_SECONDS to finish in-flight requests before the lifespan
+  shutdown disposes their pools.
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger("serve")
+
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "40"))
+GRACEFUL_SHUTDOWN_SECONDS = int(os.environ.get("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+MIN_CONNECTIONS_PER_WORKER = 2
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_workers(requested=None, budget=DB_MAX_CONNECTIONS):
+    """Worker count and per-worker pool settings that fit the global connection budget."""
+    workers = requested or int(os.environ.get("WEB_CONCURRENCY", "0")) or available_cpus()
+    workers = max(1, min(workers, budget // MIN_CONNECTIONS_PER_WORKER))
+    per_worker = budget // workers
+    pool_size = max(1, per_worker * 3 // 4)
+    return {
+        "workers": workers,
+        "env": {
+            "DB_POOL_SIZE": str(pool_size),
+            "DB_MAX_OVERFLOW": str(per_worker - pool_size),
+            "DB_POOL_PREWARM": str(min(int(os.environ.get("DB_POOL_PREWARM", "2")), pool_size)),
+            "DB_POOL_BUDGET_EXPORT": str(max(1, min(int(os.environ.get("DB_POOL_BUDGET_EXPORT", "2")), per_worker // 4))),
+            "DB_POOL_BUDGET_ANALYTICS": str(max(1, min(int(os.environ.get("DB_POOL_BUDGET_ANALYTICS", "3")), per_worker // 3))),
+            "DB_POOL_BUDGET_JOBS": str(max(1, min(int(os.environ.get("DB_POOL_BUDGET_JOBS", "2")), per_worker // 4))),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AMARA API with multiple workers")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    plan = plan_workers(args.workers)
+    # Workers inherit the supervisor's environment, so database.py picks these up at import
+    os.environ.update(plan["env"])
+
+    socket_path = None
+    if plan["workers"] > 1 and os.environ.get("RESPONSE_CACHE_BACKEND", "memory") == "memory":
+        from cache_channel import CacheServer
+        socket_path = os.environ.get("CACHE_SOCKET_PATH") or os.path.join(tempfile.mkdtemp(prefix="amara-"), "cache.sock")
+        CacheServer(socket_path).start_thread()
+        os.environ.update(CACHE_SOCKET_PATH=socket_path, RESPONSE_CACHE_BACKEND="cache_channel:create_backend")
+        logger.info("Shared cache channel on %s", socket_path)
+
+    logger.info("Starting %s workers, %s", plan["workers"], " ".join(f"{k}={v}" for k, v in plan["env"].items()))
+
+    import uvicorn
+    try:
+        uvicorn.run(
+            "server:app", host=args.host, port=args.port, workers=plan["workers"],
+            timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS, proxy_headers=True,
+        )
+    finally:
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    main()
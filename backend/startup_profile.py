@@ -0,0 +1,45 @@
+"""
+AMARA ERP/MIS - Startup Profile
+Wall-clock breakdown of cold start: module imports, engine creation, pool
+pre-warm and router loading. Phases are always recorded (the cost is a
+perf_counter call); STARTUP_PROFILE=true also logs the table at startup.
+"""
+import contextlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_ms = None
+        self.phases = []
+
+    @property
+    def enabled(self):
+        # Read lazily: this module is imported before database.py loads .env
+        return os.environ.get("STARTUP_PROFILE", "false").lower() == "true"
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": name, "ms": round((time.perf_counter() - t0) * 1000, 2),
+                                "at_ms": round((t0 - self.started) * 1000, 2)})
+
+    def mark_ready(self):
+        self.ready_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        if self.enabled:
+            logger.info("Startup profile (ready after %sms):\n%s", self.ready_ms, "\n".join(
+                f"  {p['at_ms']:>9.2f}ms  +{p['ms']:>8.2f}ms  {p['phase']}" for p in self.phases))
+
+    def report(self):
+        return {"enabled": self.enabled, "ready_ms": self.ready_ms, "phases": self.phases}
+
+
+profile = StartupProfile()
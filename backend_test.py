@@ -372,7 +372,7 @@ class AMARAAPITester:
         success, response = self.run_test("Get Production", "GET", "production", 200,
                                         description="Retrieve production details with material assignments")
         if success:
-            print(f"   ⚙️ Found {len(response)} production entries")
+            print(f"   ⚙️ Found {len(response.get('items', []))} production entries on first page")
 
     def test_migrations(self):
         """Test migrations viewer"""
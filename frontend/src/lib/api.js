@@ -13,9 +13,12 @@ export const deleteLookup = (key, id) => api.delete(`/lookups/${key}/${id}`).the
 
 // Products (paginated)
 export const fetchProducts = (params = {}) => api.get('/products', { params }).then(r => r.data);
+export const fetchProductFacets = (params = {}) => api.get('/products/facets', { params }).then(r => r.data);
 export const createProduct = (data) => api.post('/products', data).then(r => r.data);
-export const updateProduct = (id, data) => api.put(`/products/${id}`, data).then(r => r.data);
+export const updateProduct = (id, data, updatedAt) => api.put(`/products/${id}`, data, updatedAt ? { headers: { 'If-Match': `"${updatedAt}"` } } : undefined).then(r => r.data);
 export const deleteProduct = (id, hard = false) => api.delete(`/products/${id}`, { params: { hard } }).then(r => r.data);
+export const bulkUpdateProducts = (items) => api.post('/products/bulk-update', { items }).then(r => r.data);
+export const bulkArchiveProducts = (ids) => api.post('/products/bulk-archive', { ids }).then(r => r.data);
 export const previewSKU = (data) => api.post('/sku/preview', data).then(r => r.data);
 
 // Users
@@ -35,6 +38,8 @@ export const createDiceLockingMapping = (data) => api.post('/dice-mappings/locki
 export const fetchJobCards = (params = {}) => api.get('/job-cards', { params }).then(r => r.data);
 export const createJobCard = (data) => api.post('/job-cards', data).then(r => r.data);
 export const updateJobCardStatus = (id, status) => api.patch(`/job-cards/${id}/status?status=${status}`).then(r => r.data);
+export const fetchJobCard = (id) => api.get(`/job-cards/${id}`).then(r => r.data);
+export const fetchArchivedJobCards = (params = {}) => api.get('/job-cards/archived', { params }).then(r => r.data);
 
 // QC Logs (paginated)
 export const fetchQCLogs = (params = {}) => api.get('/qc-logs', { params }).then(r => r.data);
@@ -43,9 +48,25 @@ export const createQCLog = (data) => api.post('/qc-logs', data).then(r => r.data
 // Inventory
 export const fetchInventory = (q = '') => api.get('/inventory', { params: { q } }).then(r => r.data);
 export const createInventory = (data) => api.post('/inventory', data).then(r => r.data);
+export const previewReprice = (data) => api.post('/inventory/reprice/preview', data).then(r => r.data);
+export const applyReprice = (data) => api.post('/inventory/reprice', data).then(r => r.data);
+
+// Actual product costs
+export const fetchCosts = () => api.get('/costs').then(r => r.data);
+export const recomputeCosts = () => api.post('/costs/recompute').then(r => r.data);
+export const fetchCostBreakdown = (productId) => api.get(`/products/${productId}/cost-breakdown`).then(r => r.data);
+
+// Write-behind ingestion (QC/production POSTs answer 202 when enabled)
+export const fetchIngestStatus = () => api.get('/ingest').then(r => r.data);
+export const fetchIngestedRow = (id) => api.get(`/ingest/${id}`).then(r => r.data);
+
+// Audit log
+export const fetchAuditLog = (params = {}) => api.get('/audit', { params }).then(r => r.data);
+export const fetchEntityAudit = (entityType, entityId, params = {}) => api.get(`/audit/${entityType}/${entityId}`, { params }).then(r => r.data);
+export const fetchAuditStats = () => api.get('/audit/stats').then(r => r.data);
 
 // Production
-export const fetchProduction = () => api.get('/production').then(r => r.data);
+export const fetchProduction = (params = {}) => api.get('/production', { params }).then(r => r.data);
 export const createProduction = (data) => api.post('/production', data).then(r => r.data);
 
 // Migrations
@@ -0,0 +1,12 @@
+"""
+AMARA ERP/MIS - Unit test setup
+The backend modules import flat (import database, from common import ...), so
+backend/ goes on sys.path. These tests cover pure functions only; the engine
+is created lazily and never connects, but database.py needs a URL to import.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres@localhost/amara_test")
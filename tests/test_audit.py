@@ -0,0 +1,19 @@
+from audit import diff
+
+
+def test_diff_keeps_only_changed_fields():
+    assert diff({"a": 1, "b": 2}, {"a": 1, "b": 3}) == {"b": [2, 3]}
+
+
+def test_diff_of_create_and_delete():
+    assert diff(None, {"a": 1}) == {"a": [None, 1]}
+    assert diff({"a": 1}, None) == {"a": [1, None]}
+
+
+def test_diff_covers_fields_on_either_side():
+    assert diff({"a": 1}, {"b": 2}) == {"a": [1, None], "b": [None, 2]}
+
+
+def test_diff_of_identical_values_is_empty():
+    assert diff({"a": 1, "b": None}, {"a": 1}) == {}
+    assert diff(None, None) == {}
@@ -0,0 +1,39 @@
+import numpy as np
+
+from costing import TOTAL_COLUMNS, aggregate, count_drift
+
+
+def source(rows):
+    """(product ids, one array per TOTAL_COLUMNS) from (product id, totals...) tuples."""
+    cols = list(zip(*rows))
+    return np.array(cols[0], dtype=object), [np.array(c, dtype=float) for c in cols[1:]]
+
+
+def test_aggregate_sums_every_source_per_product():
+    production = source([("p2", 1, 10.0004, 1, 100.004, 0, 0), ("p1", 1, 5, 0.5, 50, 0, 0), ("p2", 1, 10, 1, 100, 0, 0)])
+    qc = source([("p1", 0, 0, 0, 0, 8, 2)])
+    products, totals = aggregate([production, qc])
+    assert products.tolist() == ["p1", "p2"]
+    assert totals["production_entries"].tolist() == [1, 2]
+    assert totals["material_weight_grams"].tolist() == [5.0, 20.0]
+    assert totals["material_cost"].tolist() == [50.0, 200.0]
+    assert totals["qty_passed"].tolist() == [8, 0]
+    assert totals["qty_failed"].tolist() == [2, 0]
+
+
+def test_count_drift():
+    products, totals = aggregate([source([("p1", 1, 5, 0, 50, 4, 1), ("p2", 2, 10, 1, 100, 0, 0)])])
+    stored = {
+        "p1": [1, 5, 0, 50, 4, 1],       # matches
+        "p2": [2, 10, 1, 100.5, 0, 0],   # cost drifted
+        "p3": [1, 1, 0, 1, 0, 0],        # no longer has any source rows
+    }
+    old_ids = np.array(list(stored), dtype=object)
+    old_cols = [np.array([v[k] for v in stored.values()], dtype=float) for k in range(len(TOTAL_COLUMNS))]
+    assert count_drift(products, totals, old_ids, old_cols) == 2
+
+
+def test_count_drift_with_nothing_stored():
+    products, totals = aggregate([source([("p1", 1, 5, 0, 50, 0, 0)])])
+    empty = np.array([], dtype=object)
+    assert count_drift(products, totals, empty, [np.zeros(0) for _ in TOTAL_COLUMNS]) == 1
@@ -0,0 +1,31 @@
+import pytest
+
+from export_jobs import _parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=5-5", (5, 5)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    assert _parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=5-3",         # last before first: invalid, so the whole file is served
+    "bytes=0-1,5-9",     # multiple ranges are not served partially
+    "items=0-9",
+    "bytes=abc-",
+    "bytes=5",
+])
+def test_ignored_ranges(header):
+    assert _parse_range(header, 1000) == "ignore"
@@ -0,0 +1,42 @@
+import io
+import json
+
+from ingest import WriteAheadLog, read_segment
+
+
+def segment(*lines):
+    return io.BytesIO(b"".join(lines))
+
+
+def record(i):
+    return json.dumps({"table": "qc_logs", "row": {"id": f"row-{i}"}}, separators=(",", ":")).encode() + b"\n"
+
+
+def test_reads_every_record():
+    assert [r["row"]["id"] for r in read_segment(segment(record(1), record(2)))] == ["row-1", "row-2"]
+
+
+def test_stops_at_a_torn_last_line():
+    torn = record(3)[:15]
+    assert [r["row"]["id"] for r in read_segment(segment(record(1), record(2), torn))] == ["row-1", "row-2"]
+
+
+def test_empty_segment():
+    assert read_segment(segment()) == []
+
+
+def test_contains_reads_other_processes_segments_only(tmp_path):
+    wal = WriteAheadLog(directory=tmp_path)
+    wal.open()
+    try:
+        (tmp_path / "other.wal").write_bytes(record(1))
+        (tmp_path / "empty.wal").write_bytes(b"")
+        own = wal._handles[wal._current]
+        own.write(record(2))
+        own.flush()
+        assert wal.contains("row-1")
+        # This process's rows are answered from IngestWriter's pending ids
+        assert not wal.contains("row-2")
+        assert not wal.contains("row-3")
+    finally:
+        wal.close()
@@ -0,0 +1,92 @@
+"""
+Moving rows out of the DEFAULT partition (migration 015) against a migrated
+database; skipped when DATABASE_URL does not reach one. Everything runs in one
+transaction that is rolled back.
+"""
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import text
+
+import database
+
+MONTH = date(2019, 5, 1)
+SUFFIX = MONTH.strftime("%Y_%m")
+ROLLUPS = {
+    "production": "SELECT production_date, material, artisan_id, category_id, entries, material_weight_grams, "
+                  "wastage_grams, material_cost FROM production_daily_rollup WHERE entries <> 0",
+    "qc_hourly": "SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, "
+                 "qty_passed, qty_failed FROM qc_rollup_hourly WHERE inspections <> 0",
+    "qc_daily": "SELECT bucket, job_card_id, product_id, artisan_id, inspected_by, defect_category, inspections, "
+                "qty_passed, qty_failed FROM qc_rollup_daily WHERE inspections <> 0",
+    "costs": "SELECT product_id, production_entries, material_cost, qty_passed, qty_failed FROM product_costs",
+}
+
+
+async def _snapshot(q):
+    return {name: (await q(f"SELECT md5(string_agg(t::text, ',' ORDER BY t::text)) FROM ({sql}) t")).scalar()
+            for name, sql in ROLLUPS.items()}
+
+
+async def _move_keeps_attribution():
+    session = database.LazySession()
+    q = lambda sql, **params: session.execute(text(sql), params)
+    try:
+        ready = (await q("SELECT to_regproc('ensure_monthly_partitions') IS NOT NULL")).scalar()
+    except Exception as e:
+        await session.close()
+        await database.dispose_engine()
+        pytest.skip(f"no database: {e}")
+    try:
+        if not ready:
+            pytest.skip("database is not migrated")
+        for table in ("production", "qc_logs"):
+            if (await q("SELECT to_regclass(:t)", t=f"{table}_{SUFFIX}")).scalar():
+                pytest.skip(f"{table} already has a {SUFFIX} partition")
+
+        row = (await q("""
+            SELECT jc.id, jc.product_id, jc.assigned_artisan_id, p.category_id, other.id, u.id
+            FROM job_cards jc JOIN products p ON p.id = jc.product_id
+            JOIN products other ON other.category_id IS DISTINCT FROM p.category_id
+            JOIN users u ON u.id IS DISTINCT FROM jc.assigned_artisan_id
+            WHERE jc.assigned_artisan_id IS NOT NULL
+            LIMIT 1
+        """)).fetchone()
+        if row is None:
+            pytest.skip("needs a job card with an artisan and products in two categories")
+        card, product, artisan, category, other_product, other_artisan = row
+
+        production_id = (await q("""
+            INSERT INTO production (job_card_id, material_assigned, material_weight_grams, material_cost, production_date)
+            VALUES (:card, 'partition-move-test', 12.5, 250, :day) RETURNING id
+        """, card=card, day=MONTH.replace(day=10))).scalar()
+        qc_id = (await q("""
+            INSERT INTO qc_logs (job_card_id, qty_passed, qty_failed, defect_reason, inspection_date)
+            VALUES (:card, 4, 1, 'porosity', :at) RETURNING id
+        """, card=card, at=datetime(2019, 5, 10, 9, 30, tzinfo=timezone.utc))).scalar()
+        # Reassigned after the rows were written: the move must not pick this up
+        await q("UPDATE job_cards SET assigned_artisan_id = :a, product_id = :p WHERE id = :card",
+                a=other_artisan, p=other_product, card=card)
+        before = await _snapshot(q)
+
+        for table in ("production", "qc_logs"):
+            created = (await q("SELECT ensure_monthly_partitions(CAST(:t AS regclass), :d, :d)",
+                               t=table, d=MONTH)).fetchall()
+            assert [r[0] for r in created] == [f"{table}_{SUFFIX}"]
+
+        moved = (await q("SELECT tableoid::regclass::text, artisan_id, category_id FROM production WHERE id = :id",
+                         id=production_id)).fetchone()
+        assert tuple(moved) == (f"production_{SUFFIX}", artisan, category)
+        moved = (await q("SELECT tableoid::regclass::text, product_id, artisan_id FROM qc_logs WHERE id = :id",
+                         id=qc_id)).fetchone()
+        assert tuple(moved) == (f"qc_logs_{SUFFIX}", product, artisan)
+        assert await _snapshot(q) == before
+    finally:
+        await session.rollback()
+        await session.close()
+        await database.dispose_engine()
+
+
+def test_moved_rows_keep_their_attribution_and_rollups():
+    asyncio.run(_move_keeps_attribution())
@@ -0,0 +1,89 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from models import RepriceRule
+from repricing import compute_prices, summarize
+
+GOLD, SILVER = "mat-gold", "mat-silver"
+
+
+def inventory(material, weight, unit_cost, selling_price, mrp, costed=None, stock=None):
+    n = len(material)
+    return {
+        "id": np.array([f"inv-{i}" for i in range(n)], dtype=object),
+        "sku": np.array([f"SKU-{i}" for i in range(n)], dtype=object),
+        "material": np.array(material, dtype=object),
+        "weight": np.array(weight, dtype=float),
+        "stock": np.array(stock or [1] * n, dtype=float),
+        "unit_cost": np.array(unit_cost, dtype=float),
+        "selling_price": np.array(selling_price, dtype=float),
+        "mrp": np.array(mrp, dtype=float),
+        "costed": np.array(costed or [False] * n, dtype=bool),
+    }
+
+
+RULES = [
+    RepriceRule(material_id=GOLD, rate_per_gram=100, wastage_pct=10, making_charge_per_gram=5,
+                making_charge_flat=20, markup_pct=50, mrp_markup_pct=10),
+    RepriceRule(material_id=SILVER, rate_per_gram=10),
+]
+
+
+def test_prices_follow_the_material_rule():
+    inv = inventory([GOLD, SILVER], [2, 3], [0, 0], [0, 0], [0, 0])
+    new, changed, priced = compute_prices(inv, RULES)
+    # 2g * 100 * 1.1 + 2g * 5 + 20
+    assert new["unit_cost"].tolist() == [250.0, 30.0]
+    assert new["selling_price"].tolist() == [375.0, 30.0]
+    assert new["mrp"].tolist() == [413.0, 30.0]  # 412.5 rounded to the rupee
+    assert changed.tolist() == [True, True]
+    assert priced.tolist() == [True, True]
+
+
+def test_zero_current_price_does_not_warn():
+    inv = inventory([SILVER, SILVER], [3, 3], [0, 30], [0, 30], [0, 30])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        _, changed, _ = compute_prices(inv, RULES, min_change_pct=50)
+    # Any move from zero counts; an unchanged price does not
+    assert changed.tolist() == [True, False]
+
+
+def test_rows_without_weight_are_never_changed():
+    inv = inventory([GOLD], [np.nan], [100], [150], [165])
+    _, changed, priced = compute_prices(inv, RULES)
+    assert not changed.any()
+    assert not priced.any()
+
+
+def test_min_change_pct_filters_small_moves():
+    inv = inventory([SILVER, SILVER], [3, 3], [29.9, 20], [29.9, 20], [29.9, 20])
+    _, changed, _ = compute_prices(inv, RULES, min_change_pct=5)
+    assert changed.tolist() == [False, True]
+
+
+def test_unselected_fields_and_actual_costs_are_kept():
+    inv = inventory([GOLD, GOLD], [2, 2], [111, 222], [0, 0], [0, 0], costed=[False, True])
+    new, _, _ = compute_prices(inv, RULES, fields=["unit_cost", "selling_price"])
+    assert new["unit_cost"].tolist() == [250.0, 222.0]
+    assert new["mrp"].tolist() == [0.0, 0.0]
+
+
+def test_summarize_totals_per_material():
+    inv = inventory([GOLD, SILVER, SILVER], [2, 3, np.nan], [200, 30, 50], [300, 30, 60], [330, 30, 66],
+                    stock=[2, 5, 1])
+    new, changed, priced = compute_prices(inv, RULES)
+    out = summarize(inv, new, changed, priced, {GOLD: "Gold", SILVER: "Silver"})
+    assert out["items"] == 3
+    assert out["changed"] == 1
+    assert out["skipped_no_weight"] == 1
+    assert out["stock_cost_delta"] == pytest.approx(2 * (250 - 200))
+    by_material = {m["material_id"]: m for m in out["by_material"]}
+    assert by_material[GOLD]["material_name"] == "Gold"
+    assert by_material[GOLD]["changed"] == 1
+    assert by_material[GOLD]["avg_selling_change_pct"] == 25.0
+    assert by_material[SILVER]["avg_selling_change_pct"] is None
+    assert [c["sku"] for c in out["changes"]] == ["SKU-0"]
+    assert out["changes"][0]["selling_price_after"] == 375.0
@@ -0,0 +1,61 @@
+from datetime import date
+
+from scheduler import build_plan
+
+TODAY = date(2026, 1, 5)
+PAIR = ("motif-1", "lock-1")
+
+
+def card(cid, qty, due=None, status="pending", priority="normal", artisan=None, dice=None, pair=PAIR):
+    return {"id": cid, "job_card_number": f"JC-{cid}", "status": status, "priority": priority, "due_date": due,
+            "remaining_qty": qty, "artisan_id": artisan, "dice_id": dice, "motif_id": pair[0], "locking_id": pair[1]}
+
+
+def artisan(aid, capacity=10):
+    return {"id": aid, "name": aid.title(), "daily_capacity": capacity}
+
+
+def plan(cards, artisans, dices=("d1",), **kwargs):
+    return build_plan(cards, artisans, {PAIR: list(dices)}, {d: f"D-{d}" for d in dices}, today=TODAY, **kwargs)
+
+
+def test_earliest_due_date_goes_first_to_the_first_free_artisan():
+    cards = [card("late", 10, due=date(2026, 1, 20)), card("soon", 10, due=date(2026, 1, 6))]
+    out = plan(cards, [artisan("asha"), artisan("bina", capacity=5)], dices=("d1", "d2"))
+    first, second = out["assignments"]
+    assert first["job_card_id"] == "soon"
+    assert first["start_date"] == "2026-01-05" and first["finish_date"] == "2026-01-05"
+    assert second["job_card_id"] == "late"
+    assert second["artisan_id"] != first["artisan_id"]
+    assert second["dice_id"] != first["dice_id"]
+    assert out["summary"]["late_cards"] == 0
+
+
+def test_priority_breaks_due_date_ties():
+    cards = [card("normal", 10, priority="normal"), card("urgent", 10, priority="urgent")]
+    out = plan(cards, [artisan("asha")])
+    assert [a["job_card_id"] for a in out["assignments"]] == ["urgent", "normal"]
+
+
+def test_in_progress_cards_are_existing_load():
+    cards = [card("running", 20, status="in_progress", artisan="asha", dice="d1"),
+             card("next", 10, due=date(2026, 1, 6))]
+    out = plan(cards, [artisan("asha")])
+    (a,) = out["assignments"]
+    # Two days of load first, so the card starts on day 3 and is a day late
+    assert a["start_date"] == "2026-01-07"
+    assert a["lateness_days"] == 1
+    assert out["summary"]["makespan_days"] == 3.0
+
+
+def test_cards_without_dice_or_artisan_are_unscheduled():
+    cards = [card("nodice", 5, pair=("motif-2", "lock-2")), card("ok", 5)]
+    out = plan(cards, [artisan("asha")])
+    assert out["unscheduled"] == [{"job_card_id": "nodice", "job_card_number": "JC-nodice", "reason": "no_compatible_dice"}]
+    assert plan([card("ok", 5)], [])["unscheduled"][0]["reason"] == "no_artisan_available"
+
+
+def test_keep_assigned_pins_the_artisan():
+    cards = [card("pinned", 10, artisan="bina")]
+    assert plan(cards, [artisan("asha"), artisan("bina")])["assignments"][0]["artisan_id"] == "bina"
+    assert plan(cards, [artisan("asha"), artisan("bina")], keep_assigned=False)["assignments"][0]["artisan_id"] == "asha"